@@ -1,554 +1,2141 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash
-from flask_login import LoginManager, login_user, logout_user, login_required, current_user, UserMixin
-from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
-import random
-import string
-
-# Initialize extensions
-db = SQLAlchemy()
-
-# User model
-class User(UserMixin, db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(80), unique=True, nullable=False)
-    email = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(128))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    
-    # Relationships
-    products = db.relationship('Product', backref='user', lazy=True)
-    orders = db.relationship('Order', backref='user', lazy=True)
-
-    def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
-
-    def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
-
-    def __repr__(self):
-        return f'<User {self.username}>'
-
-# Product model
-class Product(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100), nullable=False)
-    category = db.Column(db.String(50))
-    quantity = db.Column(db.Integer, nullable=False)
-    price = db.Column(db.Float, nullable=False)
-    supplier = db.Column(db.String(100))
-    description = db.Column(db.Text)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'name': self.name,
-            'category': self.category,
-            'quantity': self.quantity,
-            'price': self.price,
-            'supplier': self.supplier,
-            'description': self.description,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None
-        }
+from flask import Flask, Response, current_app, g, has_app_context, has_request_context, request, jsonify, url_for, stream_with_context
+from flask_login import LoginManager, current_user
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+from werkzeug.datastructures import MultiDict
+from datetime import datetime, timedelta, timezone
+import base64
+import csv
+import hashlib
+import io
+import json
+import math
+import os
+import re
+import secrets
+import time
+import click
+from contextlib import nullcontext
+from functools import lru_cache, wraps
+from cache import AppCache
+import catalogue
+import change_feed
+import database
+import jobs
+import migrations
+import order_numbers
+import sharding
+# forecasting, profiling, query_plans and reports are imported where they are
+# used, so processes that never need them do not pay for loading them
+from models import (db, User, Product, PRODUCT_SORT_KEYS, Order, OrderItem, InventorySummary, CategorySummary,
+                    DataVersion, Job, StockMovement, STATS_FIELDS, ProductStats, CategoryStats, AnalyticsWatermark,
+                    ProductForecast, Warehouse, StockLocation, LocationStock, StockAllocation, STOCK_ADJUSTMENT,
+                    ORDER_TRANSITIONS, ChangeLog, ChangeCompaction)
 
-# Order model
-class Order(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    order_number = db.Column(db.String(20), unique=True, nullable=False)
-    customer_name = db.Column(db.String(100), nullable=False)
-    customer_email = db.Column(db.String(120))
-    customer_phone = db.Column(db.String(20))
-    total_amount = db.Column(db.Float, default=0.0)
-    status = db.Column(db.String(20), default='pending')  # pending, completed, cancelled
-    notes = db.Column(db.Text)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    
-    # Relationship
-    items = db.relationship('OrderItem', backref='order', lazy=True, cascade='all, delete-orphan')
-
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'order_number': self.order_number,
-            'customer_name': self.customer_name,
-            'customer_email': self.customer_email,
-            'customer_phone': self.customer_phone,
-            'total_amount': self.total_amount,
-            'status': self.status,
-            'notes': self.notes,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
-            'items': [item.to_dict() for item in self.items]
-        }
+LOW_STOCK_THRESHOLD = 10
+SUMMARY_FIELDS = ('product_count', 'total_quantity', 'total_value', 'low_stock_count', 'out_of_stock_count')
 
-# OrderItem model
-class OrderItem(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
-    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
-    quantity = db.Column(db.Integer, nullable=False)
-    unit_price = db.Column(db.Float, nullable=False)
-    
-    # Relationship
-    product = db.relationship('Product', backref='order_items')
-
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'product_id': self.product_id,
-            'product_name': self.product.name if self.product else 'Unknown',
-            'quantity': self.quantity,
-            'unit_price': self.unit_price,
-            'total_price': self.quantity * self.unit_price
-        }
+def stock_snapshot(product):
+    """Capture the product fields that feed the inventory summaries"""
+    return (product.category, product.quantity, product.price)
 
-def generate_order_number():
-    """Generate a unique order number"""
-    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-    random_str = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
-    return f'ORD-{timestamp}-{random_str}'
+def _adjust_summary(model, key, deltas):
+    """Add deltas to a summary row in SQL; returns False if the row is missing"""
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if not deltas:
+        return True
+    stmt = db.update(model).filter_by(**key).values(
+        {field: getattr(model, field) + delta for field, delta in deltas.items()})
+    return db.session.execute(stmt).rowcount > 0
 
-# Flask app setup
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'your-secret-key-here-change-in-production'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///inventory.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+def record_stock_change(user_id, before, after):
+    """Apply the difference between two product snapshots to the summaries.
 
-# Initialize extensions with app
-db.init_app(app)
+    Pass None as `before` for an insert and as `after` for a delete. Runs in
+    the caller's transaction so the summaries commit with the product change.
+    """
+    record_stock_changes(user_id, [(before, after)])
 
-login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login'
-login_manager.login_message = 'Please log in to access this page.'
+def record_stock_changes(user_id, changes):
+    """Apply a batch of (before, after) snapshot pairs to the summaries.
 
-@login_manager.user_loader
-def load_user(user_id):
-    return User.query.get(int(user_id))
+    Deltas are summed in Python first, so a batch costs one UPDATE for the
+    user plus one per category it touches.
+    """
+    # Per category: [product_count, total_quantity, total_value,
+    # low_stock_count, out_of_stock_count], as in SUMMARY_FIELDS
+    category_sums = {}
+    for before, after in changes:
+        if before == after:
+            continue
+        for snapshot, sign in ((before, -1), (after, 1)):
+            if snapshot is None:
+                continue
+            category, quantity, price = snapshot
+            sums = category_sums.get(category)
+            if sums is None:
+                sums = category_sums[category] = [0, 0, 0, 0, 0]
+            sums[0] += sign
+            sums[1] += sign * quantity
+            sums[2] += sign * quantity * price
+            if quantity == 0:
+                sums[4] += sign
+            elif 0 < quantity < LOW_STOCK_THRESHOLD:
+                sums[3] += sign
+    category_deltas = {category: dict(zip(SUMMARY_FIELDS, sums)) for category, sums in category_sums.items()}
+    totals = {field: sum(deltas[field] for deltas in category_deltas.values()) for field in SUMMARY_FIELDS}
 
-def create_test_user():
-    """Create a test user if none exists"""
-    with app.app_context():
-        if User.query.count() == 0:
-            test_user = User(username='admin', email='admin@example.com')
-            test_user.set_password('admin123')
-            db.session.add(test_user)
-            db.session.commit()
-            print("Test user created: admin / admin123")
-
-# Routes
-@app.route('/')
-def index():
-    if current_user.is_authenticated:
-        return redirect(url_for('dashboard'))
-    return redirect(url_for('login'))
+    if not _adjust_summary(InventorySummary, {'user_id': user_id}, totals):
+        # No summary yet (e.g. data predating the summaries); the rebuild
+        # sees the flushed change, so there is nothing left to apply
+        rebuild_summaries(user_id)
+        return
 
-@app.route('/login', methods=['GET', 'POST'])
-def login():
-    if current_user.is_authenticated:
-        return redirect(url_for('dashboard'))
-        
-    if request.method == 'POST':
-        username = request.form.get('username')
-        password = request.form.get('password')
-        
-        # Debug print to see what's being submitted
-        print(f"Login attempt - Username: {username}")
-        
-        user = User.query.filter_by(username=username).first()
-        
-        if user:
-            print(f"User found: {user.username}")
-            print(f"Password check: {user.check_password(password)}")
-        else:
-            print("User not found")
-        
-        if user and user.check_password(password):
-            login_user(user)
-            print(f"Login successful for user: {username}")
-            next_page = request.args.get('next')
-            return redirect(next_page or url_for('dashboard'))
-        else:
-            print("Login failed - invalid credentials")
-            flash('Invalid username or password', 'error')
-    
-    return render_template('login.html')
+    for category, deltas in category_deltas.items():
+        key = {'user_id': user_id, 'category': category}
+        if not _adjust_summary(CategorySummary, key, deltas):
+            db.session.add(CategorySummary(**key, **deltas))
 
-@app.route('/register', methods=['GET', 'POST'])
-def register():
-    if current_user.is_authenticated:
-        return redirect(url_for('dashboard'))
-        
-    if request.method == 'POST':
-        username = request.form.get('username')
-        email = request.form.get('email')
-        password = request.form.get('password')
-        confirm_password = request.form.get('confirm_password')
-        
-        if password != confirm_password:
-            flash('Passwords do not match', 'error')
-            return render_template('register.html')
-        
-        if User.query.filter_by(username=username).first():
-            flash('Username already exists', 'error')
-            return render_template('register.html')
-        
-        if User.query.filter_by(email=email).first():
-            flash('Email already exists', 'error')
-            return render_template('register.html')
-        
-        user = User(username=username, email=email)
-        user.set_password(password)
-        db.session.add(user)
+def rebuild_summaries(user_id=None):
+    """Recompute inventory summaries from the product table.
+
+    Rebuilds a single user when `user_id` is given, otherwise every user.
+    The caller is responsible for committing.
+    """
+    quantity = Product.quantity
+    low_stock = db.case(((quantity > 0) & (quantity < LOW_STOCK_THRESHOLD), 1), else_=0)
+    out_of_stock = db.case((quantity == 0, 1), else_=0)
+    query = db.session.query(
+        Product.user_id,
+        Product.category,
+        db.func.count(Product.id),
+        db.func.coalesce(db.func.sum(quantity), 0),
+        db.func.coalesce(db.func.sum(quantity * Product.price), 0.0),
+        db.func.coalesce(db.func.sum(low_stock), 0),
+        db.func.coalesce(db.func.sum(out_of_stock), 0)
+    ).group_by(Product.user_id, Product.category)
+
+    user_ids = [user_id] if user_id is not None else [u.id for u in User.query.all()]
+    if user_id is not None:
+        query = query.filter(Product.user_id == user_id)
+    rows = query.all()
+
+    db.session.execute(db.delete(CategorySummary).where(CategorySummary.user_id.in_(user_ids)))
+    db.session.execute(db.delete(InventorySummary).where(InventorySummary.user_id.in_(user_ids)))
+
+    totals = {uid: InventorySummary(user_id=uid, **dict.fromkeys(SUMMARY_FIELDS, 0)) for uid in user_ids}
+    for row_user_id, category, *values in rows:
+        values = dict(zip(SUMMARY_FIELDS, values))
+        db.session.add(CategorySummary(user_id=row_user_id, category=category, **values))
+        summary = totals.setdefault(row_user_id, InventorySummary(user_id=row_user_id, **dict.fromkeys(SUMMARY_FIELDS, 0)))
+        for field, value in values.items():
+            setattr(summary, field, getattr(summary, field) + value)
+    db.session.add_all(totals.values())
+    db.session.flush()
+
+def bump_data_version(user_id):
+    """Mark the user's data as changed, in the caller's transaction"""
+    stmt = db.update(DataVersion).filter_by(user_id=user_id).values(version=DataVersion.version + 1)
+    if db.session.execute(stmt).rowcount == 0:
+        db.session.add(DataVersion(user_id=user_id, version=1))
+
+def get_data_version(user_id):
+    """Return the user's current data version (0 before any change)"""
+    return db.session.query(DataVersion.version).filter_by(user_id=user_id).scalar() or 0
+
+def ensure_summaries(user_id):
+    """Build the user's summaries if they do not exist yet.
+
+    Set-based stock updates must call this before touching product rows:
+    their changes are recorded afterwards, and a rebuild at that point would
+    already include them.
+    """
+    summary = db.session.get(InventorySummary, user_id)
+    if summary is None:
+        rebuild_summaries(user_id)
+        summary = db.session.get(InventorySummary, user_id)
+    return summary
+
+def get_inventory_summary(user_id):
+    """Return the user's inventory summary, building it on first access"""
+    if db.session.get(InventorySummary, user_id) is None:
+        ensure_summaries(user_id)
         db.session.commit()
-        
-        flash('Registration successful! Please log in.', 'success')
-        return redirect(url_for('login'))
-    
-    return render_template('register.html')
-
-@app.route('/logout')
-@login_required
-def logout():
-    logout_user()
-    flash('You have been logged out successfully.', 'success')
-    return redirect(url_for('login'))
-
-@app.route('/dashboard')
-@login_required
-def dashboard():
+    return db.session.get(InventorySummary, user_id)
+
+def get_category_summaries(user_id):
+    """Return the user's non-empty category breakdown keyed by category"""
+    rows = CategorySummary.query.filter(
+        CategorySummary.user_id == user_id,
+        CategorySummary.product_count > 0
+    ).all()
+    return {row.category: row.to_dict() for row in rows}
+
+PRODUCT_PAGE_SIZE = 50
+MAX_PRODUCT_PAGE_SIZE = 200
+
+def encode_cursor(sort, direction, sort_value, last_id):
+    """Encode the position after the last row of a page as an opaque token"""
+    payload = json.dumps([sort, direction, sort_value, last_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor, sort, direction):
+    """Decode a cursor token, checking it belongs to the requested ordering"""
     try:
-        # Get products for current user
-        products = Product.query.filter_by(user_id=current_user.id).all()
-        total_products = len(products)
-        
-        # Calculate stock status
-        low_stock = len([p for p in products if p.quantity < 10 and p.quantity > 0])
-        out_of_stock = len([p for p in products if p.quantity == 0])
-        
-        # Order statistics
-        total_orders = Order.query.filter_by(user_id=current_user.id).count()
-        
-        # Get recent products
-        recent_products = Product.query.filter_by(user_id=current_user.id).order_by(Product.created_at.desc()).limit(5).all()
-        
-        # Get low stock products for alert
-        low_stock_products = Product.query.filter(
-            Product.user_id == current_user.id, 
-            Product.quantity < 10,
-            Product.quantity > 0
-        ).order_by(Product.quantity.asc()).limit(6).all()
-        
-        return render_template('dashboard.html', 
-                             total_products=total_products, 
-                             low_stock=low_stock,
-                             out_of_stock=out_of_stock,
-                             total_orders=total_orders,
-                             recent_products=recent_products,
-                             low_stock_products=low_stock_products)
-    except Exception as e:
-        print(f"Error in dashboard route: {e}")
-        flash('Error loading dashboard', 'error')
-        return render_template('dashboard.html', 
-                             total_products=0, 
-                             low_stock=0,
-                             out_of_stock=0,
-                             total_orders=0,
-                             recent_products=[],
-                             low_stock_products=[])
-
-@app.route('/add_product', methods=['GET', 'POST'])
-@login_required
-def add_product():
-    if request.method == 'POST':
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_sort, cursor_direction, sort_value, last_id = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    if (cursor_sort, cursor_direction) != (sort, direction) or not isinstance(last_id, int):
+        raise ValueError('Cursor does not match the requested sort order')
+    return sort_value, last_id
+
+def filter_products(query, user_id, args):
+    """Restrict a Product query to the user's products matching the listing filters in args"""
+    query = query.filter(Product.user_id == user_id)
+    category = args.get('category')
+    if category and category != 'all':
+        query = query.filter(PRODUCT_SORT_KEYS['category'] == category.lower())
+
+    stock_status = args.get('stock_status')
+    if stock_status == 'in-stock':
+        query = query.filter(Product.quantity >= LOW_STOCK_THRESHOLD)
+    elif stock_status == 'low-stock':
+        query = query.filter(Product.quantity > 0, Product.quantity < LOW_STOCK_THRESHOLD)
+    elif stock_status == 'out-of-stock':
+        query = query.filter(Product.quantity == 0)
+    elif stock_status not in (None, '', 'all'):
+        raise ValueError('Unknown stock status')
+
+    min_price = args.get('min_price', type=float)
+    if min_price is not None:
+        query = query.filter(Product.price >= min_price)
+    max_price = args.get('max_price', type=float)
+    if max_price is not None:
+        query = query.filter(Product.price <= max_price)
+
+    supplier = args.get('supplier')
+    if supplier:
+        query = query.filter(PRODUCT_SORT_KEYS['supplier'] == supplier.lower())
+
+    search = args.get('q')
+    if search:
+        if has_search_index():
+            if fts_query(search):
+                query = query.filter(Product.id.in_(
+                    db.select(PRODUCT_SEARCH.c.rowid).where(search_match(search, user_id))))
+        else:
+            pattern = f'%{search}%'
+            query = query.filter(db.or_(
+                Product.name.ilike(pattern),
+                Product.description.ilike(pattern),
+                Product.supplier.ilike(pattern)
+            ))
+    return query
+
+# FTS5 index over product name, description and supplier (migration 0009)
+PRODUCT_SEARCH = db.table('product_search', db.column('rowid', db.Integer))
+# bm25 weights for the name, description, supplier and owner columns
+SEARCH_WEIGHTS = (10.0, 1.0, 3.0, 0.0)
+SEARCH_PAGE_SIZE = 20
+_SEARCH_WORD = re.compile(r'\w+')
+
+def has_search_index():
+    """Whether product text can be searched through the FTS5 index"""
+    return _search_index_exists(str(db.session.get_bind(Product).url))
+
+@lru_cache(maxsize=None)
+def _search_index_exists(url):
+    # Keyed by URL: with tenant sharding, products live in the user's shard
+    engine = db.session.get_bind(Product)
+    return engine.dialect.name == 'sqlite' and db.inspect(engine).has_table('product_search')
+
+def fts_query(text):
+    """Turn free text into an FTS5 query in which every word must match as a prefix"""
+    return ' '.join(f'"{word}"*' for word in _SEARCH_WORD.findall(text))
+
+def search_match(text, user_id):
+    """MATCH condition for the words in text within one user's products.
+
+    The owner token narrows the index walk to that user's matches, and the
+    column filter keeps the words themselves off the owner column.
+    """
+    expression = f'owner:u{int(user_id)} AND {{name description supplier}}: ({fts_query(text)})'
+    return db.literal_column('product_search').op('MATCH')(expression)
+
+def search_products(user_id, args):
+    """Return one page of the user's products best matching args['q'] and the next cursor.
+
+    Matches are ranked by bm25, with hits in the name counting most, and
+    the listing filters (category, stock status, price, supplier) apply
+    too. Without the FTS5 index the search falls back to LIKE in id order.
+    """
+    text = args.get('q', '')
+    if not fts_query(text):
+        raise ValueError('q must contain at least one word')
+    limit = min(max(args.get('limit', SEARCH_PAGE_SIZE, type=int), 1), MAX_PRODUCT_PAGE_SIZE)
+
+    filters = MultiDict(args)
+    if has_search_index():
+        filters.pop('q')
+        rank = db.func.bm25(db.literal_column('product_search'), *SEARCH_WEIGHTS)
+        query = (db.session.query(Product, rank)
+                 .join(PRODUCT_SEARCH, PRODUCT_SEARCH.c.rowid == Product.id)
+                 .filter(search_match(text, user_id)))
+    else:
+        rank = db.literal(0.0)
+        query = db.session.query(Product, rank)
+    query = filter_products(query, user_id, filters)
+
+    cursor = args.get('cursor')
+    if cursor:
+        last_rank, last_id = decode_cursor(cursor, 'rank', 'asc')
+        query = query.filter(db.tuple_(rank, Product.id) > (last_rank, last_id))
+
+    rows = query.order_by(rank, Product.id).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last_product, last_rank = rows[-1]
+        next_cursor = encode_cursor('rank', 'asc', last_rank, last_product.id)
+    return [product for product, _ in rows], next_cursor
+
+def product_listing_query(user_id, args):
+    """Build the filtered, ordered product listing query from request args.
+
+    Returns (query, sort, direction); the query yields (product, sort value)
+    rows starting after the position in the optional cursor.
+    """
+    sort = args.get('sort', 'name')
+    direction = args.get('direction', 'asc')
+    if sort not in PRODUCT_SORT_KEYS:
+        raise ValueError('Unknown sort key')
+    if direction not in ('asc', 'desc'):
+        raise ValueError('Direction must be asc or desc')
+
+    sort_key = PRODUCT_SORT_KEYS[sort]
+    query = filter_products(db.session.query(Product, sort_key), user_id, args)
+
+    cursor = args.get('cursor')
+    if cursor:
+        sort_value, last_id = decode_cursor(cursor, sort, direction)
+        position = db.tuple_(sort_key, Product.id)
+        query = query.filter(position > (sort_value, last_id) if direction == 'asc'
+                             else position < (sort_value, last_id))
+
+    if direction == 'asc':
+        query = query.order_by(sort_key.asc(), Product.id.asc())
+    else:
+        query = query.order_by(sort_key.desc(), Product.id.desc())
+    return query, sort, direction
+
+def paginate_products(user_id, args):
+    """Return one keyset page of the user's products and the next cursor"""
+    limit = min(max(args.get('limit', PRODUCT_PAGE_SIZE, type=int), 1), MAX_PRODUCT_PAGE_SIZE)
+    query, sort, direction = product_listing_query(user_id, args)
+
+    # Fetch one extra row to learn whether another page exists
+    rows = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last_product, last_value = rows[-1]
+        next_cursor = encode_cursor(sort, direction, last_value, last_product.id)
+    return [product for product, _ in rows], next_cursor
+
+ORDER_PAGE_SIZE = 25
+MAX_ORDER_PAGE_SIZE = 200
+
+def parse_date(value, field):
+    """Parse a YYYY-MM-DD request arg, returning None when it is empty"""
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        raise ValueError(f'{field} must be a date in YYYY-MM-DD format')
+
+def order_listing_query(user_id, args):
+    """Build the newest-first order listing query from request args.
+
+    Items and their products are loaded with two extra IN queries per batch
+    of orders, so serialization never lazy-loads per item.
+    """
+    query = Order.query.filter(Order.user_id == user_id).options(
+        db.selectinload(Order.items).selectinload(OrderItem.product))
+
+    start_date = parse_date(args.get('start_date'), 'start_date')
+    if start_date:
+        query = query.filter(Order.created_at >= start_date)
+    end_date = parse_date(args.get('end_date'), 'end_date')
+    if end_date:
+        # The end date is inclusive of the whole day
+        query = query.filter(Order.created_at < end_date + timedelta(days=1))
+
+    cursor = args.get('cursor')
+    if cursor:
+        created_at, last_id = decode_cursor(cursor, 'created_at', 'desc')
         try:
-            name = request.form.get('name')
-            category = request.form.get('category')
-            quantity = int(request.form.get('quantity'))
-            price = float(request.form.get('price'))
-            supplier = request.form.get('supplier')
-            description = request.form.get('description')
-            
-            product = Product(
-                name=name,
-                category=category,
-                quantity=quantity,
-                price=price,
-                supplier=supplier,
-                description=description,
-                user_id=current_user.id
-            )
-            
-            db.session.add(product)
-            db.session.commit()
-            
-            flash('Product added successfully!', 'success')
-            return redirect(url_for('inventory'))
-        except ValueError:
-            flash('Please enter valid numeric values for quantity and price.', 'error')
-        except Exception as e:
-            flash('An error occurred while adding the product.', 'error')
-    
-    return render_template('add_product.html')
-
-@app.route('/inventory')
-@login_required
-def inventory():
-    products = Product.query.filter_by(user_id=current_user.id).all()
-    # Get unique categories for the filter dropdown
-    categories = list(set(product.category for product in products if product.category))
-    categories.sort()
-    
-    return render_template('inventory.html', products=products, categories=categories)
-
-@app.route('/api/products')
-@login_required
-def api_products():
-    products = Product.query.filter_by(user_id=current_user.id).all()
-    return jsonify([product.to_dict() for product in products])
-
-@app.route('/edit_product/<int:product_id>', methods=['GET', 'POST'])
-@login_required
-def edit_product(product_id):
-    product = Product.query.filter_by(id=product_id, user_id=current_user.id).first_or_404()
-    
-    if request.method == 'POST':
+            created_at = datetime.fromisoformat(created_at)
+        except (TypeError, ValueError):
+            raise ValueError('Invalid cursor')
+        query = query.filter(db.tuple_(Order.created_at, Order.id) < (created_at, last_id))
+    return query.order_by(Order.created_at.desc(), Order.id.desc())
+
+def paginate_orders(user_id, args, page_size=ORDER_PAGE_SIZE):
+    """Return one newest-first keyset page of orders and the next cursor.
+
+    Serializing the page costs three statements however many rows it has.
+    """
+    limit = min(max(args.get('limit', page_size, type=int), 1), MAX_ORDER_PAGE_SIZE)
+    orders = order_listing_query(user_id, args).limit(limit + 1).all()
+    next_cursor = None
+    if len(orders) > limit:
+        orders = orders[:limit]
+        last = orders[-1]
+        next_cursor = encode_cursor('created_at', 'desc', last.created_at.isoformat(), last.id)
+    return orders, next_cursor
+
+def parse_order_lines(product_ids, quantities):
+    """Collect the requested quantity per product from the order form.
+
+    Blank rows are skipped and repeated products are merged; a quantity
+    below one is reported as an error for its line. Returns (lines,
+    errors) where lines maps product id to quantity.
+    """
+    lines = {}
+    errors = []
+    for product_id, quantity in zip(product_ids, quantities):
+        if not product_id or not quantity:
+            continue
         try:
-            product.name = request.form.get('name')
-            product.category = request.form.get('category')
-            product.quantity = int(request.form.get('quantity'))
-            product.price = float(request.form.get('price'))
-            product.supplier = request.form.get('supplier')
-            product.description = request.form.get('description')
-            product.updated_at = datetime.utcnow()
-            
-            db.session.commit()
-            flash('Product updated successfully!', 'success')
-            return redirect(url_for('inventory'))
+            product_id = int(product_id)
+            quantity = int(quantity)
         except ValueError:
-            flash('Please enter valid numeric values for quantity and price.', 'error')
-        except Exception as e:
-            flash('An error occurred while updating the product.', 'error')
-    
-    return render_template('edit_product.html', product=product)
-
-@app.route('/delete_product/<int:product_id>', methods=['POST'])
-@login_required
-def delete_product(product_id):
-    product = Product.query.filter_by(id=product_id, user_id=current_user.id).first_or_404()
-    
+            errors.append(f'Invalid product or quantity: {product_id} x {quantity}.')
+            continue
+        if quantity <= 0:
+            errors.append(f'Product #{product_id}: quantity must be positive ({quantity} requested).')
+            continue
+        lines[product_id] = lines.get(product_id, 0) + quantity
+    return lines, errors
+
+def reserve_stock(user_id, lines):
+    """Take stock for a set of order lines with one guarded UPDATE.
+
+    Products are loaded in a single query, then decremented by one UPDATE
+    whose WHERE clause re-checks every quantity, so concurrent orders can
+    never oversell. Returns (reserved, errors): reserved is a list of
+    (product, quantity) pairs and errors has a message for each line that
+    could not be filled. When errors is non-empty the caller must roll back.
+    """
+    products = {
+        product.id: product
+        for product in Product.query.filter(Product.user_id == user_id, Product.id.in_(lines)).all()
+    }
+    errors = []
+    for product_id, quantity in lines.items():
+        product = products.get(product_id)
+        if product is None:
+            errors.append(f'Product #{product_id} was not found.')
+        elif quantity > product.quantity:
+            errors.append(f'Only {product.quantity} of {product.name} in stock ({quantity} requested).')
+    if errors:
+        return [], errors
+
+    ensure_summaries(user_id)
+    now = datetime.utcnow()
+    requested = db.case(lines, value=Product.id)
+    stmt = (db.update(Product)
+            .where(Product.user_id == user_id, Product.id.in_(lines), Product.quantity >= requested)
+            .values(quantity=Product.quantity - requested, updated_at=now)
+            .returning(Product.id, Product.quantity)
+            .execution_options(synchronize_session=False))
+    remaining = dict(db.session.execute(stmt).all())
+
+    reserved = []
+    for product_id, quantity in lines.items():
+        product = products[product_id]
+        if product_id not in remaining:
+            # Another order took the stock between our read and the update
+            errors.append(f'{product.name} no longer has {quantity} in stock.')
+            continue
+        before = (product.category, remaining[product_id] + quantity, product.price)
+        set_committed_value(product, 'quantity', remaining[product_id])
+        set_committed_value(product, 'updated_at', now)
+        record_stock_change(user_id, before, stock_snapshot(product))
+        reserved.append((product, quantity))
+    log_changes(user_id, 'product', 'update', {product.id: product.to_dict() for product, _ in reserved},
+                {product.id: {'quantity': product.quantity + quantity} for product, quantity in reserved})
+    return reserved, errors
+
+def restore_stock(user_id, quantities, source=None):
+    """Put back {product_id: quantity} with one grouped UPDATE.
+
+    The quantities are written into the UPDATE as a CASE. When source is
+    given, a select of (product_id, quantity) rows with the same totals,
+    the UPDATE joins it instead, so restocking thousands of products does
+    not need thousands of parameters.
+
+    Products that no longer exist are skipped. Products already loaded in
+    the session get the new quantity without being re-read. Returns the
+    category of each product that was restocked.
+    """
+    if not quantities:
+        return {}
+    ensure_summaries(user_id)
+    now = datetime.utcnow()
+    if source is None:
+        returned = db.case(quantities, value=Product.id)
+        stmt = db.update(Product).where(Product.user_id == user_id, Product.id.in_(quantities))
+    else:
+        source = source.subquery()
+        returned = source.c.quantity
+        stmt = db.update(Product).where(Product.user_id == user_id, Product.id == source.c.product_id)
+    stmt = (stmt
+            .values(quantity=Product.quantity + returned, updated_at=now)
+            .returning(*PRODUCT_IMAGE_COLUMNS)
+            .execution_options(synchronize_session=False))
+    changes = []
+    categories = {}
+    images = {}
+    for row in db.session.execute(stmt).all():
+        changes.append(((row.category, row.quantity - quantities[row.id], row.price),
+                        (row.category, row.quantity, row.price)))
+        categories[row.id] = row.category
+        images[row.id] = _image(row)
+        product = db.session.identity_map.get(db.inspect(Product).identity_key_from_primary_key((row.id,)))
+        if product is not None:
+            set_committed_value(product, 'quantity', row.quantity)
+            set_committed_value(product, 'updated_at', now)
+    record_stock_changes(user_id, changes)
+    log_changes(user_id, 'product', 'update', images,
+                {product_id: {'quantity': image['quantity'] - quantities[product_id]}
+                 for product_id, image in images.items()})
+    return categories
+
+LOCATION_BATCH_SIZE = 500
+
+# Order in which each allocation strategy visits a product's locations. The
+# entries are (LocationStock, warehouse priority, pick sequence) triples
+ALLOCATION_STRATEGIES = {
+    # A fixed pick path: warehouse priority, then the location's pick sequence
+    'priority': lambda entry: (entry[1], entry[2], entry[0].location_id),
+    # Fewest picks: the fullest locations first
+    'largest_first': lambda entry: (-entry[0].quantity, entry[1], entry[0].location_id),
+    # Empty part-used locations first to free up space
+    'smallest_first': lambda entry: (entry[0].quantity, entry[1], entry[0].location_id),
+}
+
+# The same orders as ORDER BY clauses, for sync_location_stock()
+ALLOCATION_ORDERS = {
+    'priority': (Warehouse.priority, StockLocation.pick_sequence, LocationStock.location_id),
+    'largest_first': (LocationStock.quantity.desc(), Warehouse.priority, LocationStock.location_id),
+    'smallest_first': (LocationStock.quantity, Warehouse.priority, LocationStock.location_id),
+}
+
+def default_location(user_id):
+    """The user's default stock location, created with a MAIN warehouse on first use"""
+    location = StockLocation.query.filter_by(user_id=user_id, is_default=True).first()
+    if location is None:
+        warehouse = Warehouse.query.filter_by(user_id=user_id, code='MAIN').first()
+        if warehouse is None:
+            warehouse = Warehouse(user_id=user_id, code='MAIN', name='Main warehouse')
+            db.session.add(warehouse)
+            db.session.flush()
+        location = StockLocation(user_id=user_id, warehouse_id=warehouse.id, code='DEFAULT', is_default=True)
+        db.session.add(location)
+        db.session.flush()
+    return location
+
+def location_stock_entries(product_ids):
+    """Load where some products are stocked, as {product_id: [(stock, priority, pick_sequence)]}"""
+    entries = {}
+    rows = (db.session.query(LocationStock, Warehouse.priority, StockLocation.pick_sequence)
+            .join(StockLocation, StockLocation.id == LocationStock.location_id)
+            .join(Warehouse, Warehouse.id == LocationStock.warehouse_id)
+            .filter(LocationStock.product_id.in_(product_ids)))
+    for stock, priority, pick_sequence in rows:
+        entries.setdefault(stock.product_id, []).append((stock, priority, pick_sequence))
+    return entries
+
+def take_from_locations(entries, quantity, strategy=None):
+    """Remove quantity from a product's locations in allocation strategy order.
+
+    Returns the (location_id, quantity) pairs taken, which add up to less
+    than quantity only if the locations do not hold enough.
+    """
+    key = ALLOCATION_STRATEGIES[strategy or current_app.config['STOCK_ALLOCATION_STRATEGY']]
+    taken = []
+    for stock, _, _ in sorted(entries, key=key):
+        if quantity <= 0:
+            break
+        amount = min(stock.quantity, quantity)
+        if amount > 0:
+            stock.quantity -= amount
+            quantity -= amount
+            taken.append((stock.location_id, amount))
+    return taken
+
+def put_in_location(entries, product_id, location, quantity):
+    """Add quantity of a product to a location, creating its row if needed"""
+    for stock, _, _ in entries:
+        if stock.location_id == location.id:
+            stock.quantity += quantity
+            return stock
+    stock = LocationStock(location_id=location.id, warehouse_id=location.warehouse_id,
+                          product_id=product_id, quantity=quantity)
+    db.session.add(stock)
+    entries.append((stock, location.warehouse.priority, location.pick_sequence))
+    return stock
+
+def _refresh_location_stock(rows):
+    # Give rows already loaded in the session the quantities just written
+    loaded = {stock.id: stock for stock in db.session.identity_map.values() if isinstance(stock, LocationStock)}
+    for stock_id, quantity in rows:
+        if stock_id in loaded:
+            set_committed_value(loaded[stock_id], 'quantity', quantity)
+
+def sync_location_stock(user_id, product_ids, strategy=None):
+    """Make the locations of some products add up to Product.quantity again.
+
+    For writes that change a product's total without naming a location:
+    stock added goes to the user's default location, and stock removed is
+    taken from its locations by the allocation strategy. Runs in the
+    caller's transaction.
+
+    Each batch is set-based: one UPDATE takes the excess from the
+    locations, using running totals in strategy order, then one UPDATE
+    and one INSERT ... SELECT put any shortfall in the default location.
+    product_ids may also be a select of ids, e.g. from a scratch table;
+    the statements then cover them all in one pass instead of in batches.
+    """
+    order = ALLOCATION_ORDERS[strategy or current_app.config['STOCK_ALLOCATION_STRATEGY']]
+    if isinstance(product_ids, db.Select):
+        batches = [product_ids]
+    else:
+        product_ids = sorted(set(product_ids))
+        batches = [product_ids[start:start + LOCATION_BATCH_SIZE]
+                   for start in range(0, len(product_ids), LOCATION_BATCH_SIZE)]
+    location = None
+    now = datetime.utcnow()
+    stock = LocationStock
+    counted = db.aliased(LocationStock)
+    located = (db.select(db.func.coalesce(db.func.sum(counted.quantity), 0))
+               .where(counted.product_id == Product.id).correlate(Product).scalar_subquery())
+    for batch in batches:
+        # Per location: the product's stock ahead of it in strategy order,
+        # and how much the product's locations hold over its total
+        ranked = (db.select(stock.id, stock.quantity,
+                            (db.func.sum(stock.quantity).over(partition_by=stock.product_id, order_by=order,
+                                                              rows=(None, 0)) - stock.quantity).label('ahead'),
+                            (db.func.sum(stock.quantity).over(partition_by=stock.product_id)
+                             - Product.quantity).label('excess'))
+                  .join(StockLocation, StockLocation.id == stock.location_id)
+                  .join(Warehouse, Warehouse.id == stock.warehouse_id)
+                  .join(Product, Product.id == stock.product_id)
+                  .where(Product.user_id == user_id, stock.product_id.in_(batch))
+                  .subquery())
+        wanted = ranked.c.excess - ranked.c.ahead
+        taken = db.case((wanted < ranked.c.quantity, wanted), else_=ranked.c.quantity)
+        _refresh_location_stock(db.session.execute(
+            db.update(stock)
+            .where(stock.id == ranked.c.id, ranked.c.quantity > 0, wanted > 0)
+            .values(quantity=stock.quantity - taken, updated_at=now)
+            .returning(stock.id, stock.quantity)
+            .execution_options(synchronize_session=False)))
+
+        missing = Product.quantity - located
+        short = (db.select(Product.id.label('product_id'), missing.label('quantity'))
+                 .where(Product.user_id == user_id, Product.id.in_(batch), missing > 0))
+        if db.session.execute(short.limit(1)).first() is None:
+            continue
+        location = location or default_location(user_id)
+        shortfall = short.subquery()
+        _refresh_location_stock(db.session.execute(
+            db.update(stock)
+            .where(stock.location_id == location.id, stock.product_id == shortfall.c.product_id)
+            .values(quantity=stock.quantity + shortfall.c.quantity, updated_at=now)
+            .returning(stock.id, stock.quantity)
+            .execution_options(synchronize_session=False)))
+        # Only products without a row in the default location are still short
+        db.session.execute(db.insert(stock).from_select(
+            ['location_id', 'warehouse_id', 'product_id', 'quantity', 'updated_at'],
+            db.select(db.literal(location.id), db.literal(location.warehouse_id), shortfall.c.product_id,
+                      shortfall.c.quantity, db.literal(now))))
+
+def allocate_stock(user_id, order, reserved):
+    """Pick the stock reserved for an order from locations and record where it came from.
+
+    reserved is reserve_stock()'s list of (product, quantity) pairs, whose
+    totals were already decremented, so the locations are known to hold
+    enough. Returns the allocation rows written.
+    """
+    entries = location_stock_entries([product.id for product, _ in reserved])
+    location = None
+    allocations = []
+    for product, quantity in reserved:
+        product_entries = entries.setdefault(product.id, [])
+        # Stock written to the total without a location goes to the default one first
+        missing = product.quantity + quantity - sum(stock.quantity for stock, _, _ in product_entries)
+        if missing > 0:
+            location = location or default_location(user_id)
+            put_in_location(product_entries, product.id, location, missing)
+        allocations.extend({'order_id': order.id, 'product_id': product.id, 'location_id': location_id,
+                            'quantity': taken}
+                           for location_id, taken in take_from_locations(product_entries, quantity))
+    if allocations:
+        db.session.execute(db.insert(StockAllocation), allocations)
+    return allocations
+
+def release_allocations(user_id, order_ids, product_ids):
+    """Put stock taken by some orders back in the locations it came from.
+
+    Call after restore_stock() has added it back to the totals, with the
+    product ids it restocked. Stock allocated before locations existed, or
+    from a location since removed, goes back to the default location.
+    """
+    product_ids = sorted(set(product_ids))
+    locations = {}
+    for start in range(0, len(product_ids), LOCATION_BATCH_SIZE):
+        batch = product_ids[start:start + LOCATION_BATCH_SIZE]
+        allocations = StockAllocation.query.filter(StockAllocation.order_id.in_(order_ids),
+                                                   StockAllocation.product_id.in_(batch)).all()
+        if not allocations:
+            continue
+        missing = {allocation.location_id for allocation in allocations} - set(locations)
+        if missing:
+            locations.update((location.id, location) for location in StockLocation.query.filter(
+                StockLocation.user_id == user_id, StockLocation.id.in_(missing)))
+        entries = location_stock_entries(batch)
+        for allocation in allocations:
+            location = locations.get(allocation.location_id)
+            if location is not None:
+                put_in_location(entries.setdefault(allocation.product_id, []), allocation.product_id,
+                                location, allocation.quantity)
+    db.session.execute(db.delete(StockAllocation).where(StockAllocation.order_id.in_(order_ids))
+                       .execution_options(synchronize_session=False))
+    sync_location_stock(user_id, product_ids)
+
+def stock_movement(kind, product_id, category, quantity_change, unit_price=None, order_id=None):
+    """Build one stock ledger row for log_movements()"""
+    return {'kind': kind, 'product_id': product_id, 'category': category,
+            'quantity_change': quantity_change, 'unit_price': unit_price, 'order_id': order_id}
+
+def log_movements(user_id, movements):
+    """Append rows to the stock ledger in the caller's transaction"""
+    now = datetime.utcnow()
+    rows = [dict(movement, user_id=user_id, day=now.date(), created_at=now)
+            for movement in movements if movement['quantity_change']]
+    if rows:
+        db.session.execute(db.insert(StockMovement), rows)
+
+CHANGE_BATCH_SIZE = 1000
+PRODUCT_IMAGE_COLUMNS = (Product.id, Product.name, Product.category, Product.quantity, Product.price,
+                         Product.supplier, Product.description, Product.created_at, Product.updated_at)
+ORDER_IMAGE_COLUMNS = (Order.id, Order.order_number, Order.customer_name, Order.customer_email,
+                       Order.customer_phone, Order.total_amount, Order.status, Order.notes, Order.created_at,
+                       Order.updated_at)
+
+def _image(row):
+    # A row of *_IMAGE_COLUMNS as its model's to_dict() shows it
+    return {key: value.isoformat() if isinstance(value, datetime) else value for key, value in zip(row._fields, row)}
+
+def product_images(user_id, product_ids):
+    """{id: product as to_dict() shows it} for some of the user's products"""
+    product_ids = list(product_ids)
+    images = {}
+    for start in range(0, len(product_ids), CHANGE_BATCH_SIZE):
+        rows = db.session.execute(db.select(*PRODUCT_IMAGE_COLUMNS).where(
+            Product.user_id == user_id, Product.id.in_(product_ids[start:start + CHANGE_BATCH_SIZE])))
+        images.update((row.id, _image(row)) for row in rows)
+    return images
+
+def order_images(user_id, order_ids):
+    """{id: order with its items as to_dict() shows it} for some of the user's orders"""
+    order_ids = list(order_ids)
+    images = {}
+    for start in range(0, len(order_ids), CHANGE_BATCH_SIZE):
+        batch = order_ids[start:start + CHANGE_BATCH_SIZE]
+        rows = db.session.execute(db.select(*ORDER_IMAGE_COLUMNS).where(Order.user_id == user_id,
+                                                                         Order.id.in_(batch)))
+        images.update((row.id, dict(_image(row), items=[])) for row in rows)
+        items = (db.select(OrderItem.order_id, OrderItem.id, OrderItem.product_id, Product.name,
+                           OrderItem.quantity, OrderItem.unit_price)
+                 .outerjoin(Product, Product.id == OrderItem.product_id)
+                 .where(OrderItem.order_id.in_(batch))
+                 .order_by(OrderItem.id))
+        for order_id, item_id, product_id, name, quantity, unit_price in db.session.execute(items):
+            if order_id in images:
+                images[order_id]['items'].append({
+                    'id': item_id, 'product_id': product_id,
+                    'product_name': name if name is not None else 'Unknown',
+                    'quantity': quantity, 'unit_price': unit_price, 'total_price': quantity * unit_price
+                })
+    return images
+
+def changed_fields(before, after):
+    """The old values of the fields that differ between two images of a row"""
+    return {key: value for key, value in before.items() if key != 'updated_at' and after.get(key) != value}
+
+def change_source():
+    """(actor_id, origin) of the change being made: the user and the endpoint, job or command"""
+    job = jobs.current_job.get()
+    if job is not None:
+        return job.user_id, f'job:{job.kind}'
+    if has_request_context():
+        return (current_user.id if current_user.is_authenticated else None), request.endpoint
+    command = click.get_current_context(silent=True)
+    return None, f'cli:{command.info_name}' if command is not None else None
+
+def log_changes(user_id, entity, action, images, previous=None):
+    """Append a change log entry per product or order in the caller's transaction.
+
+    images maps ids to the rows after the change, from product_images(),
+    order_images() or to_dict(), or to None for deletes. previous maps ids
+    to the old values of the fields that changed. Readers of the change
+    feed are woken when the transaction commits.
+    """
+    if not images:
+        return
+    actor_id, origin = change_source()
+    previous = previous or {}
+    now = datetime.utcnow()
+    # A Core insert of the table: the ORM's bulk insert costs more per row
+    # than the statement itself on batches of thousands
+    db.session.execute(ChangeLog.__table__.insert(), [
+        {'user_id': user_id, 'entity': entity, 'entity_id': entity_id, 'action': action,
+         'data': json.dumps(image) if image is not None else None,
+         'previous': json.dumps(previous[entity_id]) if entity_id in previous else None,
+         'actor_id': actor_id, 'origin': origin, 'created_at': now}
+        for entity_id, image in images.items()
+    ])
+    db.session.info.setdefault('changed_users', set()).add(user_id)
+
+@db.event.listens_for(Session, 'after_commit')
+def notify_change_feed(session):
+    user_ids = session.info.pop('changed_users', None)
+    if user_ids and has_app_context():
+        current_app.extensions['change_notifier'].notify(user_ids)
+
+@db.event.listens_for(Session, 'after_rollback')
+def forget_changes(session):
+    session.info.pop('changed_users', None)
+
+def return_order_stock(user_id, order_ids):
+    """Put back the stock taken by some orders, whatever their size.
+
+    The order lines are summed per product in SQL and restocked with one
+    grouped UPDATE, the locations they were allocated from get their stock
+    back, and one INSERT ... SELECT writes a return to the ledger for each
+    line. Nothing is loaded per order or per line. Returns the category of
+    each product that was restocked.
+    """
+    lines = (db.select(OrderItem.product_id, db.func.sum(OrderItem.quantity).label('quantity'))
+             .where(OrderItem.order_id.in_(order_ids))
+             .group_by(OrderItem.product_id))
+    categories = restore_stock(user_id, dict(db.session.execute(lines).all()), source=lines)
+    release_allocations(user_id, order_ids, categories)
+    now = datetime.utcnow()
+    returns = (db.select(db.literal(user_id), OrderItem.product_id, OrderItem.order_id, Product.category,
+                         db.literal('return'), OrderItem.quantity, OrderItem.unit_price,
+                         db.literal(now.date()), db.literal(now))
+               .join(Product, Product.id == OrderItem.product_id)
+               .where(OrderItem.order_id.in_(order_ids), Product.user_id == user_id, OrderItem.quantity != 0))
+    db.session.execute(db.insert(StockMovement).from_select(
+        ['user_id', 'product_id', 'order_id', 'category', 'kind', 'quantity_change', 'unit_price', 'day',
+         'created_at'], returns))
+    return categories
+
+def transition_orders(user_id, order_ids, status):
+    """Move orders to status where ORDER_TRANSITIONS allows it, with the move's side effects.
+
+    One guarded UPDATE changes only the orders whose current status may
+    move to status, so an order saved again with the status it already
+    has, or cancelled by two requests at once, is not restocked twice.
+    Moving to cancelled puts the orders' stock back. Runs in the caller's
+    transaction; returns the ids of the orders that changed.
+    """
+    sources = [source for source, targets in ORDER_TRANSITIONS.items() if status in targets]
+    if not order_ids or not sources:
+        return []
+    # For the change log; the guarded UPDATE below decides which orders move
+    statuses = dict(db.session.execute(db.select(Order.id, Order.status).where(
+        Order.user_id == user_id, Order.id.in_(order_ids), Order.status.in_(sources))).all())
+    if not statuses:
+        return []
+    stmt = (db.update(Order)
+            .where(Order.user_id == user_id, Order.id.in_(order_ids), Order.status.in_(sources))
+            .values(status=status, updated_at=datetime.utcnow())
+            .returning(Order.id)
+            .execution_options(synchronize_session=False))
+    changed = db.session.scalars(stmt).all()
+    if changed and status == 'cancelled':
+        return_order_stock(user_id, changed)
+    log_changes(user_id, 'order', 'update', order_images(user_id, changed),
+                {order_id: {'status': statuses.get(order_id)} for order_id in changed})
+    return changed
+
+def delete_orders(user_id, order_ids):
+    """Delete orders with their lines and allocations, returning the stock they hold.
+
+    A cancelled order gave its stock back when it was cancelled; any other
+    order's stock goes back as if it had been cancelled. Call
+    bump_data_version() first: on SQLite that takes the write lock, so an
+    order cannot be cancelled between reading its status and deleting it.
+    Returns the ids deleted.
+    """
+    rows = db.session.execute(db.select(Order.id, Order.status)
+                              .where(Order.user_id == user_id, Order.id.in_(order_ids))
+                              .with_for_update()).all()
+    order_ids = [order_id for order_id, _ in rows]
+    if not order_ids:
+        return []
+    images = order_images(user_id, order_ids)
+    holding = [order_id for order_id, status in rows if status != 'cancelled']
+    if holding:
+        return_order_stock(user_id, holding)
+    for model, column in ((StockAllocation, StockAllocation.order_id), (OrderItem, OrderItem.order_id),
+                          (Order, Order.id)):
+        db.session.execute(db.delete(model).where(column.in_(order_ids))
+                           .execution_options(synchronize_session=False))
+    log_changes(user_id, 'order', 'delete', dict.fromkeys(order_ids), images)
+    return order_ids
+
+def _movement_stats(kind, net, value, added):
+    """What a group of ledger rows adds to each roll-up counter"""
+    stats = dict.fromkeys(STATS_FIELDS, 0)
+    stats['net_change'] = net
+    if kind == 'sale':
+        stats['units_sold'] = -net
+        stats['revenue'] = -value
+    elif kind == 'return':
+        stats['units_returned'] = net
+        stats['revenue'] = -value
+    else:
+        stats['stock_in'] = added
+        stats['stock_out'] = added - net
+    return stats
+
+def roll_up_movements(user_id):
+    """Fold ledger rows added since the last roll-up into the stats tables.
+
+    Runs in the caller's transaction. The watermark is advanced with a
+    guarded UPDATE before anything else, so a concurrent roll-up of the same
+    rows gives up instead of counting them twice. Returns the number of
+    ledger rows folded in.
+    """
+    watermark = db.session.get(AnalyticsWatermark, user_id)
+    if watermark is None:
+        watermark = AnalyticsWatermark(user_id=user_id, last_movement_id=0)
+        db.session.add(watermark)
+        db.session.flush()
+    last_id = watermark.last_movement_id
+
+    change = StockMovement.quantity_change
+    groups = (db.session.query(StockMovement.product_id, StockMovement.category, StockMovement.day,
+                               StockMovement.kind, db.func.sum(change),
+                               db.func.sum(change * db.func.coalesce(StockMovement.unit_price, 0)),
+                               db.func.sum(db.case((change > 0, change), else_=0)),
+                               db.func.count(), db.func.max(StockMovement.id))
+              .filter(StockMovement.user_id == user_id, StockMovement.id > last_id)
+              .group_by(StockMovement.product_id, StockMovement.category, StockMovement.day, StockMovement.kind)
+              .all())
+    if not groups:
+        return 0
+    claimed = db.session.execute(
+        db.update(AnalyticsWatermark)
+        .where(AnalyticsWatermark.user_id == user_id, AnalyticsWatermark.last_movement_id == last_id)
+        .values(last_movement_id=max(group[-1] for group in groups))).rowcount
+    if not claimed:
+        return 0
+
+    product_deltas = {}
+    category_deltas = {}
+    for product_id, category, day, kind, net, value, added, count, _ in groups:
+        stats = _movement_stats(kind, net, value, added)
+        for period, start in (('day', day), ('week', day - timedelta(days=day.weekday()))):
+            for deltas in (product_deltas.setdefault((product_id, period, start), dict.fromkeys(STATS_FIELDS, 0)),
+                           category_deltas.setdefault((category, period, start), dict.fromkeys(STATS_FIELDS, 0))):
+                for field, value in stats.items():
+                    deltas[field] += value
+
+    _apply_stats(ProductStats, 'product_id', user_id, product_deltas)
+    _apply_stats(CategoryStats, 'category', user_id, category_deltas)
+    return sum(group[-2] for group in groups)
+
+def _apply_stats(model, owner, user_id, deltas):
+    """Add {(owner, period, period_start): deltas} to a user's stats rows.
+
+    Costs one SELECT for the ids of the rows that exist, one executemany
+    UPDATE and one executemany INSERT, however many buckets are touched.
+    """
+    owner_column = getattr(model, owner)
+    owners = {key[0] for key in deltas}
+    match = owner_column.in_(owners - {None})
+    if None in owners:
+        match = db.or_(match, owner_column.is_(None))
+    starts = [key[2] for key in deltas]
+    existing = {
+        (row[1], row[2], row[3]): row[0]
+        for row in db.session.query(model.id, owner_column, model.period, model.period_start)
+                             .filter(model.user_id == user_id, match,
+                                     model.period_start.between(min(starts), max(starts)))
+    }
+
+    updates = []
+    inserts = []
+    for key, fields in deltas.items():
+        row_id = existing.get(key)
+        if row_id is None:
+            inserts.append(dict(fields, user_id=user_id, period=key[1], period_start=key[2], **{owner: key[0]}))
+        else:
+            updates.append(dict({f'delta_{field}': value for field, value in fields.items()}, row_id=row_id))
+    table = model.__table__
+    if updates:
+        stmt = (table.update().where(table.c.id == db.bindparam('row_id'))
+                .values({field: table.c[field] + db.bindparam(f'delta_{field}') for field in STATS_FIELDS}))
+        db.session.connection().execute(stmt, updates)
+    if inserts:
+        db.session.execute(db.insert(model), inserts)
+
+def backfill_stock_ledger():
+    """Add ledger rows for orders placed before the ledger existed.
+
+    Every order item becomes a sale on the order's creation date, and the
+    items of cancelled orders also get a return. Orders that already have
+    a sale (or return) logged are skipped, so this is safe to run again.
+    """
+    columns = ['user_id', 'product_id', 'order_id', 'category', 'kind', 'quantity_change',
+               'unit_price', 'day', 'created_at']
+    inserted = 0
+    for kind, sign, timestamp, condition in (
+            ('sale', -1, Order.created_at, db.true()),
+            ('return', 1, db.func.coalesce(Order.updated_at, Order.created_at), Order.status == 'cancelled')):
+        logged = db.exists().where(StockMovement.order_id == Order.id, StockMovement.kind == kind)
+        select = (db.select(Order.user_id, OrderItem.product_id, Order.id, Product.category, db.literal(kind),
+                            sign * OrderItem.quantity, OrderItem.unit_price, db.func.date(timestamp), timestamp)
+                  .join(OrderItem, OrderItem.order_id == Order.id)
+                  .outerjoin(Product, Product.id == OrderItem.product_id)
+                  .where(condition, ~logged))
+        inserted += db.session.execute(db.insert(StockMovement).from_select(columns, select)).rowcount
+    return inserted
+
+def compute_forecasts(user_id):
+    """Recompute the demand forecast and reorder point of every product.
+
+    Demand is daily units sold net of returns, read from the ledger
+    roll-ups over the last FORECAST_WINDOW_DAYS days. One grouped query
+    gives each product's total and sum of squares, and
+    forecasting.reorder_plan() runs over the whole catalogue at once. The
+    user's forecasts are replaced in the caller's transaction. Returns the
+    number of products forecast.
+    """
+    import forecasting
+    roll_up_movements(user_id)
+    window = current_app.config['FORECAST_WINDOW_DAYS']
+    since = datetime.utcnow().date() - timedelta(days=window - 1)
+    demand = ProductStats.units_sold - ProductStats.units_returned
+    sums = {
+        product_id: (total, squares)
+        for product_id, total, squares in db.session.query(ProductStats.product_id, db.func.sum(demand),
+                                                           db.func.sum(demand * demand))
+                                                    .filter(ProductStats.user_id == user_id,
+                                                            ProductStats.period == 'day',
+                                                            ProductStats.period_start >= since)
+                                                    .group_by(ProductStats.product_id)
+    }
+    products = db.session.query(Product.id, Product.quantity).filter(Product.user_id == user_id).all()
+    no_sales = (0, 0)
+    plan = forecasting.reorder_plan([product.quantity for product in products],
+                                    [sums.get(product.id, no_sales)[0] for product in products],
+                                    [sums.get(product.id, no_sales)[1] for product in products],
+                                    window,
+                                    current_app.config['FORECAST_LEAD_TIME_DAYS'],
+                                    current_app.config['FORECAST_REVIEW_DAYS'],
+                                    current_app.config['FORECAST_SERVICE_LEVEL'])
+
+    now = datetime.utcnow()
+    fields = list(plan)
+    rows = [dict(zip(fields, values), product_id=product.id, user_id=user_id, computed_at=now)
+            for product, *values in zip(products, *plan.values())]
+    db.session.query(ProductForecast).filter_by(user_id=user_id).delete(synchronize_session=False)
+    if rows:
+        db.session.execute(db.insert(ProductForecast), rows)
+    return len(rows)
+
+def reorder_alerts(user_id, limit):
+    """Products at or below their reorder point, the soonest to run out first.
+
+    Days of cover are worked out from the current quantity, so alerts stay
+    right as stock moves between forecast runs.
+    """
+    days_of_cover = Product.quantity / ProductForecast.demand_rate
+    rows = (db.session.query(Product, ProductForecast, days_of_cover)
+            .join(ProductForecast, ProductForecast.product_id == Product.id)
+            .filter(ProductForecast.user_id == user_id, ProductForecast.reorder_point > 0,
+                    Product.user_id == user_id, Product.quantity <= ProductForecast.reorder_point)
+            .order_by(days_of_cover, Product.id)
+            .limit(limit).all())
+    return [dict(product.to_dict(), forecast=dict(forecast.to_dict(), days_of_cover=round(cover, 1)))
+            for product, forecast, cover in rows]
+
+IMPORT_CHUNK_SIZE = 1000
+EXPORT_BATCH_SIZE = 1000
+MAX_REPORTED_IMPORT_ERRORS = 1000
+MAX_STOCK_ADJUSTMENTS = 100000
+MAX_BULK_ORDERS = 10000
+PRODUCT_EXPORT_FIELDS = ('id', 'name', 'category', 'quantity', 'price', 'supplier',
+                         'description', 'created_at', 'updated_at')
+ORDER_EXPORT_FIELDS = ('id', 'order_number', 'customer_name', 'customer_email', 'customer_phone',
+                       'total_amount', 'status', 'notes', 'created_at', 'updated_at', 'items')
+
+def read_import_rows(stream, fmt):
+    """Yield (line_number, row, error) from a CSV or NDJSON byte stream.
+
+    The stream is decoded and parsed incrementally, so memory use does not
+    depend on the size of the upload.
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row, None
+    elif fmt == 'ndjson':
+        for line_number, line in enumerate(text, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                yield line_number, None, 'Invalid JSON'
+                continue
+            if isinstance(row, dict):
+                yield line_number, row, None
+            else:
+                yield line_number, None, 'Each line must be a JSON object'
+    else:
+        raise ValueError('Format must be csv or ndjson')
+
+def validate_product_row(row, upsert=False):
+    """Validate one imported product row; returns (values, error)"""
+    def text(field, max_length=None):
+        value = row.get(field)
+        value = str(value).strip() if value is not None else ''
+        if max_length and len(value) > max_length:
+            raise ValueError(f'{field} is longer than {max_length} characters')
+        return value or None
+
     try:
-        db.session.delete(product)
-        db.session.commit()
-        flash('Product deleted successfully!', 'success')
-    except Exception as e:
-        flash('An error occurred while deleting the product.', 'error')
-    
-    return redirect(url_for('inventory'))
-
-# Order Routes
-@app.route('/orders')
-@login_required
-def orders():
-    orders = Order.query.filter_by(user_id=current_user.id).order_by(Order.created_at.desc()).all()
-    return render_template('orders.html', orders=orders)
-
-@app.route('/add_order', methods=['GET', 'POST'])
-@login_required
-def add_order():
-    if request.method == 'POST':
+        name = text('name', 100)
+        if not name:
+            raise ValueError('name is required')
         try:
-            # Create order
-            order = Order(
-                order_number=generate_order_number(),
-                customer_name=request.form.get('customer_name'),
-                customer_email=request.form.get('customer_email'),
-                customer_phone=request.form.get('customer_phone'),
-                notes=request.form.get('notes'),
-                user_id=current_user.id
-            )
-            
-            db.session.add(order)
-            db.session.flush()  # Get order ID without committing
-            
-            # Process order items
-            total_amount = 0
-            product_ids = request.form.getlist('product_id[]')
-            quantities = request.form.getlist('quantity[]')
-            
-            for i, product_id in enumerate(product_ids):
-                if quantities[i] and int(quantities[i]) > 0:
-                    product = Product.query.filter_by(id=product_id, user_id=current_user.id).first()
-                    if product:
-                        quantity = int(quantities[i])
-                        if quantity <= product.quantity:
-                            # Create order item
-                            order_item = OrderItem(
-                                order_id=order.id,
-                                product_id=product_id,
-                                quantity=quantity,
-                                unit_price=product.price
-                            )
-                            db.session.add(order_item)
-                            
-                            # Update product quantity
-                            product.quantity -= quantity
-                            product.updated_at = datetime.utcnow()
-                            
-                            total_amount += quantity * product.price
-            
-            order.total_amount = total_amount
-            db.session.commit()
-            
-            flash('Order created successfully!', 'success')
-            return redirect(url_for('orders'))
-            
-        except Exception as e:
-            db.session.rollback()
-            flash('An error occurred while creating the order.', 'error')
-    
-    # Get available products for the form and convert to dictionaries
-    products = Product.query.filter_by(user_id=current_user.id).filter(Product.quantity > 0).all()
-    products_data = [{
-        'id': p.id,
-        'name': p.name,
-        'quantity': p.quantity,
-        'price': float(p.price),
-        'category': p.category
-    } for p in products]
-    
-    return render_template('add_order.html', products=products_data)
-
-@app.route('/edit_order/<int:order_id>', methods=['GET', 'POST'])
-@login_required
-def edit_order(order_id):
-    order = Order.query.filter_by(id=order_id, user_id=current_user.id).first_or_404()
-    
-    if request.method == 'POST':
-        try:
-            # Update order details
-            order.customer_name = request.form.get('customer_name')
-            order.customer_email = request.form.get('customer_email')
-            order.customer_phone = request.form.get('customer_phone')
-            order.status = request.form.get('status')
-            order.notes = request.form.get('notes')
-            order.updated_at = datetime.utcnow()
-            
-            # If status changed to cancelled, restore product quantities
-            if order.status == 'cancelled':
-                for item in order.items:
-                    product = Product.query.get(item.product_id)
-                    if product and product.user_id == current_user.id:
-                        product.quantity += item.quantity
-                        product.updated_at = datetime.utcnow()
-            
-            db.session.commit()
-            flash('Order updated successfully!', 'success')
-            return redirect(url_for('orders'))
-            
-        except Exception as e:
-            db.session.rollback()
-            flash('An error occurred while updating the order.', 'error')
-    
-    return render_template('edit_order.html', order=order)
-
-@app.route('/delete_order/<int:order_id>', methods=['POST'])
-@login_required
-def delete_order(order_id):
-    order = Order.query.filter_by(id=order_id, user_id=current_user.id).first_or_404()
-    
+            quantity = row.get('quantity')
+            if not isinstance(quantity, int):
+                # NDJSON numbers can arrive as floats and CSV cells are text;
+                # int() would truncate 3.7 and reject '3.0'
+                quantity = float(quantity)
+            price = float(row.get('price'))
+        except (TypeError, ValueError, OverflowError):
+            raise ValueError('quantity and price must be numeric')
+        if isinstance(quantity, float):
+            if not quantity.is_integer():
+                raise ValueError('quantity must be a whole number')
+            quantity = int(quantity)
+        # float() and NDJSON accept nan and inf, which the database and the
+        # summary totals cannot hold
+        if not math.isfinite(price):
+            raise ValueError('price must be a finite number')
+        if quantity < 0 or price < 0:
+            raise ValueError('quantity and price must not be negative')
+        values = {
+            'name': name,
+            'category': text('category', 50),
+            'quantity': quantity,
+            'price': price,
+            'supplier': text('supplier', 100),
+            'description': text('description')
+        }
+        if upsert and text('id'):
+            try:
+                values['id'] = int(text('id'))
+            except ValueError:
+                raise ValueError('id must be an integer')
+    except ValueError as e:
+        return None, str(e)
+    return values, None
+
+def _import_product_chunk(user_id, chunk, report):
+    """Write one chunk of validated rows and commit it, reporting the rows the database rejects.
+
+    If the chunk fails it is rolled back and written again one row at a
+    time, so only the offending rows are lost and the rows committed
+    before it stay in the report.
+    """
     try:
-        # Restore product quantities before deleting
-        for item in order.items:
-            product = Product.query.get(item.product_id)
-            if product and product.user_id == current_user.id:
-                product.quantity += item.quantity
-                product.updated_at = datetime.utcnow()
-        
-        db.session.delete(order)
+        _write_product_chunk(user_id, chunk, report)
+    except (SQLAlchemyError, OverflowError) as e:
+        # sqlite3 raises OverflowError itself for integers beyond 64 bits
+        db.session.rollback()
+        if len(chunk) > 1:
+            for row in chunk:
+                _import_product_chunk(user_id, [row], report)
+        else:
+            _report_import_error(report, chunk[0][0], f'could not be saved: {getattr(e, "orig", None) or e}')
+
+def _write_product_chunk(user_id, chunk, report):
+    """Write one chunk of validated rows with executemany and commit it"""
+    now = datetime.utcnow()
+    ids = [values['id'] for _, values in chunk if 'id' in values]
+    previous = product_images(user_id, ids) if ids else {}
+    existing = {product_id: (image['category'], image['quantity'], image['price'])
+                for product_id, image in previous.items()}
+
+    inserts = []
+    updates = []
+    changes = []
+    movements = []
+    missing = []
+    for line_number, values in chunk:
+        snapshot = (values['category'], values['quantity'], values['price'])
+        product_id = values.get('id')
+        if product_id is None:
+            inserts.append(dict(values, user_id=user_id, created_at=now, updated_at=now))
+            changes.append((None, snapshot))
+        elif product_id in existing:
+            updates.append(dict(values, updated_at=now))
+            changes.append((existing[product_id], snapshot))
+            movements.append(stock_movement('adjustment', product_id, values['category'],
+                                            values['quantity'] - existing[product_id][1]))
+            existing[product_id] = snapshot
+        else:
+            missing.append((line_number, product_id))
+
+    if inserts:
+        inserted_ids = db.session.execute(
+            db.insert(Product).returning(Product.id, sort_by_parameter_order=True), inserts).scalars().all()
+        movements.extend(stock_movement('adjustment', product_id, values['category'], values['quantity'])
+                         for product_id, values in zip(inserted_ids, inserts))
+    if updates:
+        db.session.execute(db.update(Product), updates)
+    updated_ids = list(dict.fromkeys(row['id'] for row in updates))
+    sync_location_stock(user_id, updated_ids + (inserted_ids if inserts else []))
+    record_stock_changes(user_id, changes)
+    log_movements(user_id, movements)
+    images = product_images(user_id, updated_ids + (inserted_ids if inserts else []))
+    log_changes(user_id, 'product', 'insert', {product_id: images[product_id] for product_id in inserted_ids}
+                if inserts else {})
+    log_changes(user_id, 'product', 'update', {product_id: images[product_id] for product_id in updated_ids},
+                {product_id: changed_fields(previous[product_id], images[product_id]) for product_id in updated_ids})
+    bump_data_version(user_id)
+    db.session.commit()
+    report['inserted'] += len(inserts)
+    report['updated'] += len(updates)
+    for line_number, product_id in missing:
+        _report_import_error(report, line_number, f'Product #{product_id} was not found')
+
+def _report_import_error(report, line_number, error):
+    report['error_count'] += 1
+    if len(report['errors']) < MAX_REPORTED_IMPORT_ERRORS:
+        report['errors'].append({'line': line_number, 'error': error})
+
+def import_products(user_id, rows, upsert=False, chunk_size=IMPORT_CHUNK_SIZE, on_chunk=None):
+    """Bulk insert (or, with upsert, update by id) products from parsed rows.
+
+    Rows are validated one at a time and written in chunks, with one commit
+    per chunk; on_chunk, if given, is called with the report after each
+    commit. Returns a report with counts and per-line errors.
+    """
+    report = {'inserted': 0, 'updated': 0, 'error_count': 0, 'errors': []}
+    ensure_summaries(user_id)
+    chunk = []
+    for line_number, row, error in rows:
+        values = None
+        if error is None:
+            values, error = validate_product_row(row, upsert)
+        if error:
+            _report_import_error(report, line_number, error)
+            continue
+        chunk.append((line_number, values))
+        if len(chunk) >= chunk_size:
+            _import_product_chunk(user_id, chunk, report)
+            chunk = []
+            if on_chunk:
+                on_chunk(report)
+    if chunk:
+        _import_product_chunk(user_id, chunk, report)
+    report['errors'].sort(key=lambda error: error['line'])
+    return report
+
+def parse_adjustment(entry):
+    """Validate one stock adjustment; returns ((product_id, delta, quantity, expected), error)"""
+    if not isinstance(entry, dict):
+        return None, 'Each adjustment must be an object'
+    product_id, delta, quantity = entry.get('product_id'), entry.get('delta'), entry.get('quantity')
+    for field, value in (('product_id', product_id), ('delta', delta), ('quantity', quantity)):
+        if value is not None and (isinstance(value, bool) or not isinstance(value, int)):
+            return None, f'{field} must be an integer'
+    if product_id is None:
+        return None, 'product_id is required'
+    if (delta is None) == (quantity is None):
+        return None, 'Give exactly one of delta or quantity'
+    if quantity is not None and quantity < 0:
+        return None, 'quantity must not be negative'
+    expected = entry.get('expected_updated_at')
+    if expected is not None:
+        try:
+            expected = datetime.fromisoformat(expected)
+        except (TypeError, ValueError):
+            return None, 'expected_updated_at must be an ISO 8601 timestamp'
+        if expected.tzinfo is not None:
+            # updated_at is stored as naive UTC
+            expected = expected.astimezone(timezone.utc).replace(tzinfo=None)
+    return (product_id, delta, quantity, expected), None
+
+def adjust_stock(user_id, entries, atomic=False):
+    """Apply a batch of stock adjustments in one transaction and commit it.
+
+    Each entry names a product_id and either a delta or an absolute
+    quantity, plus an optional expected_updated_at: the product's
+    updated_at as the client last saw it. An entry whose product has
+    changed since then is a conflict and is not applied. With atomic, any
+    failed entry rolls the whole batch back.
+
+    The data version is bumped first, which on SQLite takes the write lock
+    for the batch; on other databases the products read are locked FOR
+    UPDATE. The entries go into a temporary table, so reading the products,
+    writing the ledger and updating stock are one set-based statement each.
+
+    Returns a report with counts and one result per entry, in order.
+    """
+    results = [None] * len(entries)
+    parsed = {}
+    for index, entry in enumerate(entries):
+        adjustment, error = parse_adjustment(entry)
+        if adjustment is not None and adjustment[0] in parsed:
+            adjustment, error = None, 'Product is listed more than once'
+        if error:
+            product_id = entry.get('product_id') if isinstance(entry, dict) else None
+            results[index] = {'product_id': product_id, 'status': 'invalid', 'error': error}
+        else:
+            parsed[adjustment[0]] = (index, adjustment)
+    if not parsed:
+        return {'applied': 0, 'failed': len(entries), 'results': results}
+
+    bump_data_version(user_id)
+    ensure_summaries(user_id)
+    connection = db.session.connection()
+    STOCK_ADJUSTMENT.create(connection)
+    connection.execute(STOCK_ADJUSTMENT.insert(), [
+        {'product_id': product_id, 'delta': delta, 'quantity': quantity}
+        for _, (product_id, delta, quantity, _) in parsed.values()])
+    adjustment = STOCK_ADJUSTMENT.c
+    current = {
+        row[0]: row[1:]
+        for row in db.session.execute(
+            db.select(Product.id, Product.category, Product.quantity, Product.price, Product.updated_at)
+            .join(STOCK_ADJUSTMENT, adjustment.product_id == Product.id)
+            .where(Product.user_id == user_id)
+            .with_for_update(of=Product))
+    }
+
+    now = datetime.utcnow()
+    applied = []
+    rejected = []
+    for product_id, (index, (_, delta, quantity, expected)) in parsed.items():
+        row = current.get(product_id)
+        if row is None:
+            results[index] = {'product_id': product_id, 'status': 'not_found',
+                              'error': f'Product #{product_id} was not found'}
+            continue
+        category, on_hand, price, updated_at = row
+        new_quantity = quantity if quantity is not None else on_hand + delta
+        if expected is not None and expected != updated_at:
+            results[index] = {'product_id': product_id, 'status': 'conflict', 'quantity': on_hand,
+                              'updated_at': updated_at.isoformat() if updated_at else None,
+                              'error': 'Product was changed since it was read'}
+        elif new_quantity < 0:
+            results[index] = {'product_id': product_id, 'status': 'invalid',
+                              'error': f'Only {on_hand} in stock; cannot remove {-delta}'}
+        else:
+            applied.append((product_id, (category, on_hand, price), (category, new_quantity, price)))
+            continue
+        rejected.append({'row_id': product_id})
+
+    failed = len(entries) - len(applied)
+    if atomic and failed:
+        applied = []
+    if applied:
+        if rejected:
+            connection.execute(STOCK_ADJUSTMENT.delete().where(adjustment.product_id == db.bindparam('row_id')),
+                               rejected)
+        new_quantity = db.func.coalesce(adjustment.quantity, Product.quantity + adjustment.delta)
+        changed = (db.select(Product.user_id, Product.id, Product.category, db.literal('adjustment'),
+                             new_quantity - Product.quantity, db.literal(now.date()), db.literal(now))
+                   .join(STOCK_ADJUSTMENT, adjustment.product_id == Product.id)
+                   .where(Product.user_id == user_id, new_quantity != Product.quantity))
+        db.session.execute(db.insert(StockMovement).from_select(
+            ['user_id', 'product_id', 'category', 'kind', 'quantity_change', 'day', 'created_at'], changed))
+        db.session.execute(db.update(Product)
+                           .where(Product.id == adjustment.product_id, Product.user_id == user_id)
+                           .values(quantity=new_quantity, updated_at=now)
+                           .execution_options(synchronize_session=False))
+        sync_location_stock(user_id, db.select(adjustment.product_id))
+        STOCK_ADJUSTMENT.drop(connection)
+        record_stock_changes(user_id, [(before, after) for _, before, after in applied])
+        log_changes(user_id, 'product', 'update', product_images(user_id, [product_id for product_id, _, _ in applied]),
+                    {product_id: {'quantity': before[1]} for product_id, before, _ in applied})
         db.session.commit()
-        flash('Order deleted successfully!', 'success')
-    except Exception as e:
+    else:
         db.session.rollback()
-        flash('An error occurred while deleting the order.', 'error')
-    
-    return redirect(url_for('orders'))
-
-@app.route('/api/orders')
-@login_required
-def api_orders():
-    orders = Order.query.filter_by(user_id=current_user.id).order_by(Order.created_at.desc()).all()
-    return jsonify([order.to_dict() for order in orders])
-
-@app.route('/api/products/available')
-@login_required
-def api_available_products():
-    products = Product.query.filter_by(user_id=current_user.id).filter(Product.quantity > 0).all()
-    return jsonify([{
-        'id': p.id,
-        'name': p.name,
-        'quantity': p.quantity,
-        'price': p.price,
-        'category': p.category
-    } for p in products])
-
-@app.route('/report')
-@login_required
-def report():
-    products = Product.query.filter_by(user_id=current_user.id).all()
-    total_quantity = sum(product.quantity for product in products)
-    total_value = sum(product.quantity * product.price for product in products)
-    
-    # Calculate category-wise breakdown
-    categories = {}
-    for product in products:
-        if product.category not in categories:
-            categories[product.category] = {'count': 0, 'quantity': 0, 'value': 0}
-        categories[product.category]['count'] += 1
-        categories[product.category]['quantity'] += product.quantity
-        categories[product.category]['value'] += product.quantity * product.price
-    
-    return render_template('report.html', 
-                         products=products, 
-                         total_quantity=total_quantity, 
-                         total_value=total_value,
-                         categories=categories)
-
-@app.route('/api/report')
-@login_required
-def api_report():
-    products = Product.query.filter_by(user_id=current_user.id).all()
-    total_quantity = sum(product.quantity for product in products)
-    total_value = sum(product.quantity * product.price for product in products)
-    
-    # Category breakdown
-    categories = {}
-    for product in products:
-        if product.category not in categories:
-            categories[product.category] = {'count': 0, 'quantity': 0, 'value': 0}
-        categories[product.category]['count'] += 1
-        categories[product.category]['quantity'] += product.quantity
-        categories[product.category]['value'] += product.quantity * product.price
-    
-    report_data = {
-        'total_products': len(products),
-        'total_quantity': total_quantity,
-        'total_value': round(total_value, 2),
-        'categories': categories,
-        'products': [product.to_dict() for product in products]
+
+    for product_id, _, (_, quantity, _) in applied:
+        results[parsed[product_id][0]] = {'product_id': product_id, 'status': 'applied',
+                                          'quantity': quantity, 'updated_at': now.isoformat()}
+    for index, _ in parsed.values():
+        if results[index] is None:
+            results[index] = {'product_id': entries[index]['product_id'], 'status': 'skipped',
+                              'error': 'Not applied because another adjustment in the batch failed'}
+    return {'applied': len(applied), 'failed': failed, 'results': results}
+
+def bulk_change_orders(user_id, action, order_ids):
+    """Cancel or delete a batch of orders in one transaction and commit it.
+
+    Returns the number of orders changed and an error for each one that
+    was not: missing, or, for cancel, not in a status that can be
+    cancelled (already cancelled or completed).
+    """
+    order_ids = list(dict.fromkeys(order_ids))
+    bump_data_version(user_id)
+    if action == 'cancel':
+        changed = transition_orders(user_id, order_ids, 'cancelled')
+    else:
+        changed = delete_orders(user_id, order_ids)
+    changed_ids = set(changed)
+    rest = [order_id for order_id in order_ids if order_id not in changed_ids]
+    statuses = dict(db.session.execute(db.select(Order.id, Order.status)
+                                       .where(Order.user_id == user_id, Order.id.in_(rest))).all()) if rest else {}
+    db.session.commit()
+
+    errors = []
+    for order_id in rest:
+        if order_id in statuses:
+            errors.append({'order_id': order_id, 'error': f'A {statuses[order_id]} order cannot be cancelled'})
+        else:
+            errors.append({'order_id': order_id, 'error': f'Order #{order_id} was not found'})
+    return {'changed': len(changed), 'failed': len(errors), 'errors': errors}
+
+def iter_products(user_id):
+    """Yield the user's products as dicts without loading the whole table"""
+    query = Product.query.filter_by(user_id=user_id).order_by(Product.id)
+    for product in query.yield_per(EXPORT_BATCH_SIZE):
+        yield product.to_dict()
+
+def iter_orders(user_id):
+    """Yield the user's orders with items as dicts, a batch at a time"""
+    query = (Order.query.filter_by(user_id=user_id)
+             .options(db.selectinload(Order.items).selectinload(OrderItem.product))
+             .order_by(Order.id))
+    for order in query.yield_per(EXPORT_BATCH_SIZE):
+        yield order.to_dict()
+
+def stream_csv(rows, fieldnames, buffer_size=64 * 1024):
+    """Encode dict rows as CSV, yielding output in buffered chunks"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fieldnames, extrasaction='ignore')
+    writer.writeheader()
+    for row in rows:
+        if 'items' in row:
+            row = dict(row, items=json.dumps(row['items']))
+        writer.writerow(row)
+        if buffer.tell() >= buffer_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def stream_ndjson(rows, buffer_size=64 * 1024):
+    """Encode dict rows as newline-delimited JSON, yielding buffered chunks"""
+    chunk = []
+    size = 0
+    for row in rows:
+        line = json.dumps(row) + '\n'
+        chunk.append(line)
+        size += len(line)
+        if size >= buffer_size:
+            yield ''.join(chunk)
+            chunk = []
+            size = 0
+    yield ''.join(chunk)
+
+def stream_json(fields, key, rows, batch_size=EXPORT_BATCH_SIZE):
+    """Encode {**fields, key: [rows]} as JSON text, one batch at a time.
+
+    Only `batch_size` encoded rows are held at once, and the first bytes go
+    out before the rows have even been queried.
+    """
+    encode = json.JSONEncoder(separators=(',', ':')).encode
+    head = ''.join(f'{encode(name)}:{encode(value)},' for name, value in fields.items())
+    yield '{' + head + encode(key) + ':['
+    separator = ''
+    batch = []
+    for row in rows:
+        batch.append(encode(row))
+        if len(batch) >= batch_size:
+            yield separator + ','.join(batch)
+            separator = ','
+            batch = []
+    if batch:
+        yield separator + ','.join(batch)
+    yield ']}'
+
+def json_stream_response(fields, key, rows):
+    """Wrap stream_json() in a streaming application/json response"""
+    return Response(stream_with_context(stream_json(fields, key, rows)), mimetype='application/json')
+
+def wants_stream(args):
+    """Whether the caller asked for the streaming response mode"""
+    return args.get('stream', '').lower() in ('1', 'true', 'yes')
+
+def export_response(rows, fieldnames, fmt, filename):
+    """Build a streaming download response for exported rows"""
+    if fmt == 'csv':
+        body, mimetype = stream_csv(rows, fieldnames), 'text/csv'
+    elif fmt == 'ndjson':
+        body, mimetype = stream_ndjson(rows), 'application/x-ndjson'
+    else:
+        return jsonify({'error': 'Format must be csv or ndjson'}), 400
+    return Response(stream_with_context(body), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename={filename}.{fmt}'
+    })
+
+def report_totals(user_id):
+    """Summary fields of the inventory report, read from the summaries"""
+    summary = get_inventory_summary(user_id)
+    return {
+        'total_products': summary.product_count,
+        'total_quantity': summary.total_quantity,
+        'total_value': round(summary.total_value, 2),
+        'categories': get_category_summaries(user_id)
     }
-    
-    return jsonify(report_data)
 
-if __name__ == '__main__':
+def import_format(upload):
+    """The import format from ?format=, else guessed from the upload"""
+    fmt = request.args.get('format')
+    if not fmt:
+        filename = upload.filename if upload else ''
+        fmt = 'ndjson' if filename.endswith(('.ndjson', '.jsonl')) or request.mimetype == 'application/x-ndjson' else 'csv'
+    return fmt
+
+def generate_order_number():
+    """Generate a unique, time-ordered order number; see order_numbers.py"""
+    return current_app.extensions['order_numbers']()
+
+# Extensions are bound to an app by create_app(), which also registers the
+# blueprints in blueprints/, so importing this module builds no app, engine,
+# cache or job workers
+response_cache = AppCache()
+job_queue = jobs.JobQueue(db, Job)
+
+login_manager = LoginManager()
+login_manager.login_view = 'auth.login'
+login_manager.login_message = 'Please log in to access this page.'
+
+def cached_json(view=None, vary=None):
+    """Serve a JSON view through the response cache with ETag revalidation.
+
+    The cache key and ETag are derived from the user's data version, so an
+    unchanged client copy gets a 304 before the view or cache is touched.
+    Streaming requests bypass the cache. A view whose answer depends on
+    more than its query string and the data, such as a date window ending
+    today, passes vary: a function of the request args whose result is
+    added to the key. Args it rejects with ValueError go to the view
+    uncached, which reports them.
+    """
+    if view is None:
+        return lambda view: cached_json(view, vary)
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if wants_stream(request.args):
+            return view(*args, **kwargs)
+
+        version = get_data_version(current_user.id)
+        key = f'{request.endpoint}:{current_user.id}:{version}:{request.query_string.decode()}'
+        if vary is not None:
+            try:
+                key += f':{vary(request.args)}'
+            except ValueError:
+                return view(*args, **kwargs)
+        etag = hashlib.sha1(key.encode()).hexdigest()
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            body = response_cache.get(key)
+            if body is None:
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                body = response.get_data()
+                response_cache.set(key, body)
+            response = Response(body, mimetype='application/json')
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    return wrapper
+
+# Columns kept in the user cache; the password hash always comes from the database
+USER_CACHE_FIELDS = ('id', 'username', 'email', 'created_at')
+
+def _user_cache_key(user_id):
+    return f'user:{user_id}'
+
+@login_manager.user_loader
+def load_user(user_id):
+    # Authenticated requests rebuild current_user from the cache without a
+    # SELECT; a cache miss loads the row and stores its columns
+    fields = response_cache.get(_user_cache_key(user_id))
+    if fields is None:
+        user = db.session.get(User, int(user_id))
+        if user is not None:
+            response_cache.set(_user_cache_key(user_id), {name: getattr(user, name) for name in USER_CACHE_FIELDS})
+        return user
+    user = User(**fields)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+@db.event.listens_for(User, 'after_update')
+@db.event.listens_for(User, 'after_delete')
+def invalidate_cached_user(mapper, connection, target):
+    # Dropped once the change commits: dropping it now would let a request
+    # load the old row and cache it again before the commit
+    session = db.object_session(target)
+    if session is not None:
+        session.info.setdefault('changed_user_rows', set()).add(target.id)
+
+@db.event.listens_for(Session, 'after_commit')
+def drop_cached_users(session):
+    for user_id in session.info.pop('changed_user_rows', ()):
+        response_cache.delete(_user_cache_key(user_id))
+
+@db.event.listens_for(Session, 'after_rollback')
+def keep_cached_users(session):
+    session.info.pop('changed_user_rows', None)
+
+CATALOGUE_COLUMNS = (Product.id, Product.name, Product.category, Product.quantity, Product.price)
+
+def refresh_catalogue(user_id, snapshot):
+    """Bring the user's catalogue snapshot up to their current data version.
+
+    The first refresh, and the first after CATALOGUE_RESYNC_SECONDS, loads
+    every product. Otherwise only products updated since the snapshot's
+    watermark are read again, going back CATALOGUE_LOOKBACK_SECONDS to
+    catch writes that committed after a later one, and deleted products
+    are found when the row count no longer matches the inventory summary.
+    The caller holds snapshot.lock.
+    """
+    version = get_data_version(user_id)
+    if version == snapshot.version:
+        return
+    now = time.monotonic()
+    query = db.session.query(*CATALOGUE_COLUMNS, Product.updated_at).filter(Product.user_id == user_id)
+    if snapshot.loaded_at is None or now - snapshot.loaded_at > current_app.config['CATALOGUE_RESYNC_SECONDS']:
+        rows = query.all()
+        snapshot.load(row[:5] for row in rows)
+        snapshot.loaded_at = now
+    else:
+        if snapshot.watermark is not None:
+            lookback = timedelta(seconds=current_app.config['CATALOGUE_LOOKBACK_SECONDS'])
+            query = query.filter(Product.updated_at >= snapshot.watermark - lookback)
+        rows = query.all()
+        for row in rows:
+            snapshot.upsert(*row[:5])
+        if len(snapshot) != get_inventory_summary(user_id).product_count:
+            live = set(db.session.scalars(db.select(Product.id).filter_by(user_id=user_id)))
+            for product_id in [product_id for product_id in snapshot.rows if product_id not in live]:
+                snapshot.remove(product_id)
+    snapshot.watermark = max((row.updated_at for row in rows if row.updated_at), default=snapshot.watermark)
+    snapshot.version = version
+
+# Stats tables whose plans depend on planner statistics; see database.analyze
+ANALYTICS_TABLES = ('product_stats', 'category_stats')
+
+CANCEL_BATCH_SIZE = 500
+
+def job_file_path(name):
+    return os.path.join(current_app.config['JOB_FILES_DIR'], name)
+
+@job_queue.task('report')
+def report_job(job):
+    """Write the full /api/report JSON document to a file"""
+    report_data = report_totals(job.user_id)
+    total = report_data['total_products']
+    done = 0
+
+    def rows():
+        nonlocal done
+        # Keyset batches rather than one long cursor, so progress writes
+        # never wait on an open read
+        last_id = 0
+        while True:
+            batch = (Product.query.filter(Product.user_id == job.user_id, Product.id > last_id)
+                     .order_by(Product.id).limit(EXPORT_BATCH_SIZE).all())
+            if not batch:
+                return
+            for product in batch:
+                yield product.to_dict()
+            done += len(batch)
+            last_id = batch[-1].id
+            db.session.expunge_all()
+            job.progress(done, total)
+
+    name = f'report-{job.job_id}.json'
+    os.makedirs(current_app.config['JOB_FILES_DIR'], exist_ok=True)
+    with open(job_file_path(name + '.part'), 'w') as f:
+        for chunk in stream_json(report_data, 'products', rows()):
+            f.write(chunk)
+    os.replace(job_file_path(name + '.part'), job_file_path(name))
+    job.progress(done, total, force=True)
+    return {'file': name, 'products': done}
+
+def stock_status(quantity):
+    if quantity == 0:
+        return 'Out of Stock'
+    return 'Low Stock' if quantity < LOW_STOCK_THRESHOLD else 'In Stock'
+
+def report_rows(user_id, on_batch=None):
+    """Yield the user's products as report export rows, in id order.
+
+    Reads plain columns in keyset batches rather than one long cursor, so
+    progress writes never wait on an open read; on_batch(done) is called
+    after each batch.
+    """
+    last_id = 0
+    done = 0
+    columns = (Product.id, Product.name, Product.category, Product.supplier, Product.quantity, Product.price)
+    while True:
+        batch = (db.session.query(*columns).filter(Product.user_id == user_id, Product.id > last_id)
+                 .order_by(Product.id).limit(EXPORT_BATCH_SIZE).all())
+        if not batch:
+            return
+        for product_id, name, category, supplier, quantity, price in batch:
+            yield {
+                'id': product_id,
+                'name': name,
+                'category': category,
+                'supplier': supplier,
+                'quantity': quantity,
+                'price': price,
+                'value': round(quantity * price, 2),
+                'status': stock_status(quantity)
+            }
+        done += len(batch)
+        last_id = batch[-1].id
+        if on_batch:
+            on_batch(done)
+
+def report_export_name(user_id, version, fmt):
+    """Export cache file for one user, data version and format, under JOB_FILES_DIR"""
+    return os.path.join('reports', f'report-{user_id}-v{version}.{fmt}')
+
+def cached_report_export(user_id, fmt):
+    """Name of the export for the user's current data version, if it was built"""
+    name = report_export_name(user_id, get_data_version(user_id), fmt)
+    return name if os.path.exists(job_file_path(name)) else None
+
+def build_report_export(user_id, fmt, on_batch=None):
+    """Write the user's report export to the export cache and return its name.
+
+    The file is keyed by the data version read before the rows, so any
+    product or order change makes it unreachable. It is written under a
+    temporary name and renamed into place, then the user's files for older
+    versions of the same format are removed.
+    """
+    import reports
+    version = get_data_version(user_id)
+    name = report_export_name(user_id, version, fmt)
+    path = job_file_path(name)
+    if os.path.exists(path):
+        return name
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial = f'{path}.{secrets.token_hex(4)}.part'
+    try:
+        with open(partial, 'wb') as f:
+            reports.write_report(fmt, f, report_totals(user_id), report_rows(user_id, on_batch))
+        os.replace(partial, path)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+    for entry in os.scandir(os.path.dirname(path)):
+        if (entry.name.startswith(f'report-{user_id}-v') and entry.name.endswith(f'.{fmt}')
+                and entry.path != path):
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+    return name
+
+@job_queue.task('report_export')
+def report_export_job(job):
+    """Build a CSV, XLSX or PDF report export into the export cache"""
+    total = get_inventory_summary(job.user_id).product_count
+    name = build_report_export(job.user_id, job.params['format'], lambda done: job.progress(done, total))
+    job.progress(total, total, force=True)
+    return {'file': name, 'format': job.params['format']}
+
+@job_queue.task('import_products', retry=False)
+def import_products_job(job):
+    """Import an uploaded product file saved by /api/jobs/import
+
+    Not retried: the chunks committed before a crash would be inserted again.
+    """
+    path = job_file_path(job.params['file'])
+    size = os.path.getsize(path)
+    try:
+        with open(path, 'rb') as f:
+            def on_chunk(report):
+                job.progress(f.tell(), size, message=f"{report['inserted']} inserted, {report['updated']} updated")
+            report = import_products(job.user_id, read_import_rows(f, job.params['format']),
+                                     upsert=job.params['upsert'], on_chunk=on_chunk)
+    finally:
+        os.remove(path)
+    job.progress(size, size, message=f"{report['inserted']} inserted, {report['updated']} updated", force=True)
+    return report
+
+@job_queue.task('cancel_orders')
+def cancel_orders_job(job):
+    """Cancel orders and put their stock back, one transaction per batch"""
+    order_ids = job.params['order_ids']
+    cancelled = 0
+    for start in range(0, len(order_ids), CANCEL_BATCH_SIZE):
+        batch = order_ids[start:start + CANCEL_BATCH_SIZE]
+        cancelled += len(transition_orders(job.user_id, batch, 'cancelled'))
+        bump_data_version(job.user_id)
+        db.session.commit()
+        job.progress(start + len(batch), len(order_ids))
+    job.progress(len(order_ids), len(order_ids), force=True)
+    return {'cancelled': cancelled, 'skipped': len(order_ids) - cancelled}
+
+@job_queue.task('forecast')
+def forecast_job(job):
+    """Recompute the user's demand forecasts and reorder points"""
+    forecast = compute_forecasts(job.user_id)
+    bump_data_version(job.user_id)
+    db.session.commit()
+    return {'products': forecast}
+
+def job_accepted(job):
+    """202 response pointing at the status endpoint of a new job"""
+    response = jsonify(job.to_dict())
+    response.status_code = 202
+    response.headers['Location'] = url_for('jobs.api_job', job_id=job.id)
+    return response
+
+MAX_CHANGE_PAGE_SIZE = 5000
+CHANGE_HEARTBEAT_SECONDS = 15
+
+def read_changes(user_id, since, limit, entity=None, entity_id=None):
+    """The user's change log entries after sequence number since, oldest first"""
+    query = ChangeLog.query.filter(ChangeLog.user_id == user_id, ChangeLog.id > since)
+    if entity is not None:
+        query = query.filter(ChangeLog.entity == entity)
+        if entity_id is not None:
+            query = query.filter(ChangeLog.entity_id == entity_id)
+    return [change.to_dict() for change in query.order_by(ChangeLog.id).limit(limit)]
+
+def compacted_through(user_id):
+    """Readers resuming from before this sequence number may have missed compacted deletes"""
+    return db.session.query(ChangeCompaction.purged_through).filter_by(user_id=user_id).scalar() or 0
+
+def compact_changes(user_id, before):
+    """Drop the user's change log entries from before `before` that readers no longer need.
+
+    Of those entries, only the newest one for each product or order that
+    still exists is kept. Every entry carries the whole row, so a reader
+    that is behind still ends up with the latest state of every row. The
+    deletes that are dropped move the user's compaction horizon; readers
+    resuming from before it get a 410 and have to reload. Runs in the
+    caller's transaction; returns the number of entries dropped.
+    """
+    through = (db.session.query(db.func.max(ChangeLog.id))
+               .filter(ChangeLog.user_id == user_id, ChangeLog.created_at < before).scalar())
+    if through is None:
+        return 0
+    old = db.and_(ChangeLog.user_id == user_id, ChangeLog.id <= through)
+    newest = (db.select(db.func.max(ChangeLog.id)).where(ChangeLog.user_id == user_id)
+              .group_by(ChangeLog.entity, ChangeLog.entity_id))
+    purged = db.session.query(db.func.max(ChangeLog.id)).filter(old, ChangeLog.action == 'delete').scalar()
+    removed = db.session.execute(
+        db.delete(ChangeLog).where(old, db.or_(ChangeLog.action == 'delete', ChangeLog.id.not_in(newest)))
+        .execution_options(synchronize_session=False)).rowcount
+    compaction = db.session.get(ChangeCompaction, user_id)
+    if compaction is None:
+        compaction = ChangeCompaction(user_id=user_id, purged_through=0)
+        db.session.add(compaction)
+    compaction.purged_through = max(compaction.purged_through, purged or 0)
+    compaction.compacted_at = datetime.utcnow()
+    return removed
+
+def stream_changes(user_id, since, entity, entity_id):
+    """Server-sent events for the user's changes after since, until CHANGE_FEED_STREAM_SECONDS pass.
+
+    Each event's id is its sequence number, so a reconnecting EventSource
+    resumes where it left off through the Last-Event-ID header.
+    """
+    notifier = current_app.extensions['change_notifier']
+    poll = current_app.config['CHANGE_FEED_POLL_SECONDS']
+    deadline = time.monotonic() + current_app.config['CHANGE_FEED_STREAM_SECONDS']
+    quiet_since = time.monotonic()
+    yield 'retry: 1000\n\n'
+    while time.monotonic() < deadline:
+        position = notifier.position(user_id)
+        changes = read_changes(user_id, since, MAX_CHANGE_PAGE_SIZE, entity, entity_id)
+        # Hold no connection or read snapshot while waiting
+        db.session.close()
+        if changes:
+            yield ''.join(change_feed.sse_event(change, 'change', change['seq']) for change in changes)
+            since = changes[-1]['seq']
+            quiet_since = time.monotonic()
+            continue
+        if time.monotonic() - quiet_since >= CHANGE_HEARTBEAT_SECONDS:
+            yield change_feed.sse_comment('keep-alive')
+            quiet_since = time.monotonic()
+        notifier.wait(user_id, position, max(0, min(poll, deadline - time.monotonic())))
+
+# Pages whose queries must stay index searches; requested by check-query-plans
+HOT_PAGES = [
+    '/dashboard',
+    '/inventory',
+    '/api/products',
+    '/api/products?sort=price&direction=desc&stock_status=low-stock',
+    '/orders',
+    '/api/orders',
+    '/add_order',
+    '/api/products/available',
+    '/api/products/typeahead?q=prod',
+    '/report',
+    '/api/report',
+    '/api/analytics/series',
+    '/api/analytics/categories',
+    '/api/analytics/products?start_date=2024-01-01&end_date=2024-12-31',
+    '/api/forecast/reorder',
+    '/api/products?q=product',
+    '/api/products/search?q=prod&category=Office',
+    '/api/warehouses',
+    # Filled in with the user's first warehouse, location and product
+    '/api/warehouses/{warehouse_id}/stock',
+    '/api/locations/{location_id}/stock',
+    '/api/products/{product_id}/locations',
+    '/api/changes',
+    '/api/changes?entity=product&entity_id={product_id}'
+]
+
+def hot_page_query_plans(user_id):
+    """Request the HOT_PAGES as a user and explain each distinct SELECT they run.
+
+    Returns (pages, plans): the pages requested, and a (statement, plan,
+    fully scanned tables) triple per statement. Needs a SQLite database;
+    raises ValueError otherwise or when a page does not answer 200.
+    """
+    import query_plans
+    shards = current_app.extensions.get('tenant_shards')
+    # The pages' per-user queries run on the user's shard when sharding is on
+    engine = shards.engine(user_id) if shards is not None else db.engine
+    if engine.dialect.name != 'sqlite':
+        raise ValueError('Query plan checks need a SQLite database')
+    client = current_app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+
+    with user_scope(user_id):
+        ids = {
+            'warehouse_id': db.session.query(db.func.min(Warehouse.id)).filter(Warehouse.user_id == user_id).scalar(),
+            'location_id': db.session.query(db.func.min(StockLocation.id))
+                             .filter(StockLocation.user_id == user_id).scalar(),
+            'product_id': db.session.query(db.func.min(Product.id)).filter(Product.user_id == user_id).scalar()
+        }
+    pages = [page.format(**ids) for page in HOT_PAGES if 'None' not in page.format(**ids)]
+
+    # Cached pages would skip their queries on a hit
+    response_cache.clear()
+    with query_plans.capture_selects(engine) as statements:
+        for page in pages:
+            response = client.get(page)
+            if response.status_code != 200:
+                raise ValueError(f'{page} returned {response.status_code}')
+
+    unique = {}
+    for statement, parameters in statements:
+        unique.setdefault(statement, parameters)
+    tables = set(db.metadata.tables)
+    plans = []
+    with engine.connect() as connection:
+        for statement, parameters in unique.items():
+            plan = query_plans.explain(connection, statement, parameters)
+            plans.append((statement, plan, query_plans.full_scans(plan, tables)))
+    return pages, plans
+
+def provision_shard(engine, user_id):
+    """Set up a user's new shard engine: pragmas and profiling, its schema and a copy of their user row.
+
+    The copy only satisfies the shard's foreign keys, so it carries no
+    password hash; logins read the shared user table.
+    """
+    database.install_sqlite_pragmas(engine, current_app.config['SQLITE_PRAGMAS'])
+    if 'profiling' in current_app.extensions:
+        import profiling
+        profiling.instrument_engine(engine)
+    migrations.upgrade(engine, db.metadata)
+    with engine.begin() as connection:
+        if connection.execute(db.select(User.id).where(User.id == user_id)).first() is None:
+            with db.engine.connect() as shared:
+                user = shared.execute(db.select(User.__table__).where(User.id == user_id)).mappings().first()
+            if user is not None:
+                connection.execute(db.insert(User.__table__), dict(user, password_hash=None))
+
+def set_request_tenant():
+    # Route the session's per-user tables to the logged-in user's shard
+    if current_user.is_authenticated:
+        g.tenant_id = current_user.id
+
+def init_tenant_shards(app):
+    url = app.config['TENANT_SHARD_URL']
+    # Each shard serves one user, so it needs far fewer connections than the shared pool
+    options = database.engine_options(url.replace('{tenant_id}', '0'))
+    if 'pool_size' in options:
+        options.update(pool_size=app.config['TENANT_SHARD_POOL_SIZE'],
+                       max_overflow=app.config['TENANT_SHARD_POOL_SIZE'])
+    shards = sharding.TenantShards(url, options, provision=provision_shard, session=db.session,
+                                   max_engines=app.config['TENANT_SHARD_MAX_ENGINES'],
+                                   idle_seconds=app.config['TENANT_SHARD_IDLE_SECONDS'])
+    app.extensions['tenant_shards'] = shards
+    app.before_request(set_request_tenant)
+    job_queue.user_scope = shards.scope
+
+def user_scope(user_id):
+    """Point the session at the user's shard inside the block, when sharding is on"""
+    shards = current_app.extensions.get('tenant_shards')
+    return shards.scope(user_id) if shards is not None else nullcontext()
+
+def user_data_scopes():
+    """Yield (user_id, engine) for each database holding user rows, with the session routed to it.
+
+    That is the shared database once, with user_id None for all users, or
+    with tenant sharding each user's shard in turn. Commit before moving on.
+    """
+    shards = current_app.extensions.get('tenant_shards')
+    if shards is None:
+        yield None, db.engine
+        return
+    for user_id in [user_id for (user_id,) in db.session.query(User.id).order_by(User.id)]:
+        with shards.scope(user_id):
+            yield user_id, shards.engine(user_id)
+
+def create_app(config=None):
+    """Build and configure the app; config overrides the settings read from the environment"""
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'your-secret-key-here-change-in-production'
+    database.configure(app)
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    app.config['CACHE_BACKEND'] = os.environ.get('CACHE_BACKEND', 'memory')  # memory, sqlite or none
+    app.config['CACHE_TTL'] = int(os.environ.get('CACHE_TTL', 300))
+    app.config['CACHE_MAX_ENTRIES'] = int(os.environ.get('CACHE_MAX_ENTRIES', 1024))
+    app.config['CACHE_PATH'] = os.environ.get('CACHE_PATH', os.path.join(app.instance_path, 'cache.db'))
+
+    # Any werkzeug method string, e.g. pbkdf2:sha256:600000 or scrypt:32768:8:1;
+    # stored hashes are upgraded at the next successful login
+    app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+
+    app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 2))  # 0 leaves jobs to `flask run-jobs`
+    app.config['JOB_LEASE_SECONDS'] = int(os.environ.get('JOB_LEASE_SECONDS', 300))
+    app.config['JOB_FILES_DIR'] = os.environ.get('JOB_FILES_DIR', os.path.join(app.instance_path, 'jobs'))
+
+    # Must differ between hosts sharing a database; processes on one host
+    # claim their own slots through lock files in ORDER_NODE_DIR
+    app.config['ORDER_HOST_ID'] = int(os.environ.get('ORDER_HOST_ID', 0))
+    app.config['ORDER_NODE_DIR'] = os.environ.get('ORDER_NODE_DIR', os.path.join(app.instance_path, 'order-nodes'))
+
+    # How add_order picks stock from a product's locations; see ALLOCATION_STRATEGIES
+    app.config['STOCK_ALLOCATION_STRATEGY'] = os.environ.get('STOCK_ALLOCATION_STRATEGY', 'priority')
+
+    # Per-process catalogue snapshots behind the order form's typeahead and
+    # /api/products/available; see refresh_catalogue
+    app.config['CATALOGUE_MAX_USERS'] = int(os.environ.get('CATALOGUE_MAX_USERS', 64))
+    app.config['CATALOGUE_RESYNC_SECONDS'] = int(os.environ.get('CATALOGUE_RESYNC_SECONDS', 300))
+    app.config['CATALOGUE_LOOKBACK_SECONDS'] = int(os.environ.get('CATALOGUE_LOOKBACK_SECONDS', 10))
+
+    # Each user's rows in a shard of their own; see sharding.py. The URL's
+    # {tenant_id} is the user id; a PostgreSQL URL without it gets a schema per user
+    app.config['TENANT_SHARDING'] = os.environ.get('TENANT_SHARDING', '').lower() in ('1', 'true', 'yes')
+    app.config['TENANT_SHARD_URL'] = os.environ.get(
+        'TENANT_SHARD_URL', 'sqlite:///' + os.path.join(app.instance_path, 'shards', 'tenant-{tenant_id}.db'))
+    app.config['TENANT_SHARD_MAX_ENGINES'] = int(os.environ.get('TENANT_SHARD_MAX_ENGINES', 32))
+    app.config['TENANT_SHARD_IDLE_SECONDS'] = int(os.environ.get('TENANT_SHARD_IDLE_SECONDS', 300))
+    app.config['TENANT_SHARD_POOL_SIZE'] = int(os.environ.get('TENANT_SHARD_POOL_SIZE', 2))
+
+    # Change log and feed; see log_changes and compact_changes
+    app.config['CHANGE_LOG_RETENTION_DAYS'] = float(os.environ.get('CHANGE_LOG_RETENTION_DAYS', 7))
+    app.config['CHANGE_FEED_POLL_SECONDS'] = float(os.environ.get('CHANGE_FEED_POLL_SECONDS', 1))
+    app.config['CHANGE_FEED_STREAM_SECONDS'] = int(os.environ.get('CHANGE_FEED_STREAM_SECONDS', 300))
+
+    app.config['FORECAST_WINDOW_DAYS'] = int(os.environ.get('FORECAST_WINDOW_DAYS', 90))
+    app.config['FORECAST_LEAD_TIME_DAYS'] = float(os.environ.get('FORECAST_LEAD_TIME_DAYS', 7))
+    app.config['FORECAST_REVIEW_DAYS'] = float(os.environ.get('FORECAST_REVIEW_DAYS', 14))
+    app.config['FORECAST_SERVICE_LEVEL'] = float(os.environ.get('FORECAST_SERVICE_LEVEL', 0.95))
+
+    app.config['PROFILING_ENABLED'] = os.environ.get('PROFILING_ENABLED', '').lower() in ('1', 'true', 'yes')
+    app.config['PROFILING_N_PLUS_ONE_THRESHOLD'] = int(os.environ.get('PROFILING_N_PLUS_ONE_THRESHOLD', 5))
+    app.config['PROFILING_SLOW_MS'] = float(os.environ.get('PROFILING_SLOW_MS', 500))
+    app.config['PROFILING_PROFILE_DIR'] = os.environ.get('PROFILING_PROFILE_DIR')  # unset disables sampling
+    app.config['PROFILING_SAMPLE_INTERVAL_MS'] = float(os.environ.get('PROFILING_SAMPLE_INTERVAL_MS', 5))
+    # /metrics is only served when this is set, to requests sending it as a bearer token
+    app.config['PROFILING_METRICS_TOKEN'] = os.environ.get('PROFILING_METRICS_TOKEN')
+
+    if config:
+        app.config.update(config)
+        if 'SQLALCHEMY_DATABASE_URI' in config and 'SQLALCHEMY_ENGINE_OPTIONS' not in config:
+            # Pool options depend on the URL; match them to the one actually used
+            app.config['SQLALCHEMY_ENGINE_OPTIONS'] = database.engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+    if app.config['STOCK_ALLOCATION_STRATEGY'] not in ALLOCATION_STRATEGIES:
+        raise ValueError(f"Unknown stock allocation strategy: {app.config['STOCK_ALLOCATION_STRATEGY']}")
+
+    db.init_app(app)
     with app.app_context():
-        db.create_all()
-        create_test_user()  # Create test user on startup
-    app.run(debug=True)
\ No newline at end of file
+        database.install_sqlite_pragmas(db.engine, app.config['SQLITE_PRAGMAS'])
+    response_cache.init_app(app)
+    login_manager.init_app(app)
+    job_queue.init_app(app)
+    app.extensions['order_numbers'] = order_numbers.OrderNumberGenerator(app.config['ORDER_NODE_DIR'],
+                                                                         app.config['ORDER_HOST_ID'])
+    app.extensions['catalogue'] = catalogue.CatalogueStore(app.config['CATALOGUE_MAX_USERS'])
+    app.extensions['change_notifier'] = change_feed.ChangeNotifier()
+    if app.config['TENANT_SHARDING']:
+        init_tenant_shards(app)
+    if app.config['PROFILING_ENABLED']:
+        import profiling
+        with app.app_context():
+            profiling.init_app(app, db.engine)
+
+    # The blueprint modules import their helpers from this one
+    from blueprints import BLUEPRINTS
+    for blueprint in BLUEPRINTS:
+        app.register_blueprint(blueprint)
+    return app
+
+def __getattr__(name):
+    # `app:app` for WSGI servers and `flask --app app`: the app configured
+    # from the environment, built on first use rather than at import
+    if name == 'app':
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+if __name__ == '__main__':
+    # Create the schema first with `flask --app app init-db`. The app is built
+    # from the importable module, whose globals the blueprints share
+    import app
+    app.create_app().run(debug=True)
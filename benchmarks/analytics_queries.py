@@ -0,0 +1,121 @@
+"""Time the analytics API over a year of stock movement history.
+
+Seeds one user's catalogue, fills the stock ledger with synthetic sales,
+returns and adjustments spread over --days, times the incremental
+roll-up, then times each analytics endpoint over the full range and
+compares it with aggregating the raw ledger directly.
+
+    python benchmarks/analytics_queries.py --products 1000 --movements 500000 --days 365
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import seed_data  # noqa: E402
+
+
+def fill_ledger(app, user_id, movements, days, seed):
+    rng = random.Random(seed)
+    catalogue = (app.db.session.query(app.Product.id, app.Product.category, app.Product.price)
+                 .filter_by(user_id=user_id).all())
+    today = datetime.utcnow().date()
+    rows = []
+    for _ in range(movements):
+        product_id, category, price = rng.choice(catalogue)
+        day = today - timedelta(days=rng.randrange(days))
+        kind = rng.choices(['sale', 'return', 'adjustment'], weights=[80, 5, 15])[0]
+        quantity = rng.randint(1, 5)
+        if kind == 'adjustment':
+            change, unit_price = rng.choice([quantity * 10, -quantity]), None
+        else:
+            change, unit_price = (-quantity if kind == 'sale' else quantity), price
+        rows.append({'user_id': user_id, 'product_id': product_id, 'category': category, 'kind': kind,
+                     'quantity_change': change, 'unit_price': unit_price, 'day': day,
+                     'created_at': datetime.combine(day, datetime.min.time())})
+        if len(rows) == seed_data.BATCH_SIZE:
+            seed_data._flush(app, app.StockMovement, rows)
+    seed_data._flush(app, app.StockMovement, rows)
+    app.db.session.commit()
+
+
+def timed(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=1000)
+    parser.add_argument('--movements', type=int, default=500000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix='analytics-'), 'bench.db')
+    app = seed_data.load_app(f'sqlite:///{path}')
+    seed_data.seed(app, users=1, products=args.products, orders=0, seed=args.seed)
+    with app.app.app_context():
+        app.migrations.upgrade(app.db.engine, app.db.metadata)
+        user_id = app.User.query.filter_by(username='bench0').one().id
+        started = time.perf_counter()
+        fill_ledger(app, user_id, args.movements, args.days, args.seed)
+        print(f'Logged {args.movements} movements over {args.days} days in {time.perf_counter() - started:.1f}s')
+
+        started = time.perf_counter()
+        app.roll_up_movements(user_id)
+        app.db.session.commit()
+        print(f'Initial roll-up: {(time.perf_counter() - started) * 1000:.0f} ms')
+        with app.db.engine.begin() as connection:
+            app.database.analyze(connection, app.ANALYTICS_TABLES)
+
+        app.log_movements(user_id, [app.stock_movement('sale', 1, 'Office', -1, 9.99)])
+        app.db.session.commit()
+        started = time.perf_counter()
+        app.roll_up_movements(user_id)
+        app.db.session.commit()
+        print(f'Incremental roll-up of one movement: {(time.perf_counter() - started) * 1000:.2f} ms')
+
+    end = datetime.utcnow().date()
+    start = end - timedelta(days=args.days - 1)
+    query = f'start_date={start.isoformat()}&end_date={end.isoformat()}'
+    client = app.app.test_client()
+    client.post('/login', data={'username': 'bench0', 'password': seed_data.PASSWORD})
+
+    def get(path):
+        # Skip the response cache so every request runs its queries
+        app.response_cache.clear()
+        response = client.get(path)
+        assert response.status_code == 200, (path, response.status_code)
+
+    print(f"\n{'over ' + str(args.days) + ' days':<44} {'median ms':>10}")
+    for label, path in (('series, daily', '/api/analytics/series'),
+                        ('series, weekly', '/api/analytics/series?period=week'),
+                        ('series, one product', '/api/analytics/series?product_id=1'),
+                        ('category totals', '/api/analytics/categories'),
+                        ('top products', '/api/analytics/products')):
+        path += ('&' if '?' in path else '?') + query
+        print(f'{label:<44} {timed(lambda: get(path), args.repeat):>10.2f}')
+
+    with app.app.app_context():
+        movement = app.StockMovement
+        ledger_scan = (app.db.session.query(movement.product_id, app.db.func.sum(movement.quantity_change))
+                       .filter(movement.user_id == user_id, movement.day.between(start, end))
+                       .group_by(movement.product_id))
+        print(f"{'raw ledger GROUP BY product (for comparison)':<44} "
+              f'{timed(lambda: ledger_scan.all(), max(1, args.repeat // 4)):>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""Time the order form's product data: the catalogue snapshot against querying every product.
+
+Seeds one user with --products products and compares the old
+/api/products/available path (query every in-stock product, build dicts,
+encode JSON) with the snapshot: the first full load, a refresh after one
+order changes a few products, and warm requests, plain and gzip. It
+reports body sizes, typeahead latency and the /add_order page, which no
+longer embeds the product list.
+
+    python benchmarks/bench_catalogue.py --products 100000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault('JOB_WORKERS', '0')
+
+import seed_data  # noqa: E402
+
+
+def timed(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix='catalogue-'), 'bench.db')
+    os.environ['ORDER_NODE_DIR'] = os.path.join(os.path.dirname(path), 'order-nodes')
+    app = seed_data.load_app(f'sqlite:///{path}')
+    seed_data.seed(app, users=1, products=args.products, orders=0, seed=args.seed)
+    rng = random.Random(args.seed)
+    with app.app.app_context():
+        app.migrations.upgrade(app.db.engine, app.db.metadata)
+        # Products last changed well before the refresh lookback, as in a live catalogue
+        app.db.session.execute(app.db.update(app.Product).values(updated_at=datetime.utcnow() - timedelta(days=1)))
+        app.db.session.commit()
+        user_id = app.User.query.filter_by(username='bench0').one().id
+        stocked = [product_id for (product_id,) in app.db.session.query(app.Product.id).filter(
+            app.Product.user_id == user_id, app.Product.quantity > 100)]
+
+    client = app.app.test_client()
+    client.post('/login', data={'username': 'bench0', 'password': seed_data.PASSWORD})
+    store = app.app.extensions['catalogue']
+    sizes = {}
+
+    def legacy():
+        # The view as it was: every in-stock product through the ORM into JSON
+        with app.app.test_request_context():
+            products = app.Product.query.filter_by(user_id=user_id).filter(app.Product.quantity > 0).all()
+            body = app.jsonify([{'id': p.id, 'name': p.name, 'quantity': p.quantity, 'price': p.price,
+                                 'category': p.category} for p in products]).get_data()
+        sizes['legacy JSON'] = len(body)
+
+    def get(url, encoding=None, label=None):
+        headers = {'Accept-Encoding': encoding} if encoding else {}
+        response = client.get(url, headers=headers)
+        assert response.status_code == 200, (url, response.status_code)
+        if label:
+            sizes[label] = len(response.data)
+
+    def cold(encoding):
+        store.clear()
+        get('/api/products/available', encoding)
+
+    def after_order(encoding):
+        lines = rng.sample(stocked, 5)
+        response = client.post('/add_order', data={'customer_name': 'Bench', 'product_id[]': lines,
+                                                   'quantity[]': ['1'] * len(lines)})
+        assert response.status_code == 302, response.status_code
+        started = time.perf_counter()
+        get('/api/products/available', encoding)
+        return (time.perf_counter() - started) * 1000
+
+    print(f"\n{'request':<44} {'ms':>9}")
+    rows = [
+        ('old query + dicts + JSON', lambda: legacy(), args.repeat),
+        ('snapshot, full load, plain', lambda: cold(None), max(1, args.repeat // 2)),
+        ('snapshot, full load, gzip', lambda: cold('gzip'), max(1, args.repeat // 2)),
+        ('snapshot, warm, plain', lambda: get('/api/products/available', None, 'snapshot JSON'), args.repeat),
+        ('snapshot, warm, gzip', lambda: get('/api/products/available', 'gzip', 'snapshot gzip'), args.repeat),
+    ]
+    for label, fn, repeat in rows:
+        print(f'{label:<44} {timed(fn, repeat):>9.2f}')
+    for encoding in (None, 'gzip'):
+        ms = statistics.median(after_order(encoding) for _ in range(args.repeat))
+        print(f'{"snapshot, refresh after an order, " + (encoding or "plain"):<44} {ms:>9.2f}')
+
+    queries = ['prod', 'product 1', 'product 12345', 'x']
+    for query in queries:
+        print(f'{"typeahead q=" + query:<44} '
+              f'{timed(lambda: get(f"/api/products/typeahead?q={query}"), args.repeat):>9.2f}')
+    print(f'{"/add_order":<44} {timed(lambda: get("/add_order", None, "/add_order page"), args.repeat):>9.2f}')
+
+    print(f"\n{'body':<44} {'KB':>9}")
+    for label, size in sizes.items():
+        print(f'{label:<44} {size / 1024:>9.1f}')
+    snapshot = store.snapshot(user_id)
+    print(f'\n{len(snapshot)} products and {len(snapshot.category_names)} categories in the snapshot')
+
+
+if __name__ == '__main__':
+    main()
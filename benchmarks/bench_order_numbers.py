@@ -0,0 +1,101 @@
+"""Stress the order number generator across processes and time index inserts.
+
+Starts --processes worker processes that share one lock directory, so
+each claims its own slot the way web workers do, and has each generate
+--count order numbers as fast as it can. It checks that every process's
+numbers are strictly increasing and that no number appears twice across
+all of them, then reports the generation rate.
+
+It then inserts --rows order numbers into a SQLite table with a unique
+index, once with the old ORD-<timestamp>-<6 random chars> format and
+once with the new one, and reports insert throughput, unique constraint
+collisions and file size.
+
+    python benchmarks/bench_order_numbers.py --processes 8 --count 500000 --rows 1000000
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import string
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import order_numbers  # noqa: E402
+
+INSERT_BATCH = 1000
+
+
+def generate(lock_dir, count, path):
+    generator = order_numbers.OrderNumberGenerator(lock_dir)
+    started = time.perf_counter()
+    numbers = [generator() for _ in range(count)]
+    elapsed = time.perf_counter() - started
+    increasing = all(a < b for a, b in zip(numbers, numbers[1:]))
+    with open(path, 'w') as f:
+        f.write('\n'.join(numbers))
+    return generator.node, elapsed, increasing
+
+
+def legacy_order_number():
+    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+    random_str = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
+    return f'ORD-{timestamp}-{random_str}'
+
+
+def insert_rows(path, make_number, rows):
+    connection = sqlite3.connect(path)
+    connection.execute('CREATE TABLE "order" (id INTEGER PRIMARY KEY, order_number VARCHAR(20) NOT NULL UNIQUE)')
+    started = time.perf_counter()
+    for start in range(0, rows, INSERT_BATCH):
+        batch = [(make_number(),) for _ in range(min(INSERT_BATCH, rows - start))]
+        # A collision would abort the checkout; here it is only counted
+        connection.executemany('INSERT OR IGNORE INTO "order" (order_number) VALUES (?)', batch)
+        connection.commit()
+    elapsed = time.perf_counter() - started
+    collisions = rows - connection.total_changes
+    connection.close()
+    return elapsed, collisions, os.path.getsize(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--count', type=int, default=500000, help='order numbers per process')
+    parser.add_argument('--rows', type=int, default=1000000, help='rows for the index insert comparison')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='order-numbers-')
+    lock_dir = os.path.join(directory, 'nodes')
+    paths = [os.path.join(directory, f'numbers-{i}.txt') for i in range(args.processes)]
+    started = time.perf_counter()
+    with multiprocessing.Pool(args.processes) as pool:
+        results = pool.starmap(generate, [(lock_dir, args.count, path) for path in paths])
+    wall = time.perf_counter() - started
+
+    total = args.processes * args.count
+    seen = set()
+    for path in paths:
+        with open(path) as f:
+            seen.update(f.read().split('\n'))
+    nodes = sorted(node for node, _, _ in results)
+    per_process = min(args.count / elapsed for _, elapsed, _ in results)
+    print(f'{total} order numbers from {args.processes} processes (nodes {nodes}) in {wall:.1f}s')
+    print(f'  duplicates: {total - len(seen)}, every process strictly increasing: '
+          f'{all(increasing for _, _, increasing in results)}')
+    print(f'  slowest process: {per_process:,.0f} per second')
+
+    print(f"\n{'format':<10} {'rows/s':>10} {'collisions':>11} {'file MB':>9}")
+    for label, make_number in (('legacy', legacy_order_number),
+                               ('new', order_numbers.OrderNumberGenerator(lock_dir))):
+        elapsed, collisions, size = insert_rows(os.path.join(directory, f'{label}.db'), make_number, args.rows)
+        print(f'{label:<10} {args.rows / elapsed:>10,.0f} {collisions:>11} {size / 1e6:>9.1f}')
+
+
+if __name__ == '__main__':
+    main()
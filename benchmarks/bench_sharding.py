@@ -0,0 +1,114 @@
+"""Time small tenants' order writes while a big tenant bulk-imports: shared database against tenant shards.
+
+Seeds --tenants small users and one big user in a shared database, then
+copies every user into their own shard with `flask shard-tenants`. For
+each storage mode, --tenants threads each place --orders orders through
+/add_order, first alone and then while the big user imports products in
+transactions of --bulk rows without a pause. With one database every
+import transaction holds the only write lock, so small tenants' orders
+queue behind it, and fail once they wait longer than the busy timeout;
+with shards they only wait for their own file.
+
+    python benchmarks/bench_sharding.py --tenants 4 --orders 50 --bulk 5000
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault('JOB_WORKERS', '0')
+
+import seed_data  # noqa: E402
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tenants', type=int, default=4, help='small tenants placing orders')
+    parser.add_argument('--products', type=int, default=500, help='products per tenant')
+    parser.add_argument('--orders', type=int, default=50, help='orders per small tenant')
+    parser.add_argument('--bulk', type=int, default=5000, help='products per import transaction')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='sharding-')
+    os.environ['ORDER_NODE_DIR'] = os.path.join(directory, 'order-nodes')
+    app = seed_data.load_app(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+    usernames = seed_data.seed(app, users=args.tenants + 1, products=args.products, orders=0, seed=args.seed)
+    big, small = usernames[0], usernames[1:]
+    sharded = app.create_app({'TENANT_SHARDING': True,
+                              'TENANT_SHARD_URL': 'sqlite:///' + os.path.join(directory, 'shards', 't{tenant_id}.db')})
+    with app.app.app_context():
+        app.migrations.upgrade(app.db.engine, app.db.metadata)
+        user_ids = {user.username: user.id for user in app.User.query.all()}
+        # Shards keep the shared database's ids, so these are valid in both modes
+        stocked = {username: [product_id for (product_id,) in app.db.session.query(app.Product.id).filter(
+            app.Product.user_id == user_ids[username], app.Product.quantity > 100)] for username in small}
+    started = time.perf_counter()
+    result = sharded.test_cli_runner().invoke(args=['shard-tenants'])
+    assert result.exception is None, result.output
+    print(f'Copied {len(usernames)} users into shards in {time.perf_counter() - started:.2f}s')
+
+    def place_orders(flask_app, username, latencies, failed):
+        client = flask_app.test_client()
+        client.post('/login', data={'username': username, 'password': seed_data.PASSWORD})
+        products = stocked[username]
+        for i in range(args.orders):
+            lines = [products[(i * 3 + j) % len(products)] for j in range(3)]
+            started = time.perf_counter()
+            response = client.post('/add_order', data={'customer_name': 'Bench', 'product_id[]': lines,
+                                                       'quantity[]': ['1'] * len(lines)})
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 302:
+                # The form is shown again when the write lock wait times out
+                failed.append(username)
+
+    def bulk_import(flask_app, stop, imported):
+        with flask_app.app_context(), app.user_scope(user_ids[big]):
+            while not stop.is_set():
+                rows = ((n, {'name': f'Bulk {imported[0] + n}', 'category': 'Bulk', 'quantity': '5',
+                             'price': '1.50'}, None) for n in range(args.bulk))
+                report = app.import_products(user_ids[big], rows, chunk_size=args.bulk)
+                imported[0] += report['inserted']
+
+    def run(flask_app, with_bulk):
+        latencies, failed = [], []
+        stop, imported = threading.Event(), [0]
+        writer = threading.Thread(target=bulk_import, args=(flask_app, stop, imported))
+        threads = [threading.Thread(target=place_orders, args=(flask_app, username, latencies, failed))
+                   for username in small]
+        started = time.perf_counter()
+        if with_bulk:
+            writer.start()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        stop.set()
+        if with_bulk:
+            writer.join()
+        return latencies, len(failed), (len(latencies) - len(failed)) / elapsed, imported[0] / elapsed
+
+    print(f"\n{'storage, load':<34} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9} {'orders/s':>9} {'failed':>7} {'import rows/s':>14}")
+    for label, flask_app in (('shared database', app.app), ('tenant shards', sharded)):
+        for load, with_bulk in (('alone', False), ('bulk import', True)):
+            latencies, failed, orders_per_second, rows_per_second = run(flask_app, with_bulk)
+            print(f"{f'{label}, {load}':<34} {statistics.median(latencies):>9.1f} "
+                  f"{percentile(latencies, 0.95):>9.1f} {max(latencies):>9.1f} {orders_per_second:>9.1f} "
+                  f"{failed:>7} {rows_per_second:>14.0f}")
+    shards = sharded.extensions['tenant_shards']
+    print(f'\n{shards.opened} shard engines opened, {shards.evicted} evicted, {len(shards.open_tenants())} open')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""Keep a copy of a user's products in sync: full exports against the change feed, and what logging costs writes.
+
+Seeds one user with --products products. Each round changes the stock
+of --changes products through /api/products/adjust-stock, then a sync
+client catches up either by downloading every product from
+/api/products/export or by reading the entries after its last sequence
+number from /api/changes. Last, orders are placed through /add_order
+and cancelled --bulk at a time through /api/orders/bulk, with the
+change log written and with log_changes() replaced by a no-op, to show
+what the log adds to each write.
+
+    python benchmarks/changes.py --products 20000 --changes 50
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault('JOB_WORKERS', '0')
+
+import seed_data  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=20000)
+    parser.add_argument('--changes', type=int, default=50, help='products changed between syncs')
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--orders', type=int, default=200, help='orders placed with and without logging')
+    parser.add_argument('--bulk', type=int, default=1000, help='orders cancelled in one request')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix='changes-'), 'bench.db')
+    os.environ['ORDER_NODE_DIR'] = os.path.join(os.path.dirname(path), 'order-nodes')
+    app = seed_data.load_app(f'sqlite:///{path}')
+    from blueprints import orders as order_views
+    seed_data.seed(app, users=1, products=args.products, orders=0, seed=args.seed)
+    rng = random.Random(args.seed)
+    with app.app.app_context():
+        app.migrations.upgrade(app.db.engine, app.db.metadata)
+        user_id = app.User.query.filter_by(username='bench0').one().id
+        product_ids = [product_id for (product_id,) in app.db.session.query(app.Product.id).filter(
+            app.Product.user_id == user_id)]
+        stocked = [product_id for (product_id,) in app.db.session.query(app.Product.id).filter(
+            app.Product.user_id == user_id, app.Product.quantity > 1000)]
+
+    client = app.app.test_client()
+    client.post('/login', data={'username': 'bench0', 'password': seed_data.PASSWORD})
+
+    def change_stock():
+        adjustments = [{'product_id': product_id, 'delta': rng.choice((-1, 1))}
+                       for product_id in rng.sample(product_ids, args.changes)]
+        response = client.post('/api/products/adjust-stock', json={'adjustments': adjustments})
+        assert response.status_code == 200, response.get_json()
+
+    def full_export(position):
+        response = client.get('/api/products/export?format=ndjson')
+        return position, len(response.get_data())
+
+    def change_feed(position):
+        size = 0
+        while True:
+            response = client.get(f'/api/changes?since={position}&entity=product')
+            body = response.get_json()
+            size += len(response.get_data())
+            position = body['next']
+            if not body['more']:
+                return position, size
+
+    print(f'{args.products} products, {args.changes} changed between syncs, {args.rounds} syncs')
+    print(f"\n{'sync':<28} {'ms':>9} {'KB':>9}")
+    position = change_feed(0)[0]
+    for label, sync in (('full /api/products/export', full_export), ('/api/changes since last', change_feed)):
+        timings, sizes = [], []
+        for _ in range(args.rounds):
+            change_stock()
+            started = time.perf_counter()
+            position, size = sync(position)
+            timings.append((time.perf_counter() - started) * 1000)
+            sizes.append(size)
+        print(f'{label:<28} {statistics.median(timings):>9.2f} {statistics.median(sizes) / 1024:>9.1f}')
+
+    def place():
+        lines = rng.sample(stocked, 3)
+        started = time.perf_counter()
+        response = client.post('/add_order', data={'customer_name': 'Bench', 'product_id[]': lines,
+                                                   'quantity[]': ['1'] * len(lines)})
+        assert response.status_code == 302, response.status_code
+        return (time.perf_counter() - started) * 1000
+
+    def latest_orders(count):
+        with app.app.app_context():
+            return [order_id for (order_id,) in app.db.session.query(app.Order.id).filter_by(
+                user_id=user_id).order_by(app.Order.id.desc()).limit(count)]
+
+    def use_logger(logger):
+        # add_order logs the new order itself; the stock helpers log the products
+        app.log_changes = order_views.log_changes = logger
+
+    # Alternate the two, so both see the same number of orders in the tables
+    loggers = {'without change log': lambda *args, **kwargs: None, 'with change log': app.log_changes}
+    timings = {label: [] for label in loggers}
+    for _ in range(args.orders):
+        for label, logger in loggers.items():
+            use_logger(logger)
+            timings[label].append(place())
+    for _ in range(2 * args.bulk):
+        place()
+    batches = latest_orders(2 * args.bulk)
+    print(f"\n{'writes':<28} {'add_order ms':>13} {f'cancel {args.bulk} ms':>15}")
+    for n, (label, logger) in enumerate(loggers.items()):
+        use_logger(logger)
+        started = time.perf_counter()
+        response = client.post('/api/orders/bulk', json={'action': 'cancel', 'order_ids': batches[n::2]})
+        elapsed = (time.perf_counter() - started) * 1000
+        assert response.get_json()['changed'] == args.bulk, response.get_json()
+        print(f'{label:<28} {statistics.median(timings[label]):>13.2f} {elapsed:>15.0f}')
+    use_logger(loggers['with change log'])
+
+    with app.app.app_context():
+        entries = app.ChangeLog.query.filter_by(user_id=user_id).count()
+        result = app.app.test_cli_runner().invoke(args=['compact-changes', '--days', '0'])
+        assert result.exception is None, result.output
+        left = app.ChangeLog.query.filter_by(user_id=user_id).count()
+    print(f'\nCompaction kept {left} of {entries} change log entries, the newest per product and order')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""Time the reorder-point forecast over a large catalogue.
+
+Seeds one user with --products SKUs and a year of daily sales roll-ups
+(each SKU sells on about --sale-days days), then times compute_forecasts()
+over the whole year. For comparison it also times forecasting a sample of
+SKUs one at a time with a query each, and extrapolates that to the
+catalogue.
+
+    python benchmarks/forecast.py --products 100000 --days 365
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import seed_data  # noqa: E402
+
+
+def fill_daily_sales(app, user_id, days, sale_days, seed):
+    rng = random.Random(seed)
+    today = datetime.utcnow().date()
+    product_ids = [row[0] for row in app.db.session.query(app.Product.id).filter_by(user_id=user_id)]
+    rows = []
+    count = 0
+    for product_id in product_ids:
+        rate = rng.expovariate(1 / 3)
+        for offset in rng.sample(range(days), k=min(days, max(0, int(rng.gauss(sale_days, sale_days / 3))))):
+            sold = max(1, round(rng.expovariate(1 / max(rate, 1))))
+            rows.append({'user_id': user_id, 'product_id': product_id, 'period': 'day',
+                         'period_start': today - timedelta(days=offset), 'units_sold': sold, 'units_returned': 0,
+                         'revenue': 0.0, 'stock_in': 0, 'stock_out': 0, 'net_change': -sold})
+            if len(rows) == seed_data.BATCH_SIZE:
+                count += len(rows)
+                seed_data._flush(app, app.ProductStats, rows)
+    count += len(rows)
+    seed_data._flush(app, app.ProductStats, rows)
+    app.db.session.commit()
+    return count
+
+
+def forecast_one_by_one(app, user_id, product_ids, window):
+    """The per-SKU alternative: one demand query and one write per product"""
+    import forecasting
+    since = datetime.utcnow().date() - timedelta(days=window - 1)
+    stats = app.ProductStats
+    demand = stats.units_sold - stats.units_returned
+    config = app.app.config
+    for product_id in product_ids:
+        quantity = app.db.session.get(app.Product, product_id).quantity
+        total, squares = (app.db.session.query(app.db.func.coalesce(app.db.func.sum(demand), 0),
+                                               app.db.func.coalesce(app.db.func.sum(demand * demand), 0))
+                          .filter(stats.user_id == user_id, stats.product_id == product_id,
+                                  stats.period == 'day', stats.period_start >= since).one())
+        plan = forecasting.reorder_plan([quantity], [total], [squares], window,
+                                        config['FORECAST_LEAD_TIME_DAYS'], config['FORECAST_REVIEW_DAYS'],
+                                        config['FORECAST_SERVICE_LEVEL'])
+        app.db.session.merge(app.ProductForecast(product_id=product_id, user_id=user_id,
+                                                 **{field: values[0] for field, values in plan.items()}))
+    app.db.session.rollback()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--days', type=int, default=365, help='days of sales history and forecast window')
+    parser.add_argument('--sale-days', type=int, default=10, help='average days each SKU sells on')
+    parser.add_argument('--sample', type=int, default=1000, help='SKUs forecast one at a time for comparison')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix='forecast-'), 'bench.db')
+    app = seed_data.load_app(f'sqlite:///{path}')
+    started = time.perf_counter()
+    seed_data.seed(app, users=1, products=args.products, orders=0, seed=args.seed)
+    with app.app.app_context():
+        app.migrations.upgrade(app.db.engine, app.db.metadata)
+        user_id = app.User.query.filter_by(username='bench0').one().id
+        rows = fill_daily_sales(app, user_id, args.days, args.sale_days, args.seed)
+        with app.db.engine.begin() as connection:
+            app.database.analyze(connection, app.ANALYTICS_TABLES)
+        print(f'Seeded {args.products} SKUs and {rows} daily sales rows in {time.perf_counter() - started:.1f}s')
+
+        app.app.config['FORECAST_WINDOW_DAYS'] = args.days
+        started = time.perf_counter()
+        forecast = app.compute_forecasts(user_id)
+        app.db.session.commit()
+        elapsed = time.perf_counter() - started
+        alerts = app.ProductForecast.query.filter(app.ProductForecast.reorder_quantity > 0).count()
+        print(f'Batched: forecast {forecast} SKUs over {args.days} days in {elapsed:.2f}s '
+              f'({alerts} below their reorder point)')
+
+        sample = [row[0] for row in app.db.session.query(app.Product.id).filter_by(user_id=user_id)
+                  .order_by(app.Product.id).limit(args.sample)]
+        started = time.perf_counter()
+        forecast_one_by_one(app, user_id, sample, args.days)
+        per_sku = (time.perf_counter() - started) / max(len(sample), 1)
+        print(f'One at a time: {per_sku * 1000:.2f} ms per SKU, '
+              f'about {per_sku * args.products:.1f}s for {args.products} SKUs')
+
+
+if __name__ == '__main__':
+    main()
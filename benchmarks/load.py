@@ -0,0 +1,285 @@
+"""Scripted load test with per-route latency, throughput and query counts.
+
+By default a temporary SQLite database is seeded with synthetic data
+(see seed_data.py) and the scenarios run in-process through the Flask
+test client, which also lets SQL statements be counted per request.
+With --url the same scenarios run against a live server instead; seed
+its database first with seed_data.py so the bench users exist.
+
+    python benchmarks/load.py --users 10 --products 1000 --orders 500 --output run.json
+    python benchmarks/load.py --url http://127.0.0.1:5000 --users 10 --output run.json
+    python benchmarks/load.py --output new.json --compare run.json
+
+With --compare the p95 of every route is checked against an earlier run
+and the script exits with status 1 if any route got slower than
+--threshold times its baseline.
+"""
+import argparse
+import http.cookiejar
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import seed_data  # noqa: E402
+
+
+def count_queries(app):
+    """Count statements per thread; requests run on the calling thread"""
+    counter = threading.local()
+
+    def before_cursor_execute(*args):
+        counter.value = getattr(counter, 'value', 0) + 1
+
+    with app.app.app_context():
+        event.listen(app.db.engine, 'before_cursor_execute', before_cursor_execute)
+    return counter
+
+
+class TestClientSession:
+    """Runs requests in-process and counts the SQL statements each one issues"""
+
+    def __init__(self, app, counter):
+        self.client = app.app.test_client()
+        self.counter = counter
+
+    def request(self, method, path, data=None):
+        self.counter.value = 0
+        response = self.client.open(path, method=method, data=data)
+        response.close()
+        return response.status_code, response.get_data(), self.counter.value
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpSession:
+    """Runs requests against a live server; query counts are not available"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+
+    def request(self, method, path, data=None):
+        body = urllib.parse.urlencode(data, doseq=True).encode() if data is not None else None
+        request = urllib.request.Request(self.base_url + path, data=body, method=method)
+        try:
+            with self.opener.open(request) as response:
+                return response.status, response.read(), None
+        except urllib.error.HTTPError as error:
+            return error.code, error.read(), None
+
+
+def login(username):
+    yield 'POST /login', 'POST', '/login', {'username': username, 'password': seed_data.PASSWORD}
+
+
+def dashboard(username):
+    yield 'GET /dashboard', 'GET', '/dashboard', None
+
+
+def inventory_browse(username):
+    yield 'GET /inventory', 'GET', '/inventory', None
+    yield 'GET /api/products', 'GET', '/api/products', None
+    page = yield 'GET /api/products (filtered)', 'GET', '/api/products?sort=price&direction=desc&stock_status=in-stock', None
+    cursor = json.loads(page).get('next_cursor') if page else None
+    if cursor:
+        yield 'GET /api/products (next page)', 'GET', '/api/products?' + urllib.parse.urlencode({
+            'sort': 'price', 'direction': 'desc', 'stock_status': 'in-stock', 'cursor': cursor}), None
+
+
+def order_placement(username):
+    available = yield 'GET /api/products/available', 'GET', '/api/products/available', None
+    products = json.loads(available) if available else []
+    yield 'GET /add_order', 'GET', '/add_order', None
+    lines = random.sample(products, k=min(2, len(products)))
+    yield 'POST /add_order', 'POST', '/add_order', {
+        'customer_name': 'Load Test',
+        'product_id[]': [str(product['id']) for product in lines],
+        'quantity[]': ['1' for _ in lines]
+    }
+    yield 'GET /orders', 'GET', '/orders', None
+
+
+def report(username):
+    yield 'GET /report', 'GET', '/report', None
+    yield 'GET /api/report', 'GET', '/api/report', None
+
+
+SCENARIOS = {
+    'login': login,
+    'dashboard': dashboard,
+    'inventory': inventory_browse,
+    'orders': order_placement,
+    'report': report
+}
+
+
+def run_scenario(session, scenario, username, samples):
+    """Drive one scenario generator, feeding each response body back into it"""
+    steps = scenario(username)
+    body = None
+    while True:
+        try:
+            route, method, path, data = steps.send(body)
+        except StopIteration:
+            return
+        started = time.perf_counter()
+        status, body, queries = session.request(method, path, data)
+        samples.append((route, (time.perf_counter() - started) * 1000, status, queries))
+        if status >= 400:
+            body = None
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    index = max(0, math.ceil(pct / 100 * len(values)) - 1)
+    return values[index]
+
+
+def summarize(samples, elapsed):
+    by_route = defaultdict(list)
+    for sample in samples:
+        by_route[sample[0]].append(sample)
+    routes = {}
+    for route, route_samples in sorted(by_route.items()):
+        latencies = sorted(sample[1] for sample in route_samples)
+        queries = [sample[3] for sample in route_samples if sample[3] is not None]
+        routes[route] = {
+            'requests': len(route_samples),
+            'errors': sum(1 for sample in route_samples if sample[2] >= 400),
+            'p50_ms': round(percentile(latencies, 50), 2),
+            'p95_ms': round(percentile(latencies, 95), 2),
+            'p99_ms': round(percentile(latencies, 99), 2),
+            'mean_ms': round(sum(latencies) / len(latencies), 2),
+            'queries_per_request': round(sum(queries) / len(queries), 1) if queries else None
+        }
+    return {
+        'requests': len(samples),
+        'errors': sum(route['errors'] for route in routes.values()),
+        'elapsed_s': round(elapsed, 2),
+        'throughput_rps': round(len(samples) / elapsed, 1) if elapsed else None,
+        'routes': routes
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=seed_data.ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(result, baseline, threshold):
+    """Print p95 changes against a baseline run; return the routes that regressed"""
+    regressions = []
+    for route, stats in result['routes'].items():
+        before = baseline['routes'].get(route)
+        if not before or not before['p95_ms']:
+            continue
+        ratio = stats['p95_ms'] / before['p95_ms']
+        flag = 'REGRESSION' if ratio > threshold else ''
+        print(f"{route:<36} p95 {before['p95_ms']:>9} -> {stats['p95_ms']:>9} ms  x{ratio:.2f} {flag}")
+        if ratio > threshold:
+            regressions.append(route)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='run against a live server instead of the test client')
+    parser.add_argument('--database-url', help='existing database for test-client runs (skips seeding)')
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--products', type=int, default=1000, help='products per user when seeding')
+    parser.add_argument('--orders', type=int, default=500, help='orders per user when seeding')
+    parser.add_argument('--items', type=int, default=3, help='items per order when seeding')
+    parser.add_argument('--iterations', type=int, default=20, help='scenario rounds per user')
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the JSON results to this file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=1.2, help='allowed p95 slowdown ratio')
+    args = parser.parse_args()
+
+    if args.url:
+        make_session = lambda: HttpSession(args.url)  # noqa: E731
+    else:
+        database_url = args.database_url
+        if database_url is None:
+            database_url = f'sqlite:///{os.path.join(tempfile.mkdtemp(prefix="load-test-"), "bench.db")}'
+        app = seed_data.load_app(database_url)
+        if args.database_url is None:
+            seed_data.seed(app, args.users, args.products, args.orders, args.items, args.seed)
+        counter = count_queries(app)
+        make_session = lambda: TestClientSession(app, counter)  # noqa: E731
+
+    samples = []
+    lock = threading.Lock()
+
+    def user_worker(index):
+        rng = random.Random(args.seed + index)
+        session = make_session()
+        username = f'bench{index}'
+        local = []
+        run_scenario(session, login, username, local)
+        for _ in range(args.iterations):
+            for name in rng.sample(args.scenarios, k=len(args.scenarios)):
+                run_scenario(session, SCENARIOS[name], username, local)
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=user_worker, args=(i,)) for i in range(args.users)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result = summarize(samples, time.perf_counter() - started)
+    result['run'] = {
+        'revision': git_revision(),
+        'target': args.url or 'test-client',
+        'users': args.users,
+        'products': args.products,
+        'orders': args.orders,
+        'items': args.items,
+        'iterations': args.iterations,
+        'scenarios': args.scenarios,
+        'seed': args.seed
+    }
+
+    print(f"{'route':<36} {'reqs':>6} {'err':>4} {'p50':>8} {'p95':>8} {'p99':>8} {'queries':>8}")
+    for route, stats in result['routes'].items():
+        print(f"{route:<36} {stats['requests']:>6} {stats['errors']:>4} {stats['p50_ms']:>8} "
+              f"{stats['p95_ms']:>8} {stats['p99_ms']:>8} {stats['queries_per_request'] or '-':>8}")
+    print(f"{result['requests']} requests in {result['elapsed_s']}s ({result['throughput_rps']} req/s), "
+          f"{result['errors']} errors")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(result, json.load(f), args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
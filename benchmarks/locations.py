@@ -0,0 +1,146 @@
+"""Time stock queries and order allocation with millions of location-stock rows.
+
+Seeds one user with --products products spread over --warehouses
+warehouses of --bins locations each, every product stocked in
+--per-product locations. It then times the pages that read the
+precomputed product totals (dashboard, /api/products/available) against
+summing the same availability from location stock, the per-location
+availability queries, and placing orders that allocate from locations.
+
+    python benchmarks/locations.py --products 200000 --per-product 5
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault('JOB_WORKERS', '0')
+
+import seed_data  # noqa: E402
+
+
+def spread_stock(app, user_id, warehouses, bins, per_product, rng):
+    """Replace the default location backfill with stock spread over many locations"""
+    db = app.db
+    now = datetime.utcnow()
+    locations = []
+    for w in range(warehouses):
+        warehouse = app.Warehouse(user_id=user_id, code=f'W{w:02d}', name=f'Warehouse {w}', priority=w)
+        db.session.add(warehouse)
+        db.session.flush()
+        rows = [{'user_id': user_id, 'warehouse_id': warehouse.id, 'code': f'BIN-{b:04d}', 'pick_sequence': b,
+                 'is_default': False, 'created_at': now} for b in range(bins)]
+        ids = db.session.execute(db.insert(app.StockLocation).returning(app.StockLocation.id,
+                                                                        sort_by_parameter_order=True), rows)
+        locations.extend((location_id, warehouse.id) for location_id in ids.scalars())
+    db.session.execute(db.delete(app.LocationStock))
+
+    rows = []
+    count = 0
+    products = db.session.query(app.Product.id, app.Product.quantity).filter_by(user_id=user_id).all()
+    for product_id, quantity in products:
+        chosen = rng.sample(locations, per_product)
+        cuts = sorted(rng.randint(0, quantity) for _ in range(per_product - 1))
+        for (location_id, warehouse_id), low, high in zip(chosen, [0] + cuts, cuts + [quantity]):
+            rows.append({'location_id': location_id, 'warehouse_id': warehouse_id, 'product_id': product_id,
+                         'quantity': high - low, 'updated_at': now})
+        if len(rows) >= seed_data.BATCH_SIZE:
+            count += len(rows)
+            seed_data._flush(app, app.LocationStock, rows)
+    count += len(rows)
+    seed_data._flush(app, app.LocationStock, rows)
+    db.session.commit()
+    return locations, [product_id for product_id, quantity in products if quantity > 100], count
+
+
+def timed(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=200000)
+    parser.add_argument('--warehouses', type=int, default=10)
+    parser.add_argument('--bins', type=int, default=100, help='locations per warehouse')
+    parser.add_argument('--per-product', type=int, default=5, help='locations each product is stocked in')
+    parser.add_argument('--orders', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix='locations-'), 'bench.db')
+    os.environ['ORDER_NODE_DIR'] = os.path.join(os.path.dirname(path), 'order-nodes')
+    app = seed_data.load_app(f'sqlite:///{path}')
+    seed_data.seed(app, users=1, products=args.products, orders=0, seed=args.seed)
+    rng = random.Random(args.seed)
+    with app.app.app_context():
+        app.migrations.upgrade(app.db.engine, app.db.metadata)
+        user_id = app.User.query.filter_by(username='bench0').one().id
+        started = time.perf_counter()
+        locations, stocked, count = spread_stock(app, user_id, args.warehouses, args.bins, args.per_product, rng)
+        print(f'{count} location stock rows in {len(locations)} locations, seeded in '
+              f'{time.perf_counter() - started:.1f}s')
+        app.db.session.execute(app.db.text('ANALYZE'))
+        app.db.session.commit()
+
+    client = app.app.test_client()
+    client.post('/login', data={'username': 'bench0', 'password': seed_data.PASSWORD})
+
+    def get(url):
+        app.response_cache.clear()
+        response = client.get(url)
+        assert response.status_code == 200, (url, response.status_code)
+
+    def summed_availability():
+        with app.app.app_context():
+            stock = app.LocationStock
+            return (app.db.session.query(stock.product_id, app.db.func.sum(stock.quantity))
+                    .join(app.Product, app.Product.id == stock.product_id)
+                    .filter(app.Product.user_id == user_id)
+                    .group_by(stock.product_id).having(app.db.func.sum(stock.quantity) > 0).all())
+
+    def rollup_availability():
+        with app.app.app_context():
+            product = app.Product
+            return (app.db.session.query(product.id, product.quantity)
+                    .filter(product.user_id == user_id, product.quantity > 0).all())
+
+    location_id, warehouse_id = locations[0]
+    product_id = stocked[0]
+    print(f"\n{'query':<40} {'ms':>9}")
+    for label, fn, repeat in [
+        ('/dashboard', lambda: get('/dashboard'), args.repeat),
+        ('/api/products/available', lambda: get('/api/products/available'), max(1, args.repeat // 5)),
+        ('availability from product totals', rollup_availability, max(1, args.repeat // 5)),
+        ('availability summed from locations', summed_availability, max(1, args.repeat // 5)),
+        ('/api/products/<id>/locations', lambda: get(f'/api/products/{product_id}/locations'), args.repeat),
+        ('/api/locations/<id>/stock', lambda: get(f'/api/locations/{location_id}/stock'), args.repeat),
+        ('/api/warehouses/<id>/stock', lambda: get(f'/api/warehouses/{warehouse_id}/stock'), args.repeat),
+    ]:
+        print(f'{label:<40} {timed(fn, repeat):>9.2f}')
+
+    for strategy in ('priority', 'largest_first', 'smallest_first'):
+        app.app.config['STOCK_ALLOCATION_STRATEGY'] = strategy
+
+        def place_order():
+            lines = rng.sample(stocked, 5)
+            response = client.post('/add_order', data={'customer_name': 'Bench', 'product_id[]': lines,
+                                                        'quantity[]': [str(rng.randint(1, 20))] * len(lines)})
+            assert response.status_code == 302, response.status_code
+
+        print(f'{"add_order, 5 lines, " + strategy:<40} {timed(place_order, args.orders // 3):>9.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Login and authenticated-request throughput.
+
+Logins are timed for each password hash method, and authenticated
+requests are timed with the user cache on (CACHE_BACKEND=memory) and
+off (CACHE_BACKEND=none). Every configuration runs in a fresh
+subprocess, because the app reads its settings at import time.
+
+    python benchmarks/login_throughput.py --logins 50 --requests 2000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import seed_data  # noqa: E402
+
+HASH_METHODS = ['pbkdf2:sha256:600000', 'pbkdf2:sha256:100000', 'scrypt:32768:8:1']
+
+
+def measure(config):
+    """Run one configuration and print a JSON result line (subprocess entry point)"""
+    os.environ.update(config['env'])
+    app = seed_data.load_app(config['database_url'])
+    from sqlalchemy import event
+    user_selects = []
+    with app.app.app_context():
+        event.listen(app.db.engine, 'before_cursor_execute',
+                     lambda conn, cursor, statement, *args: user_selects.append(1) if 'FROM user' in statement else None)
+    client = app.app.test_client()
+    credentials = {'username': 'bench0', 'password': seed_data.PASSWORD}
+    # The first login rehashes the seeded password to the configured method
+    client.post('/login', data=credentials).close()
+
+    result = {}
+    if config['logins']:
+        started = time.perf_counter()
+        for _ in range(config['logins']):
+            client.get('/logout').close()
+            response = client.post('/login', data=credentials)
+            response.close()
+            assert response.status_code == 302
+        result['logins_per_second'] = round(config['logins'] / (time.perf_counter() - started), 1)
+    if config['requests']:
+        client.get('/api/cache/stats').close()
+        user_selects.clear()
+        started = time.perf_counter()
+        for _ in range(config['requests']):
+            response = client.get('/api/cache/stats')
+            response.close()
+            assert response.status_code == 200
+        result['requests_per_second'] = round(config['requests'] / (time.perf_counter() - started), 1)
+        result['user_selects_per_request'] = round(len(user_selects) / config['requests'], 2)
+    print(json.dumps(result))
+
+
+def run(config):
+    output = subprocess.run([sys.executable, __file__, '--measure', json.dumps(config)],
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--logins', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--methods', nargs='+', default=HASH_METHODS)
+    parser.add_argument('--measure', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(json.loads(args.measure))
+        return
+
+    database_url = f'sqlite:///{os.path.join(tempfile.mkdtemp(prefix="login-bench-"), "bench.db")}'
+    seed_data.seed(seed_data.load_app(database_url), users=1, products=10, orders=0)
+
+    results = []
+    for method in args.methods:
+        result = run({'database_url': database_url, 'env': {'PASSWORD_HASH_METHOD': method},
+                      'logins': args.logins, 'requests': 0})
+        result.update(scenario='login', hash_method=method)
+        results.append(result)
+        print(f"login  {method:<24} {result['logins_per_second']:>8} logins/s")
+    for backend in ('none', 'memory'):
+        result = run({'database_url': database_url, 'env': {'CACHE_BACKEND': backend},
+                      'logins': 0, 'requests': args.requests})
+        result.update(scenario='authenticated request', cache_backend=backend)
+        results.append(result)
+        print(f"request cache={backend:<17} {result['requests_per_second']:>8} req/s  "
+              f"{result['user_selects_per_request']} user SELECTs per request")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""Time cancelling and deleting orders: large orders, and thousands at once.
+
+Seeds one user with --products products and places orders through
+/add_order. It then cancels and deletes orders of --lines lines the old
+way, one SELECT and one summary update per line as the views used to,
+and through transition_orders() and delete_orders(), counting the SQL
+statements each runs. Last, --bulk small orders are cancelled and then
+deleted with one /api/orders/bulk request each, against cancelling
+orders one /edit_order request at a time.
+
+    python benchmarks/orders.py --lines 500 --bulk 2000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault('JOB_WORKERS', '0')
+
+import seed_data  # noqa: E402
+
+
+def legacy_return(app, user_id, order):
+    # What edit_order and delete_order did before: one product read per line
+    categories = {}
+    for item in order.items:
+        product = app.db.session.get(app.Product, item.product_id)
+        if product and product.user_id == user_id:
+            before = app.stock_snapshot(product)
+            product.quantity += item.quantity
+            product.updated_at = datetime.utcnow()
+            app.record_stock_change(user_id, before, app.stock_snapshot(product))
+            categories[product.id] = product.category
+    app.release_allocations(user_id, [order.id], categories)
+    app.log_movements(user_id, [app.stock_movement('return', item.product_id, categories[item.product_id],
+                                                   item.quantity, item.unit_price, order.id)
+                                for item in order.items if item.product_id in categories])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=5000)
+    parser.add_argument('--lines', type=int, default=500, help='lines in each large order')
+    parser.add_argument('--bulk', type=int, default=2000, help='orders cancelled and deleted in one request')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix='orders-'), 'bench.db')
+    os.environ['ORDER_NODE_DIR'] = os.path.join(os.path.dirname(path), 'order-nodes')
+    app = seed_data.load_app(f'sqlite:///{path}')
+    seed_data.seed(app, users=1, products=args.products, orders=0, seed=args.seed)
+    rng = random.Random(args.seed)
+    with app.app.app_context():
+        app.migrations.upgrade(app.db.engine, app.db.metadata)
+        user_id = app.User.query.filter_by(username='bench0').one().id
+        stocked = [product_id for (product_id,) in app.db.session.query(app.Product.id).filter(
+            app.Product.user_id == user_id, app.Product.quantity > 100)]
+        engine = app.db.engine
+
+    client = app.app.test_client()
+    client.post('/login', data={'username': 'bench0', 'password': seed_data.PASSWORD})
+    statements = []
+    app.db.event.listen(engine, 'before_cursor_execute', lambda *_: statements.append(1))
+
+    def place(lines):
+        products = rng.sample(stocked, lines)
+        response = client.post('/add_order', data={'customer_name': 'Bench', 'product_id[]': products,
+                                                   'quantity[]': ['1'] * lines})
+        assert response.status_code == 302, response.status_code
+        with app.app.app_context():
+            return app.db.session.query(app.db.func.max(app.Order.id)).filter_by(user_id=user_id).scalar()
+
+    def run(fn, order_ids):
+        timings, counts = [], []
+        for order_id in order_ids:
+            with app.app.app_context():
+                statements.clear()
+                started = time.perf_counter()
+                fn(order_id)
+                app.db.session.commit()
+                timings.append((time.perf_counter() - started) * 1000)
+                counts.append(len(statements))
+        return statistics.median(timings), statistics.median(counts)
+
+    def old_cancel(order_id):
+        order = app.db.session.get(app.Order, order_id)
+        order.status = 'cancelled'
+        legacy_return(app, user_id, order)
+        app.bump_data_version(user_id)
+
+    def old_delete(order_id):
+        order = app.db.session.get(app.Order, order_id)
+        legacy_return(app, user_id, order)
+        app.bump_data_version(user_id)
+        app.db.session.delete(order)
+
+    def new_cancel(order_id):
+        assert app.transition_orders(user_id, [order_id], 'cancelled') == [order_id]
+        app.bump_data_version(user_id)
+
+    def new_delete(order_id):
+        app.bump_data_version(user_id)
+        assert app.delete_orders(user_id, [order_id]) == [order_id]
+
+    print(f'Placing {4 * args.repeat} orders of {args.lines} lines')
+    print(f"\n{f'{args.lines}-line order':<32} {'ms':>9} {'statements':>11}")
+    for label, fn in (('cancel, per-line loop', old_cancel), ('cancel, transition_orders', new_cancel),
+                      ('delete, per-line loop', old_delete), ('delete, delete_orders', new_delete)):
+        ms, count = run(fn, [place(args.lines) for _ in range(args.repeat)])
+        print(f'{label:<32} {ms:>9.2f} {count:>11.0f}')
+
+    print(f'\nPlacing {args.bulk + 200} orders of 5 lines')
+    single = [place(5) for _ in range(200)]
+    bulk = [place(5) for _ in range(args.bulk)]
+    started = time.perf_counter()
+    for order_id in single:
+        client.post(f'/edit_order/{order_id}', data={'customer_name': 'Bench', 'status': 'cancelled'})
+    per_order = (time.perf_counter() - started) / len(single)
+
+    print(f"\n{f'{args.bulk} orders':<32} {'ms':>9}")
+    print(f"{'cancel, one /edit_order each':<32} {per_order * args.bulk * 1000:>9.0f}  (extrapolated)")
+    for action in ('cancel', 'delete'):
+        started = time.perf_counter()
+        response = client.post('/api/orders/bulk', json={'action': action, 'order_ids': bulk})
+        elapsed = (time.perf_counter() - started) * 1000
+        assert response.get_json()['changed'] == len(bulk), response.get_json()
+        print(f"{f'{action}, one /api/orders/bulk':<32} {elapsed:>9.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Time CSV, XLSX and PDF report exports, cold and from the export cache.
+
+Seeds one user with --products products, then for each format times the
+first export, built by the report_export job, and a repeat download at
+the same data version, served from the file on disk. For comparison it
+also times the /report page and the /api/report JSON document.
+
+    python benchmarks/report_export.py --products 100000
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault('JOB_WORKERS', '0')
+
+import seed_data  # noqa: E402
+
+
+def timed(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='report-')
+    os.environ['JOB_FILES_DIR'] = os.path.join(directory, 'jobs')
+    app = seed_data.load_app(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+    seed_data.seed(app, users=1, products=args.products, orders=0, seed=args.seed)
+    with app.app.app_context():
+        app.migrations.upgrade(app.db.engine, app.db.metadata)
+
+    client = app.app.test_client()
+    client.post('/login', data={'username': 'bench0', 'password': seed_data.PASSWORD})
+
+    def get(url):
+        response = client.get(url)
+        assert response.status_code == 200, response.status_code
+        return response.get_data()
+
+    def uncached(url):
+        app.response_cache.clear()
+        return get(url)
+
+    print(f"{'request':<24} {'ms':>10} {'bytes':>12}")
+    for label, url in (('/report page', '/report'), ('/api/report JSON', '/api/report')):
+        size = len(uncached(url))
+        print(f'{label:<24} {timed(lambda: uncached(url), max(1, args.repeat // 10)):>10.1f} {size:>12}')
+
+    for fmt in ('csv', 'xlsx', 'pdf'):
+        url = f'/api/report/export?format={fmt}'
+        started = time.perf_counter()
+        response = client.post(url)
+        assert response.status_code == 202, response.status_code
+        with app.app.app_context():
+            app.job_queue.run_one()
+        cold = (time.perf_counter() - started) * 1000
+        size = len(get(url))
+        print(f'{fmt + " export, cold":<24} {cold:>10.1f} {size:>12}')
+        print(f'{fmt + " export, cached":<24} {timed(lambda: get(url), args.repeat):>10.1f} {size:>12}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""Time full-text product search on a large catalogue.
+
+Seeds --users users with --products products between them, named from a
+small vocabulary so that words repeat like they do in real catalogues,
+then times /api/products/search for common, rare, prefix and multi-word
+queries against the LIKE scan the search replaced.
+
+    python benchmarks/search.py --products 1000000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from werkzeug.security import generate_password_hash
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import seed_data  # noqa: E402
+
+ADJECTIVES = ['red', 'blue', 'green', 'black', 'steel', 'wooden', 'compact', 'heavy', 'wireless', 'premium',
+              'classic', 'mini', 'large', 'organic', 'portable', 'smart', 'vintage', 'ergonomic', 'rugged', 'soft']
+NOUNS = ['stapler', 'notebook', 'kettle', 'hammer', 'drill', 'lamp', 'chair', 'desk', 'router', 'speaker',
+         'blender', 'backpack', 'bottle', 'charger', 'keyboard', 'monitor', 'pan', 'shovel', 'tent', 'puzzle']
+MATERIALS = ['aluminium', 'bamboo', 'ceramic', 'cotton', 'glass', 'leather', 'nylon', 'plastic', 'rubber', 'walnut']
+
+QUERIES = [
+    ('common word', 'stapler'),
+    ('two words', 'wireless keyboard'),
+    ('prefix', 'ergo'),
+    ('short prefix', 'wa'),
+    ('model number', 'X4821'),
+    ('supplier', 'Supplier 17'),
+    ('no match', 'zeppelin'),
+]
+
+
+def seed_products(app, users, products, seed):
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    user_ids = []
+    password_hash = generate_password_hash(seed_data.PASSWORD, app.app.config['PASSWORD_HASH_METHOD'])
+    for u in range(users):
+        user = app.User(username=f'bench{u}', email=f'bench{u}@example.com', password_hash=password_hash)
+        app.db.session.add(user)
+        app.db.session.flush()
+        user_ids.append(user.id)
+    rows = []
+    for p in range(products):
+        name = f'{rng.choice(ADJECTIVES).title()} {rng.choice(NOUNS)} X{rng.randint(1000, 9999)}'
+        rows.append({
+            'name': name,
+            'category': rng.choice(seed_data.CATEGORIES),
+            'quantity': rng.randint(0, 500),
+            'price': round(rng.uniform(1, 500), 2),
+            'supplier': f'Supplier {rng.randint(1, 200)}',
+            'description': f'{rng.choice(MATERIALS)} {rng.choice(NOUNS)} with {rng.choice(ADJECTIVES)} finish',
+            'created_at': now,
+            'user_id': user_ids[p % users]
+        })
+        if len(rows) == seed_data.BATCH_SIZE:
+            seed_data._flush(app, app.Product, rows)
+    seed_data._flush(app, app.Product, rows)
+    app.db.session.commit()
+
+
+def timed(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix='search-'), 'bench.db')
+    app = seed_data.load_app(f'sqlite:///{path}')
+    with app.app.app_context():
+        app.migrations.upgrade(app.db.engine, app.db.metadata)
+        started = time.perf_counter()
+        seed_products(app, args.users, args.products, args.seed)
+        print(f'Seeded {args.products} products, indexed on insert, in {time.perf_counter() - started:.1f}s')
+        user_id = app.User.query.filter_by(username='bench0').one().id
+
+    client = app.app.test_client()
+    client.post('/login', data={'username': 'bench0', 'password': seed_data.PASSWORD})
+
+    def search(text):
+        app.response_cache.clear()
+        response = client.get('/api/products/search', query_string={'q': text})
+        assert response.status_code == 200, response.get_data()
+        return len(response.get_json()['products'])
+
+    def like_scan(text):
+        pattern = f'%{text}%'
+        product = app.Product
+        with app.app.app_context():
+            return (product.query.filter(product.user_id == user_id,
+                                         app.db.or_(product.name.ilike(pattern), product.description.ilike(pattern),
+                                                    product.supplier.ilike(pattern)))
+                    .order_by(product.id).limit(app.SEARCH_PAGE_SIZE).all())
+
+    print(f"\n{'query':<28} {'results':>7} {'search ms':>10} {'LIKE ms':>9}")
+    for label, text in QUERIES:
+        results = search(text)
+        search_ms = timed(lambda: search(text), args.repeat)
+        like_ms = timed(lambda: like_scan(text), max(1, args.repeat // 10))
+        print(f'{label + " (" + text + ")":<28} {results:>7} {search_ms:>10.2f} {like_ms:>9.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""Synthetic data generator for benchmarks.
+
+Seeds N users named bench0, bench1, ... (password "bench"), each with a
+catalogue of products and a history of orders. Generation is
+deterministic for a given --seed, so runs on different commits load the
+same data.
+
+    python benchmarks/seed_data.py sqlite:////tmp/bench.db --users 10 --products 1000 --orders 500
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from werkzeug.security import generate_password_hash
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PASSWORD = 'bench'
+CATEGORIES = ['Electronics', 'Office', 'Kitchen', 'Garden', 'Toys', 'Tools', 'Books', 'Sports']
+BATCH_SIZE = 5000
+
+
+def load_app(database_url):
+    os.environ['DATABASE_URL'] = database_url
+    sys.path.insert(0, ROOT)
+    import app
+    return app
+
+
+def _flush(app, model, rows):
+    if rows:
+        app.db.session.execute(app.db.insert(model), rows)
+        rows.clear()
+
+
+def seed(app, users=10, products=1000, orders=500, items=3, seed=0):
+    """Create users with products, orders and order items; return the usernames"""
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    usernames = []
+    with app.app.app_context():
+        app.db.create_all()
+        # Hashing is deliberately slow, so every user shares one hash
+        password_hash = generate_password_hash(PASSWORD, app.app.config['PASSWORD_HASH_METHOD'])
+        for u in range(users):
+            user = app.User(username=f'bench{u}', email=f'bench{u}@example.com', password_hash=password_hash)
+            app.db.session.add(user)
+            app.db.session.flush()
+            usernames.append(user.username)
+
+            product_rows = []
+            for p in range(products):
+                product_rows.append({
+                    'name': f'Product {u}-{p}',
+                    'category': rng.choice(CATEGORIES),
+                    'quantity': rng.choice([0, rng.randint(1, 9), rng.randint(10, 100000)]),
+                    'price': round(rng.uniform(1, 500), 2),
+                    'supplier': f'Supplier {rng.randint(1, 50)}',
+                    'description': 'Seeded benchmark product',
+                    'created_at': now - timedelta(minutes=rng.randint(0, 60 * 24 * 365)),
+                    'user_id': user.id
+                })
+                if len(product_rows) == BATCH_SIZE:
+                    _flush(app, app.Product, product_rows)
+            _flush(app, app.Product, product_rows)
+            catalogue = app.db.session.query(app.Product.id, app.Product.price).filter_by(user_id=user.id).all()
+
+            for o in range(orders):
+                created_at = now - timedelta(minutes=rng.randint(0, 60 * 24 * 90))
+                order = app.Order(order_number=f'BENCH{u:04d}{o:07d}', customer_name=f'Customer {rng.randint(1, 500)}',
+                                  status=rng.choice(['pending', 'completed', 'cancelled']),
+                                  created_at=created_at, user_id=user.id)
+                app.db.session.add(order)
+                app.db.session.flush()
+                total = 0.0
+                item_rows = []
+                for product_id, price in rng.sample(catalogue, k=min(items, len(catalogue))):
+                    quantity = rng.randint(1, 5)
+                    total += quantity * price
+                    item_rows.append({'order_id': order.id, 'product_id': product_id,
+                                      'quantity': quantity, 'unit_price': price})
+                _flush(app, app.OrderItem, item_rows)
+                order.total_amount = round(total, 2)
+            app.db.session.commit()
+        app.rebuild_summaries()
+        app.db.session.commit()
+    return usernames
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('database_url')
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--products', type=int, default=1000, help='products per user')
+    parser.add_argument('--orders', type=int, default=500, help='orders per user')
+    parser.add_argument('--items', type=int, default=3, help='items per order')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    app = load_app(args.database_url)
+    seed(app, args.users, args.products, args.orders, args.items, args.seed)
+    print(f'Seeded {args.users} users with {args.products} products and {args.orders} orders each '
+          f'in {time.perf_counter() - started:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
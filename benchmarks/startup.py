@@ -0,0 +1,90 @@
+"""Time a cold start: a fresh interpreter importing the app and serving its first requests.
+
+Each run starts a new Python process that imports app, calls
+create_app(), renders the login page and then serves a logged-in
+dashboard, the first request that touches the database. The process
+reports when each step finished; the parent also times the whole
+process, interpreter start-up included. Medians over --runs are
+printed, and the script exits with status 1 when the median time to the
+first dashboard exceeds --budget-ms, so it can gate a change in CI.
+
+    python benchmarks/startup.py --runs 10 --budget-ms 1500
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import seed_data  # noqa: E402
+
+CHILD = '''
+import json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {root!r})
+import app
+imported = time.perf_counter()
+flask_app = app.create_app()
+created = time.perf_counter()
+client = flask_app.test_client()
+assert client.get('/login').status_code == 200
+login_page = time.perf_counter()
+with flask_app.app_context():
+    user_id = app.User.query.filter_by(username='bench0').one().id
+with client.session_transaction() as session:
+    session['_user_id'] = str(user_id)
+assert client.get('/dashboard').status_code == 200
+dashboard = time.perf_counter()
+print(json.dumps({{'import': imported - started, 'create_app': created - imported,
+                  'login_page': login_page - created, 'dashboard': dashboard - login_page,
+                  'to_dashboard': dashboard - started}}))
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--budget-ms', type=float, default=1500,
+                        help='fail when the median time to the first dashboard is above this')
+    parser.add_argument('--products', type=int, default=1000)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='startup-')
+    url = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+    app = seed_data.load_app(url)
+    seed_data.seed(app, users=1, products=args.products, orders=100)
+    with app.app.app_context():
+        app.migrations.upgrade(app.db.engine, app.db.metadata)
+
+    env = dict(os.environ, DATABASE_URL=url, JOB_WORKERS='0',
+               ORDER_NODE_DIR=os.path.join(directory, 'order-nodes'))
+    child = CHILD.format(root=seed_data.ROOT)
+    runs = []
+    for _ in range(args.runs):
+        started = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', child], env=env, check=True,
+                                capture_output=True, text=True).stdout
+        steps = json.loads(output.strip().splitlines()[-1])
+        steps['process'] = time.perf_counter() - started
+        runs.append(steps)
+
+    print(f"{'step':<28} {'median ms':>10} {'max ms':>10}")
+    for step, label in (('import', 'import app'), ('create_app', 'create_app()'),
+                        ('login_page', 'first request (/login)'), ('dashboard', 'first query (/dashboard)'),
+                        ('to_dashboard', 'import to first dashboard'), ('process', 'whole process')):
+        values = [run[step] * 1000 for run in runs]
+        print(f'{label:<28} {statistics.median(values):>10.1f} {max(values):>10.1f}')
+
+    median = statistics.median(run['to_dashboard'] for run in runs) * 1000
+    if median > args.budget_ms:
+        print(f'Start-up took {median:.0f} ms, over the {args.budget_ms:.0f} ms budget')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
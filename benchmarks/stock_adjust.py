@@ -0,0 +1,86 @@
+"""Time the bulk stock adjustment API against editing products one by one.
+
+Seeds one user with --products products, then posts --adjustments stock
+changes to /api/products/adjust-stock in a single request: a mix of
+deltas and stocktake counts, a share of them guarded by the product's
+updated_at. For comparison it also times a sample of the same changes
+through the edit_product form, one round trip each, and extrapolates.
+
+    python benchmarks/stock_adjust.py --products 50000 --adjustments 50000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import seed_data  # noqa: E402
+
+
+def build_adjustments(products, count, rng):
+    adjustments = []
+    for product in rng.sample(products, k=min(count, len(products))):
+        if rng.random() < 0.5:
+            adjustment = {'product_id': product['id'], 'delta': rng.randint(-product['quantity'], 50)}
+        else:
+            adjustment = {'product_id': product['id'], 'quantity': rng.randint(0, 500)}
+        if rng.random() < 0.5:
+            adjustment['expected_updated_at'] = product['updated_at']
+        adjustments.append(adjustment)
+    return adjustments
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=50000)
+    parser.add_argument('--adjustments', type=int, default=50000)
+    parser.add_argument('--sample', type=int, default=200, help='products edited one at a time for comparison')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix='adjust-'), 'bench.db')
+    app = seed_data.load_app(f'sqlite:///{path}')
+    seed_data.seed(app, users=1, products=args.products, orders=0, seed=args.seed)
+    with app.app.app_context():
+        app.migrations.upgrade(app.db.engine, app.db.metadata)
+        products = [product.to_dict() for product in app.Product.query.all()]
+
+    client = app.app.test_client()
+    client.post('/login', data={'username': 'bench0', 'password': seed_data.PASSWORD})
+    rng = random.Random(args.seed)
+    adjustments = build_adjustments(products, args.adjustments, rng)
+
+    started = time.perf_counter()
+    response = client.post('/api/products/adjust-stock', json={'adjustments': adjustments})
+    elapsed = time.perf_counter() - started
+    assert response.status_code == 200, response.get_data()
+    report = response.get_json()
+    print(f"Bulk: {len(adjustments)} adjustments in {elapsed * 1000:.0f} ms "
+          f"({report['applied']} applied, {report['failed']} failed), one request and one commit")
+
+    with app.app.app_context():
+        # A fresh batch against the new updated_at values, without the JSON round trip
+        products = [product.to_dict() for product in app.Product.query.all()]
+        adjustments = build_adjustments(products, args.adjustments, rng)
+        user_id = app.User.query.filter_by(username='bench0').one().id
+        started = time.perf_counter()
+        report = app.adjust_stock(user_id, adjustments)
+        print(f"adjust_stock() alone: {len(adjustments)} adjustments in "
+              f"{(time.perf_counter() - started) * 1000:.0f} ms ({report['applied']} applied)")
+
+    sample = rng.sample(products, k=min(args.sample, len(products)))
+    started = time.perf_counter()
+    for product in sample:
+        form = {field: product[field] or '' for field in ('name', 'category', 'price', 'supplier', 'description')}
+        form['quantity'] = rng.randint(0, 500)
+        client.post(f"/edit_product/{product['id']}", data=form)
+    per_product = (time.perf_counter() - started) / max(len(sample), 1)
+    print(f'One at a time through edit_product: {per_product * 1000:.2f} ms each, '
+          f'about {per_product * len(adjustments):.1f}s for {len(adjustments)}')
+
+
+if __name__ == '__main__':
+    main()
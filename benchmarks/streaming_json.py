@@ -0,0 +1,120 @@
+"""Compare buffered and streaming /api/report responses.
+
+For each catalogue size the database is seeded once, then every mode is
+measured in a fresh subprocess so peak RSS reflects that request alone.
+
+    python benchmarks/streaming_json.py --sizes 10000 100000 1000000
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_app(database_url):
+    os.environ['DATABASE_URL'] = database_url
+    sys.path.insert(0, ROOT)
+    import app
+    return app
+
+
+def seed(database_url, rows):
+    app = load_app(database_url)
+    with app.app.app_context():
+        app.db.create_all()
+        user = app.User(username='bench', email='bench@example.com')
+        user.set_password('bench')
+        app.db.session.add(user)
+        app.db.session.commit()
+        batch = []
+        for i in range(rows):
+            batch.append({
+                'name': f'Product {i}',
+                'category': f'Category {i % 20}',
+                'quantity': i % 50,
+                'price': 1.0 + i % 100,
+                'supplier': f'Supplier {i % 200}',
+                'description': 'Seeded by the streaming benchmark',
+                'user_id': user.id
+            })
+            if len(batch) == 10000:
+                app.db.session.execute(app.db.insert(app.Product), batch)
+                batch = []
+        if batch:
+            app.db.session.execute(app.db.insert(app.Product), batch)
+        app.rebuild_summaries(user.id)
+        app.db.session.commit()
+
+
+def measure(database_url, stream):
+    """Run one request and print a JSON result line (subprocess entry point)"""
+    app = load_app(database_url)
+    client = app.app.test_client()
+    client.post('/login', data={'username': 'bench', 'password': 'bench'})
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    started = time.perf_counter()
+    response = client.get('/api/report', query_string={'stream': '1' if stream else '0'}, buffered=False)
+    first_byte = None
+    size = 0
+    for chunk in response.response:
+        if first_byte is None:
+            first_byte = time.perf_counter() - started
+        size += len(chunk)
+    total = time.perf_counter() - started
+    response.close()
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({
+        'ttfb_ms': round(first_byte * 1000, 1),
+        'total_ms': round(total * 1000, 1),
+        'bytes': size,
+        'peak_rss_mb': round(peak / 1024, 1),
+        'request_rss_mb': round((peak - baseline) / 1024, 1)
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--seed', help=argparse.SUPPRESS)
+    parser.add_argument('--measure', help=argparse.SUPPRESS)
+    parser.add_argument('--stream', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # Seeding and measuring run in subprocesses so each starts with a clean heap
+    if args.seed:
+        seed(args.seed, args.sizes[0])
+        return
+    if args.measure:
+        measure(args.measure, args.stream)
+        return
+
+    results = []
+    for rows in args.sizes:
+        workdir = tempfile.mkdtemp(prefix='stream-bench-')
+        database_url = f'sqlite:///{os.path.join(workdir, "bench.db")}'
+        subprocess.run([sys.executable, __file__, '--seed', database_url, '--sizes', str(rows)],
+                       check=True, stdout=subprocess.DEVNULL)
+        for stream in (False, True):
+            command = [sys.executable, __file__, '--measure', database_url]
+            if stream:
+                command.append('--stream')
+            output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            result.update(rows=rows, mode='streaming' if stream else 'buffered')
+            results.append(result)
+            print(f"{rows:>9} rows {result['mode']:>9}: ttfb {result['ttfb_ms']:>9} ms  "
+                  f"total {result['total_ms']:>9} ms  peak RSS {result['peak_rss_mb']:>7} MB  "
+                  f"({result['bytes']} bytes)")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""Write throughput with concurrent worker processes, before and after tuning.
+
+Each worker process imports the app on its own, logs in as its own user
+and alternates product writes, order placements and listing reads for a
+fixed duration. The run is repeated with SQLite's stock settings
+(rollback journal, synchronous=FULL, 2 MB cache) and with the defaults
+from database.py (WAL, synchronous=NORMAL, busy_timeout, larger cache).
+
+    python benchmarks/write_throughput.py --workers 8 --seconds 10
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CONFIGS = {
+    'before': {
+        'SQLITE_JOURNAL_MODE': 'DELETE',
+        'SQLITE_SYNCHRONOUS': 'FULL',
+        'SQLITE_CACHE_SIZE_KB': '2000',
+        'SQLITE_BUSY_TIMEOUT_MS': '5000'
+    },
+    'after': {}
+}
+
+
+def load_app(env):
+    os.environ.update(env)
+    sys.path.insert(0, ROOT)
+    import app
+    return app
+
+
+def seed(env, workers):
+    app = load_app(env)
+    with app.app.app_context():
+        app.db.create_all()
+        for i in range(workers):
+            user = app.User(username=f'worker{i}', email=f'worker{i}@example.com')
+            user.set_password('bench')
+            user.products.append(app.Product(name='Stock', category='Bench', quantity=10 ** 9, price=1.0))
+            app.db.session.add(user)
+        app.rebuild_summaries()
+        app.db.session.commit()
+
+
+def worker(env, index, seconds, results):
+    app = load_app(env)
+    client = app.app.test_client()
+    client.post('/login', data={'username': f'worker{index}', 'password': 'bench'})
+    product_id = client.get('/api/products').get_json()['products'][0]['id']
+    writes = reads = failures = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        response = client.post('/add_product', data={
+            'name': f'Item {writes}', 'category': 'Bench', 'quantity': '100', 'price': '2.50'
+        })
+        if response.status_code == 302:
+            writes += 1
+        else:
+            failures += 1
+        response = client.post('/add_order', data={
+            'customer_name': 'Bench', 'product_id[]': [str(product_id)], 'quantity[]': ['1']
+        })
+        if response.status_code == 302:
+            writes += 1
+        else:
+            failures += 1
+        response = client.get('/api/products', query_string={'limit': 50})
+        if response.status_code == 200:
+            reads += 1
+    results.put({'writes': writes, 'reads': reads, 'failures': failures})
+
+
+def run(name, workers, seconds):
+    workdir = tempfile.mkdtemp(prefix='write-bench-')
+    env = dict(CONFIGS[name], DATABASE_URL=f'sqlite:///{os.path.join(workdir, "bench.db")}')
+    context = multiprocessing.get_context('spawn')
+
+    seeder = context.Process(target=seed, args=(env, workers))
+    seeder.start()
+    seeder.join()
+
+    results = context.Queue()
+    processes = [context.Process(target=worker, args=(env, i, seconds, results)) for i in range(workers)]
+    for process in processes:
+        process.start()
+    totals = {'writes': 0, 'reads': 0, 'failures': 0}
+    for _ in processes:
+        for key, value in results.get(timeout=seconds + 120).items():
+            totals[key] += value
+    for process in processes:
+        process.join()
+
+    totals.update(config=name, workers=workers, seconds=seconds,
+                  writes_per_second=round(totals['writes'] / seconds, 1),
+                  reads_per_second=round(totals['reads'] / seconds, 1))
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    results = [run(name, args.workers, args.seconds) for name in CONFIGS]
+    for result in results:
+        print(f"{result['config']:>6}: {result['writes_per_second']:>8} writes/s  "
+              f"{result['reads_per_second']:>8} reads/s  {result['failures']} failed writes")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
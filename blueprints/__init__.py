@@ -0,0 +1,17 @@
+"""One blueprint per area of the app, registered by app.create_app().
+
+The modules import their helpers from app, so app imports this package
+only when it builds an app, never at import time.
+"""
+from blueprints.auth import auth_bp
+from blueprints.products import products_bp
+from blueprints.orders import orders_bp
+from blueprints.locations import locations_bp
+from blueprints.reports import reports_bp
+from blueprints.analytics import analytics_bp
+from blueprints.jobs import jobs_bp
+from blueprints.changes import changes_bp
+from blueprints.commands import commands_bp
+
+BLUEPRINTS = (auth_bp, products_bp, orders_bp, locations_bp, reports_bp, analytics_bp, jobs_bp, changes_bp,
+              commands_bp)
@@ -0,0 +1,188 @@
+"""Sales analytics and demand forecasts over the stats roll-ups"""
+from datetime import datetime, timedelta
+from flask import Blueprint, request, jsonify
+from flask_login import login_required, current_user
+from models import db, Product, STATS_FIELDS, ProductStats, CategoryStats, ProductForecast
+from app import parse_date, roll_up_movements, reorder_alerts, cached_json
+
+analytics_bp = Blueprint('analytics', __name__)
+
+ANALYTICS_DEFAULT_DAYS = 30
+ANALYTICS_MAX_DAYS = 5 * 366
+TOP_PRODUCTS_LIMIT = 10
+MAX_TOP_PRODUCTS_LIMIT = 100
+
+def analytics_range(args):
+    """Parse the period, start_date and end_date args of an analytics request"""
+    period = args.get('period', 'day')
+    if period not in ('day', 'week'):
+        raise ValueError('period must be day or week')
+    end_date = parse_date(args.get('end_date'), 'end_date')
+    end = end_date.date() if end_date else datetime.utcnow().date()
+    start_date = parse_date(args.get('start_date'), 'start_date')
+    start = start_date.date() if start_date else end - timedelta(days=ANALYTICS_DEFAULT_DAYS - 1)
+    if start > end:
+        raise ValueError('start_date must not be after end_date')
+    if (end - start).days >= ANALYTICS_MAX_DAYS:
+        raise ValueError(f'Date ranges are limited to {ANALYTICS_MAX_DAYS} days')
+    return period, start, end
+
+def analytics_cache_key(args):
+    # Without dates the window ends today, so the same URL changes answer at midnight
+    period, start, end = analytics_range(args)
+    return f'{period}:{start.isoformat()}:{end.isoformat()}'
+
+def refresh_analytics(user_id):
+    """Roll up any new ledger rows before answering an analytics query"""
+    if roll_up_movements(user_id):
+        db.session.commit()
+
+def stats_in_range(model, filters, start, end):
+    """Subquery of the stats rows that cover start..end exactly.
+
+    Whole weeks inside the range are read from the weekly rows and only the
+    ragged days at either edge from the daily ones, so a year costs about
+    sixty rows per product or category instead of 365. Each part is its own
+    SELECT so every one is a range search on (user_id, period, period_start).
+    """
+    first_week = start + timedelta(days=-start.weekday() % 7)
+    last_sunday = end - timedelta(days=(end.weekday() + 1) % 7)
+    if first_week > last_sunday:
+        ranges = [('day', start, end)]
+    else:
+        ranges = [('week', first_week, last_sunday - timedelta(days=6))]
+        if start < first_week:
+            ranges.append(('day', start, first_week - timedelta(days=1)))
+        if end > last_sunday:
+            ranges.append(('day', last_sunday + timedelta(days=1), end))
+    selects = [db.select(model).where(*filters, model.period == period, model.period_start.between(low, high))
+               for period, low, high in ranges]
+    return (db.union_all(*selects) if len(selects) > 1 else selects[0]).subquery()
+
+def _stats_sums(columns):
+    return [db.func.sum(getattr(columns, field)).label(field) for field in STATS_FIELDS]
+
+def _stats_dict(values):
+    stats = dict(zip(STATS_FIELDS, (value or 0 for value in values)))
+    stats['revenue'] = round(stats['revenue'], 2)
+    return stats
+
+def stats_series(model, filters, period, start, end):
+    """One entry per day or week of start..end, with empty buckets as zeros"""
+    if period == 'week':
+        start -= timedelta(days=start.weekday())
+    rows = (db.session.query(model.period_start, *_stats_sums(model))
+            .filter(*filters, model.period == period, model.period_start.between(start, end))
+            .group_by(model.period_start).all())
+    by_start = {row[0]: row[1:] for row in rows}
+    step = timedelta(days=7 if period == 'week' else 1)
+    series = []
+    bucket = start
+    while bucket <= end:
+        series.append(dict(period_start=bucket.isoformat(),
+                           **_stats_dict(by_start.get(bucket, (0,) * len(STATS_FIELDS)))))
+        bucket += step
+    return series
+
+@analytics_bp.route('/api/analytics/series')
+@login_required
+@cached_json(vary=analytics_cache_key)
+def api_analytics_series():
+    """Daily or weekly movement totals for a product, a category or everything"""
+    try:
+        period, start, end = analytics_range(request.args)
+        product_id = request.args.get('product_id', type=int)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    refresh_analytics(current_user.id)
+
+    if product_id is not None:
+        model = ProductStats
+        filters = [ProductStats.user_id == current_user.id, ProductStats.product_id == product_id]
+    else:
+        model = CategoryStats
+        filters = [CategoryStats.user_id == current_user.id]
+        if 'category' in request.args:
+            filters.append(CategoryStats.category == request.args['category'])
+    series = stats_series(model, filters, period, start, end)
+    totals = _stats_dict(sum(bucket[field] for bucket in series) for field in STATS_FIELDS)
+    return jsonify({
+        'period': period,
+        'start_date': start.isoformat(),
+        'end_date': end.isoformat(),
+        'totals': totals,
+        'series': series
+    })
+
+@analytics_bp.route('/api/analytics/categories')
+@login_required
+@cached_json(vary=analytics_cache_key)
+def api_analytics_categories():
+    """Movement totals per category over a date range, highest revenue first"""
+    try:
+        _, start, end = analytics_range(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    refresh_analytics(current_user.id)
+
+    stats = stats_in_range(CategoryStats, [CategoryStats.user_id == current_user.id], start, end)
+    rows = db.session.query(stats.c.category, *_stats_sums(stats.c)).group_by(stats.c.category).all()
+    categories = [dict(category=row[0], **_stats_dict(row[1:])) for row in rows]
+    categories.sort(key=lambda category: category['revenue'], reverse=True)
+    return jsonify({'start_date': start.isoformat(), 'end_date': end.isoformat(), 'categories': categories})
+
+@analytics_bp.route('/api/analytics/products')
+@login_required
+@cached_json(vary=analytics_cache_key)
+def api_analytics_products():
+    """Top products over a date range by one of the movement totals"""
+    metric = request.args.get('metric', 'revenue')
+    try:
+        _, start, end = analytics_range(request.args)
+        if metric not in STATS_FIELDS:
+            raise ValueError(f"metric must be one of {', '.join(STATS_FIELDS)}")
+        limit = min(request.args.get('limit', TOP_PRODUCTS_LIMIT, type=int), MAX_TOP_PRODUCTS_LIMIT)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    refresh_analytics(current_user.id)
+
+    # Rank on the one counter first, then total up only the winners
+    stats = stats_in_range(ProductStats, [ProductStats.user_id == current_user.id], start, end)
+    ranking = db.func.sum(stats.c[metric])
+    top_ids = [row[0] for row in db.session.query(stats.c.product_id)
+                                            .group_by(stats.c.product_id)
+                                            .order_by(ranking.desc(), stats.c.product_id)
+                                            .limit(max(limit, 1))]
+    stats = stats_in_range(ProductStats, [ProductStats.user_id == current_user.id,
+                                          ProductStats.product_id.in_(top_ids)], start, end)
+    totals = {row[0]: _stats_dict(row[1:])
+              for row in db.session.query(stats.c.product_id, *_stats_sums(stats.c)).group_by(stats.c.product_id)}
+    names = dict(db.session.query(Product.id, Product.name)
+                 .filter(Product.user_id == current_user.id, Product.id.in_(top_ids)).all())
+    products = [dict(product_id=product_id, name=names.get(product_id), **totals[product_id])
+                for product_id in top_ids]
+    return jsonify({
+        'metric': metric,
+        'start_date': start.isoformat(),
+        'end_date': end.isoformat(),
+        'products': products
+    })
+
+REORDER_LIST_LIMIT = 50
+MAX_REORDER_LIST_LIMIT = 500
+
+@analytics_bp.route('/api/forecast/reorder')
+@login_required
+@cached_json
+def api_reorder_suggestions():
+    """Products at or below their reorder point, with suggested quantities"""
+    limit = min(request.args.get('limit', REORDER_LIST_LIMIT, type=int), MAX_REORDER_LIST_LIMIT)
+    return jsonify({'products': reorder_alerts(current_user.id, max(limit, 1))})
+
+@analytics_bp.route('/api/products/<int:product_id>/forecast')
+@login_required
+def api_product_forecast(product_id):
+    forecast = db.session.get(ProductForecast, product_id)
+    if forecast is None or forecast.user_id != current_user.id:
+        return jsonify({'error': 'No forecast for this product; run a forecast job first'}), 404
+    return jsonify(forecast.to_dict())
@@ -0,0 +1,57 @@
+"""The change feed: long-poll and server-sent events over the change log"""
+import time
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
+from flask_login import login_required, current_user
+from models import db, ChangeLog
+from app import MAX_CHANGE_PAGE_SIZE, read_changes, compacted_through, stream_changes
+
+changes_bp = Blueprint('changes', __name__)
+
+CHANGE_PAGE_SIZE = 500
+MAX_CHANGE_WAIT_SECONDS = 30
+CHANGE_ENTITIES = ('product', 'order')
+
+@changes_bp.route('/api/changes')
+@login_required
+def api_changes():
+    """Product and order changes after ?since=<seq>, oldest first.
+
+    With ?wait=N the request waits up to N seconds for a change when there
+    is none yet (long polling). Clients that accept text/event-stream get a
+    stream of server-sent events instead.
+    """
+    since = request.headers.get('Last-Event-ID') or request.args.get('since', '0')
+    if not since.isdigit():
+        return jsonify({'error': 'since must be a sequence number'}), 400
+    since = int(since)
+    entity = request.args.get('entity')
+    if entity is not None and entity not in CHANGE_ENTITIES:
+        return jsonify({'error': f"entity must be one of {', '.join(CHANGE_ENTITIES)}"}), 400
+    entity_id = request.args.get('entity_id', type=int)
+    if since < compacted_through(current_user.id):
+        latest = db.session.query(db.func.max(ChangeLog.id)).filter(ChangeLog.user_id == current_user.id).scalar()
+        return jsonify({'error': 'Changes after this sequence number were compacted; reload products '
+                                 'and orders, then resume from latest', 'latest': latest or 0}), 410
+
+    if request.accept_mimetypes.best_match(['application/json', 'text/event-stream']) == 'text/event-stream':
+        return Response(stream_with_context(stream_changes(current_user.id, since, entity, entity_id)),
+                        mimetype='text/event-stream', headers={'Cache-Control': 'no-cache',
+                                                               'X-Accel-Buffering': 'no'})
+
+    limit = min(max(request.args.get('limit', CHANGE_PAGE_SIZE, type=int), 1), MAX_CHANGE_PAGE_SIZE)
+    wait = min(max(request.args.get('wait', 0, type=float), 0), MAX_CHANGE_WAIT_SECONDS)
+    notifier = current_app.extensions['change_notifier']
+    deadline = time.monotonic() + wait
+    while True:
+        position = notifier.position(current_user.id)
+        changes = read_changes(current_user.id, since, limit, entity, entity_id)
+        remaining = deadline - time.monotonic()
+        if changes or remaining <= 0:
+            break
+        db.session.close()
+        notifier.wait(current_user.id, position, min(remaining, current_app.config['CHANGE_FEED_POLL_SECONDS']))
+    return jsonify({
+        'changes': changes,
+        'next': changes[-1]['seq'] if changes else since,
+        'more': len(changes) == limit
+    })
@@ -0,0 +1,262 @@
+"""The `flask <command>` CLI: schema, maintenance, imports and exports"""
+import time
+from datetime import datetime, timedelta
+import click
+from flask import Blueprint, current_app
+import database
+import migrations
+import sharding
+from models import (db, User, Product, InventorySummary, CategorySummary, StockMovement, ProductStats, CategoryStats,
+                    AnalyticsWatermark)
+from app import (rebuild_summaries, bump_data_version, has_search_index, LOCATION_BATCH_SIZE, sync_location_stock,
+                 roll_up_movements, backfill_stock_ledger, compute_forecasts, IMPORT_CHUNK_SIZE,
+                 PRODUCT_EXPORT_FIELDS, ORDER_EXPORT_FIELDS, read_import_rows, import_products, iter_products,
+                 iter_orders, stream_csv, stream_ndjson, job_queue, ANALYTICS_TABLES, compact_changes,
+                 hot_page_query_plans, user_scope, user_data_scopes)
+
+commands_bp = Blueprint('commands', __name__, cli_group=None)  # flask <command>, no group
+
+@commands_bp.cli.command('init-db')
+def init_db_command():
+    """Apply pending schema migrations, then rebuild the summaries"""
+    for revision, description in migrations.upgrade(db.engine, db.metadata):
+        print(f"Applied {revision}: {description}")
+    # Opening a tenant shard applies its migrations
+    for user_id, engine in user_data_scopes():
+        rebuild_summaries(user_id)
+        db.session.commit()
+        with engine.begin() as connection:
+            database.analyze(connection, ANALYTICS_TABLES)
+    print("Database schema is up to date")
+
+@commands_bp.cli.command('create-test-user')
+def create_test_user_command():
+    """Create the admin / admin123 login if there are no users yet"""
+    if User.query.count() == 0:
+        test_user = User(username='admin', email='admin@example.com')
+        test_user.set_password('admin123')
+        db.session.add(test_user)
+        db.session.commit()
+        print("Test user created: admin / admin123")
+
+@commands_bp.cli.command('db-status')
+def db_status_command():
+    """List schema migrations and whether each one has been applied"""
+    with db.engine.begin() as connection:
+        applied = migrations.applied_revisions(connection)
+    for revision, description, _ in migrations.MIGRATIONS:
+        print(f"{'applied' if revision in applied else 'pending':>8}  {revision}  {description}")
+
+# Tables `flask init-db` fills in a new shard; shard-tenants replaces their rows
+SHARD_REBUILT_TABLES = frozenset({InventorySummary.__tablename__, CategorySummary.__tablename__})
+
+@commands_bp.cli.command('shard-tenants')
+@click.option('--user', 'username', default=None, help='Only this user; every user by default')
+def shard_tenants_command(username):
+    """Copy each user's rows from the shared database into their own shard.
+
+    Run it with the app stopped, before serving with TENANT_SHARDING on;
+    writes made in between would stay behind in the shared database.
+    Shards that already hold rows are skipped, so it can be run again.
+    """
+    shards = current_app.extensions.get('tenant_shards')
+    if shards is None:
+        raise click.ClickException('Set TENANT_SHARDING=1 to copy users into their shards')
+    users = [_cli_user(username)] if username else User.query.order_by(User.id).all()
+    for user in users:
+        shard = shards.engine(user.id)
+        counts = sharding.tenant_row_counts(shard, db.metadata, user.id)
+        if any(count for table, count in counts.items() if table not in SHARD_REBUILT_TABLES):
+            print(f"{user.username}: shard already has data, skipped")
+            continue
+        started = time.perf_counter()
+        copied = sharding.copy_tenant(db.engine, shard, db.metadata, user.id, replace=SHARD_REBUILT_TABLES)
+        if copied != sharding.tenant_row_counts(shard, db.metadata, user.id):
+            raise click.ClickException(f'{user.username}: row counts in the shard do not match the copy')
+        with shard.begin() as connection:
+            database.analyze(connection, ANALYTICS_TABLES)
+        print(f"{user.username}: copied {sum(copied.values())} rows in {time.perf_counter() - started:.2f}s")
+    shards.dispose()
+
+@commands_bp.cli.command('check-query-plans')
+@click.option('--user', 'username', default='admin', show_default=True)
+@click.option('--verbose', is_flag=True, help='Print the plan of every statement')
+def check_query_plans_command(username, verbose):
+    """Fail if a hot page runs a query that scans a whole table"""
+    user = _cli_user(username)
+    try:
+        pages, plans = hot_page_query_plans(user.id)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    failures = 0
+    for statement, plan, scanned in plans:
+        if scanned or verbose:
+            print(' '.join(statement.split()))
+            for detail in plan:
+                print(f'    {detail}')
+        if scanned:
+            failures += 1
+            print(f"    FULL SCAN of {', '.join(scanned)}")
+    print(f"Checked {len(plans)} statements from {len(pages)} pages, {failures} with full scans")
+    if failures:
+        raise SystemExit(1)
+
+@commands_bp.cli.command('run-jobs')
+@click.option('--workers', default=2, show_default=True)
+def run_jobs_command(workers):
+    """Run background job workers in the foreground until interrupted"""
+    job_queue.start(workers)
+    print(f"Running {workers} job workers, press Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        job_queue.stop()
+
+@commands_bp.cli.command('backfill-stock-ledger')
+def backfill_stock_ledger_command():
+    """Log existing order history in the stock ledger and roll it up"""
+    inserted = 0
+    for _, engine in user_data_scopes():
+        inserted += backfill_stock_ledger()
+        user_ids = [row[0] for row in db.session.query(StockMovement.user_id).distinct()]
+        for user_id in user_ids:
+            roll_up_movements(user_id)
+            bump_data_version(user_id)
+        db.session.commit()
+        with engine.begin() as connection:
+            database.analyze(connection, ANALYTICS_TABLES)
+    print(f"Logged {inserted} stock movements from order history")
+
+@commands_bp.cli.command('rebuild-analytics')
+def rebuild_analytics_command():
+    """Recompute the daily and weekly stats from the whole stock ledger"""
+    folded = 0
+    for _, engine in user_data_scopes():
+        db.session.query(ProductStats).delete()
+        db.session.query(CategoryStats).delete()
+        db.session.query(AnalyticsWatermark).delete()
+        for (user_id,) in db.session.query(StockMovement.user_id).distinct().all():
+            folded += roll_up_movements(user_id)
+            bump_data_version(user_id)
+        db.session.commit()
+        with engine.begin() as connection:
+            database.analyze(connection, ANALYTICS_TABLES)
+    print(f"Rolled up {folded} stock movements")
+
+@commands_bp.cli.command('forecast')
+@click.option('--user', 'username', default=None, help='Only this user; every user by default')
+def forecast_command(username):
+    """Recompute demand forecasts and reorder points"""
+    users = [_cli_user(username)] if username else User.query.all()
+    for user in users:
+        started = time.perf_counter()
+        with user_scope(user.id):
+            forecast = compute_forecasts(user.id)
+            bump_data_version(user.id)
+            db.session.commit()
+        print(f"{user.username}: forecast {forecast} products in {time.perf_counter() - started:.2f}s")
+
+@commands_bp.cli.command('compact-changes')
+@click.option('--days', type=float, default=None,
+              help='Keep every change newer than this; CHANGE_LOG_RETENTION_DAYS by default')
+def compact_changes_command(days):
+    """Drop old change log entries, keeping the latest one for each product and order"""
+    days = current_app.config['CHANGE_LOG_RETENTION_DAYS'] if days is None else days
+    before = datetime.utcnow() - timedelta(days=days)
+    removed = 0
+    for scope_user_id, _ in user_data_scopes():
+        user_ids = [scope_user_id] if scope_user_id is not None else [
+            user_id for (user_id,) in db.session.query(User.id).order_by(User.id)]
+        for user_id in user_ids:
+            removed += compact_changes(user_id, before)
+            db.session.commit()
+    print(f"Removed {removed} change log entries older than {days:g} days")
+
+@commands_bp.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Rebuild and optimize the full-text product search index"""
+    for _, engine in user_data_scopes():
+        if not has_search_index():
+            raise click.ClickException('The search index needs SQLite; run `flask init-db` first')
+        with engine.begin() as connection:
+            connection.exec_driver_sql("INSERT INTO product_search(product_search) VALUES ('rebuild')")
+            connection.exec_driver_sql("INSERT INTO product_search(product_search) VALUES ('optimize')")
+    print("Search index rebuilt")
+
+@commands_bp.cli.command('rebuild-summaries')
+def rebuild_summaries_command():
+    """Recompute the materialized inventory summaries for every user"""
+    for user_id, _ in user_data_scopes():
+        rebuild_summaries(user_id)
+        db.session.commit()
+    print("Inventory summaries rebuilt")
+
+@commands_bp.cli.command('sync-location-stock')
+def sync_location_stock_command():
+    """Reconcile per-location stock with product totals written outside the app"""
+    products = 0
+    for _ in user_data_scopes():
+        for (user_id,) in db.session.query(Product.user_id).distinct().all():
+            last_id = 0
+            while True:
+                batch = [product_id for (product_id,) in
+                         db.session.query(Product.id).filter(Product.user_id == user_id, Product.id > last_id)
+                         .order_by(Product.id).limit(LOCATION_BATCH_SIZE)]
+                if not batch:
+                    break
+                sync_location_stock(user_id, batch)
+                db.session.commit()
+                db.session.expunge_all()
+                products += len(batch)
+                last_id = batch[-1]
+    print(f"Checked the locations of {products} products")
+
+def _cli_user(username):
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        raise click.ClickException(f'No user named {username}')
+    return user
+
+@commands_bp.cli.command('import-products')
+@click.argument('source', type=click.File('rb'))
+@click.option('--user', 'username', required=True, help='Owner of the imported products')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), default=None,
+              help='Input format; guessed from the file extension by default')
+@click.option('--upsert', is_flag=True, help='Update products whose id column matches an existing product')
+@click.option('--chunk-size', default=IMPORT_CHUNK_SIZE, show_default=True)
+def import_products_command(source, username, fmt, upsert, chunk_size):
+    """Bulk import products from a CSV or NDJSON file"""
+    user = _cli_user(username)
+    fmt = fmt or ('ndjson' if source.name.endswith(('.ndjson', '.jsonl')) else 'csv')
+    with user_scope(user.id):
+        report = import_products(user.id, read_import_rows(source, fmt), upsert=upsert, chunk_size=chunk_size)
+    for error in report['errors']:
+        print(f"line {error['line']}: {error['error']}")
+    print(f"Inserted {report['inserted']}, updated {report['updated']}, rejected {report['error_count']}")
+
+@commands_bp.cli.command('export-products')
+@click.argument('destination', type=click.File('w'), default='-')
+@click.option('--user', 'username', required=True)
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), default='csv', show_default=True)
+def export_products_command(destination, username, fmt):
+    """Stream a user's products to a CSV or NDJSON file"""
+    user = _cli_user(username)
+    with user_scope(user.id):
+        rows = iter_products(user.id)
+        chunks = stream_csv(rows, PRODUCT_EXPORT_FIELDS) if fmt == 'csv' else stream_ndjson(rows)
+        for chunk in chunks:
+            destination.write(chunk)
+
+@commands_bp.cli.command('export-orders')
+@click.argument('destination', type=click.File('w'), default='-')
+@click.option('--user', 'username', required=True)
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), default='csv', show_default=True)
+def export_orders_command(destination, username, fmt):
+    """Stream a user's orders with their items to a CSV or NDJSON file"""
+    user = _cli_user(username)
+    with user_scope(user.id):
+        rows = iter_orders(user.id)
+        chunks = stream_csv(rows, ORDER_EXPORT_FIELDS) if fmt == 'csv' else stream_ndjson(rows)
+        for chunk in chunks:
+            destination.write(chunk)
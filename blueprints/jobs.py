@@ -0,0 +1,72 @@
+"""Queueing background jobs and reading their status and results"""
+import json
+import os
+import secrets
+import shutil
+from flask import Blueprint, current_app, request, jsonify, send_from_directory
+from flask_login import login_required, current_user
+from models import Job
+from app import import_format, job_queue, job_file_path, job_accepted
+
+jobs_bp = Blueprint('jobs', __name__)
+
+JOB_LIST_LIMIT = 50
+
+@jobs_bp.route('/api/jobs')
+@login_required
+def api_jobs():
+    jobs = (Job.query.filter_by(user_id=current_user.id)
+            .order_by(Job.created_at.desc(), Job.id.desc()).limit(JOB_LIST_LIMIT).all())
+    return jsonify({'jobs': [job.to_dict() for job in jobs]})
+
+@jobs_bp.route('/api/jobs/<int:job_id>')
+@login_required
+def api_job(job_id):
+    job = Job.query.filter_by(id=job_id, user_id=current_user.id).first_or_404()
+    return jsonify(job.to_dict())
+
+@jobs_bp.route('/api/jobs/<int:job_id>/result')
+@login_required
+def api_job_result(job_id):
+    job = Job.query.filter_by(id=job_id, user_id=current_user.id).first_or_404()
+    if job.status != 'completed':
+        return jsonify({'error': f'Job is {job.status}'}), 409
+    result = json.loads(job.result)
+    if 'file' in result:
+        return send_from_directory(current_app.config['JOB_FILES_DIR'], result['file'], as_attachment=True)
+    return jsonify(result)
+
+@jobs_bp.route('/api/jobs/report', methods=['POST'])
+@login_required
+def api_job_report():
+    return job_accepted(job_queue.enqueue('report', current_user.id))
+
+@jobs_bp.route('/api/jobs/import', methods=['POST'])
+@login_required
+def api_job_import():
+    upload = request.files.get('file')
+    fmt = import_format(upload)
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({'error': 'Format must be csv or ndjson'}), 400
+
+    # The upload is spooled to disk so the request can return right away
+    name = f'upload-{secrets.token_hex(8)}.{fmt}'
+    os.makedirs(current_app.config['JOB_FILES_DIR'], exist_ok=True)
+    with open(job_file_path(name), 'wb') as f:
+        shutil.copyfileobj(upload.stream if upload else request.stream, f)
+    params = {'file': name, 'format': fmt, 'upsert': request.args.get('mode') == 'upsert'}
+    return job_accepted(job_queue.enqueue('import_products', current_user.id, params))
+
+@jobs_bp.route('/api/jobs/cancel-orders', methods=['POST'])
+@login_required
+def api_job_cancel_orders():
+    data = request.get_json(silent=True) or {}
+    order_ids = data.get('order_ids')
+    if not isinstance(order_ids, list) or not all(isinstance(order_id, int) for order_id in order_ids):
+        return jsonify({'error': 'order_ids must be a list of order ids'}), 400
+    return job_accepted(job_queue.enqueue('cancel_orders', current_user.id, {'order_ids': order_ids}))
+
+@jobs_bp.route('/api/jobs/forecast', methods=['POST'])
+@login_required
+def api_job_forecast():
+    return job_accepted(job_queue.enqueue('forecast', current_user.id))
@@ -0,0 +1,247 @@
+"""Warehouses, stock locations and transfers between them"""
+from datetime import datetime
+from flask import Blueprint, request, jsonify
+from flask_login import login_required, current_user
+from models import db, Product, Order, Warehouse, StockLocation, LocationStock, StockAllocation
+from app import (stock_snapshot, record_stock_change, bump_data_version, encode_cursor, decode_cursor,
+                 location_stock_entries, put_in_location, sync_location_stock, stock_movement, log_movements,
+                 log_changes, parse_adjustment)
+
+locations_bp = Blueprint('locations', __name__)
+
+LOCATION_PAGE_SIZE = 100
+MAX_LOCATION_PAGE_SIZE = 1000
+
+def location_page_args(args):
+    """(limit, last product id) for a page of stock rows keyed by product id"""
+    limit = min(max(args.get('limit', LOCATION_PAGE_SIZE, type=int), 1), MAX_LOCATION_PAGE_SIZE)
+    after = 0
+    if args.get('cursor'):
+        _, after = decode_cursor(args['cursor'], 'product_id', 'asc')
+    return limit, after
+
+def stock_page(rows, limit):
+    """Trim rows fetched with limit + 1 to a page, returning (rows, next_cursor)"""
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor('product_id', 'asc', None, rows[-1][0])
+    return rows, None
+
+@locations_bp.route('/api/warehouses')
+@login_required
+def api_warehouses():
+    warehouses = (Warehouse.query.filter_by(user_id=current_user.id)
+                  .options(db.selectinload(Warehouse.locations))
+                  .order_by(Warehouse.priority, Warehouse.id).all())
+    return jsonify({'warehouses': [
+        dict(warehouse.to_dict(), locations=[
+            location.to_dict()
+            for location in sorted(warehouse.locations, key=lambda location: (location.pick_sequence, location.id))
+        ])
+        for warehouse in warehouses
+    ]})
+
+@locations_bp.route('/api/warehouses', methods=['POST'])
+@login_required
+def api_create_warehouse():
+    data = request.get_json(silent=True) or {}
+    code = str(data.get('code') or '').strip()
+    name = str(data.get('name') or code).strip()
+    priority = data.get('priority', 0)
+    if not code or len(code) > 20:
+        return jsonify({'error': 'code is required and may be up to 20 characters'}), 400
+    if isinstance(priority, bool) or not isinstance(priority, int):
+        return jsonify({'error': 'priority must be an integer'}), 400
+    if Warehouse.query.filter_by(user_id=current_user.id, code=code).first():
+        return jsonify({'error': f'Warehouse {code} already exists'}), 409
+
+    warehouse = Warehouse(user_id=current_user.id, code=code, name=name[:100], priority=priority)
+    db.session.add(warehouse)
+    bump_data_version(current_user.id)
+    db.session.commit()
+    return jsonify(warehouse.to_dict()), 201
+
+@locations_bp.route('/api/warehouses/<int:warehouse_id>/locations', methods=['POST'])
+@login_required
+def api_create_location(warehouse_id):
+    warehouse = Warehouse.query.filter_by(id=warehouse_id, user_id=current_user.id).first_or_404()
+    data = request.get_json(silent=True) or {}
+    code = str(data.get('code') or '').strip()
+    pick_sequence = data.get('pick_sequence', 0)
+    if not code or len(code) > 30:
+        return jsonify({'error': 'code is required and may be up to 30 characters'}), 400
+    if isinstance(pick_sequence, bool) or not isinstance(pick_sequence, int):
+        return jsonify({'error': 'pick_sequence must be an integer'}), 400
+    if StockLocation.query.filter_by(warehouse_id=warehouse.id, code=code).first():
+        return jsonify({'error': f'Location {code} already exists in {warehouse.code}'}), 409
+
+    location = StockLocation(user_id=current_user.id, warehouse_id=warehouse.id, code=code,
+                             pick_sequence=pick_sequence)
+    db.session.add(location)
+    bump_data_version(current_user.id)
+    db.session.commit()
+    return jsonify(location.to_dict()), 201
+
+@locations_bp.route('/api/warehouses/<int:warehouse_id>/stock')
+@login_required
+def api_warehouse_stock(warehouse_id):
+    """Quantity of each product in a warehouse, summed over its locations, by product id"""
+    warehouse = Warehouse.query.filter_by(id=warehouse_id, user_id=current_user.id).first_or_404()
+    try:
+        limit, after = location_page_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    quantity = db.func.sum(LocationStock.quantity)
+    rows = (db.session.query(LocationStock.product_id, quantity)
+            .filter(LocationStock.warehouse_id == warehouse.id, LocationStock.product_id > after)
+            .group_by(LocationStock.product_id).having(quantity > 0)
+            .order_by(LocationStock.product_id).limit(limit + 1).all())
+    rows, next_cursor = stock_page(rows, limit)
+    names = dict(db.session.query(Product.id, Product.name).filter(Product.id.in_([row[0] for row in rows])))
+    return jsonify({
+        'warehouse': warehouse.to_dict(),
+        'products': [{'product_id': product_id, 'name': names.get(product_id), 'quantity': quantity}
+                     for product_id, quantity in rows],
+        'next_cursor': next_cursor
+    })
+
+@locations_bp.route('/api/locations/<int:location_id>/stock')
+@login_required
+def api_location_stock(location_id):
+    """Products held in one location, by product id"""
+    location = StockLocation.query.filter_by(id=location_id, user_id=current_user.id).first_or_404()
+    try:
+        limit, after = location_page_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    rows = (db.session.query(LocationStock.product_id, LocationStock.quantity, Product.name)
+            .join(Product, Product.id == LocationStock.product_id)
+            .filter(LocationStock.location_id == location.id, LocationStock.product_id > after,
+                    LocationStock.quantity > 0)
+            .order_by(LocationStock.product_id).limit(limit + 1).all())
+    rows, next_cursor = stock_page(rows, limit)
+    return jsonify({
+        'location': location.to_dict(),
+        'products': [{'product_id': product_id, 'name': name, 'quantity': quantity}
+                     for product_id, quantity, name in rows],
+        'next_cursor': next_cursor
+    })
+
+@locations_bp.route('/api/locations/<int:location_id>/stock', methods=['POST'])
+@login_required
+def api_adjust_location_stock(location_id):
+    """Count or adjust one product's stock in one location; the product total follows.
+
+    Takes the same fields as an /api/products/adjust-stock entry.
+    """
+    location = StockLocation.query.filter_by(id=location_id, user_id=current_user.id).first_or_404()
+    adjustment, error = parse_adjustment(request.get_json(silent=True))
+    if error:
+        return jsonify({'error': error}), 400
+    product_id, delta, quantity, expected = adjustment
+
+    bump_data_version(current_user.id)
+    product = Product.query.filter_by(id=product_id, user_id=current_user.id).with_for_update().first()
+    if product is None:
+        db.session.rollback()
+        return jsonify({'error': f'Product #{product_id} was not found'}), 404
+    if expected is not None and expected != product.updated_at:
+        db.session.rollback()
+        return jsonify({'error': 'Product was changed since it was read'}), 409
+
+    sync_location_stock(current_user.id, [product.id])
+    stock = put_in_location(location_stock_entries([product.id]).get(product.id, []), product.id, location, 0)
+    new_quantity = quantity if quantity is not None else stock.quantity + delta
+    if new_quantity < 0:
+        db.session.rollback()
+        return jsonify({'error': f'Only {stock.quantity} in {location.code}; cannot remove {-delta}'}), 400
+
+    before = stock_snapshot(product)
+    change = new_quantity - stock.quantity
+    stock.quantity = new_quantity
+    product.quantity += change
+    product.updated_at = datetime.utcnow()
+    record_stock_change(current_user.id, before, stock_snapshot(product))
+    log_movements(current_user.id, [stock_movement('adjustment', product.id, product.category, change)])
+    log_changes(current_user.id, 'product', 'update', {product.id: product.to_dict()},
+                {product.id: {'quantity': before[1]}})
+    db.session.commit()
+    return jsonify({'product_id': product.id, 'location_id': location.id, 'quantity': stock.quantity,
+                    'total_quantity': product.quantity, 'updated_at': product.updated_at.isoformat()})
+
+@locations_bp.route('/api/stock/transfer', methods=['POST'])
+@login_required
+def api_transfer_stock():
+    """Move stock of one product between two locations; its total is unchanged"""
+    data = request.get_json(silent=True) or {}
+    fields = ('product_id', 'from_location_id', 'to_location_id', 'quantity')
+    for field in fields:
+        value = data.get(field)
+        if isinstance(value, bool) or not isinstance(value, int):
+            return jsonify({'error': f'{field} must be an integer'}), 400
+    product_id, source_id, target_id, quantity = (data[field] for field in fields)
+    if quantity <= 0 or source_id == target_id:
+        return jsonify({'error': 'Move a positive quantity between two different locations'}), 400
+    locations = {
+        location.id: location
+        for location in StockLocation.query.filter(StockLocation.user_id == current_user.id,
+                                                   StockLocation.id.in_([source_id, target_id]))
+    }
+    if len(locations) != 2:
+        return jsonify({'error': 'Location was not found'}), 404
+
+    bump_data_version(current_user.id)
+    product = Product.query.filter_by(id=product_id, user_id=current_user.id).with_for_update().first()
+    if product is None:
+        db.session.rollback()
+        return jsonify({'error': f'Product #{product_id} was not found'}), 404
+    sync_location_stock(current_user.id, [product.id])
+    entries = location_stock_entries([product.id]).get(product.id, [])
+    source = next((stock for stock, _, _ in entries if stock.location_id == source_id), None)
+    available = source.quantity if source else 0
+    if available < quantity:
+        db.session.rollback()
+        return jsonify({'error': f'Only {available} in {locations[source_id].code}'}), 400
+
+    source.quantity -= quantity
+    target = put_in_location(entries, product.id, locations[target_id], quantity)
+    db.session.commit()
+    return jsonify({'product_id': product.id,
+                    'from': {'location_id': source_id, 'quantity': source.quantity},
+                    'to': {'location_id': target_id, 'quantity': target.quantity}})
+
+@locations_bp.route('/api/products/<int:product_id>/locations')
+@login_required
+def api_product_locations(product_id):
+    """Where one product is stocked, in pick path order"""
+    product = Product.query.filter_by(id=product_id, user_id=current_user.id).first_or_404()
+    rows = (db.session.query(LocationStock.quantity, StockLocation, Warehouse.code)
+            .join(StockLocation, StockLocation.id == LocationStock.location_id)
+            .join(Warehouse, Warehouse.id == LocationStock.warehouse_id)
+            .filter(LocationStock.product_id == product.id)
+            .order_by(Warehouse.priority, StockLocation.pick_sequence, StockLocation.id).all())
+    return jsonify({
+        'product_id': product.id,
+        'quantity': product.quantity,
+        'locations': [dict(location.to_dict(), location_id=location.id, warehouse_code=warehouse_code,
+                           quantity=quantity)
+                      for quantity, location, warehouse_code in rows]
+    })
+
+@locations_bp.route('/api/orders/<int:order_id>/allocations')
+@login_required
+def api_order_allocations(order_id):
+    """Pick list of an order: the location each line's stock was taken from"""
+    order = Order.query.filter_by(id=order_id, user_id=current_user.id).first_or_404()
+    rows = (db.session.query(StockAllocation, StockLocation.code, Warehouse.code)
+            .outerjoin(StockLocation, StockLocation.id == StockAllocation.location_id)
+            .outerjoin(Warehouse, Warehouse.id == StockLocation.warehouse_id)
+            .filter(StockAllocation.order_id == order.id)
+            .order_by(StockAllocation.id).all())
+    return jsonify({'order_id': order.id, 'allocations': [{
+        'product_id': allocation.product_id,
+        'location_id': allocation.location_id,
+        'location_code': location_code,
+        'warehouse_code': warehouse_code,
+        'quantity': allocation.quantity
+    } for allocation, location_code, warehouse_code in rows]})
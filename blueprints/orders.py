@@ -0,0 +1,185 @@
+"""Order pages and the order API"""
+from datetime import datetime
+from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash
+from flask_login import login_required, current_user
+from sqlalchemy.orm.attributes import set_committed_value
+from werkzeug.datastructures import MultiDict
+from models import db, Order, OrderItem
+from app import (bump_data_version, order_listing_query, paginate_orders, parse_order_lines, reserve_stock,
+                 allocate_stock, stock_movement, log_movements, order_images, changed_fields, log_changes,
+                 transition_orders, delete_orders, EXPORT_BATCH_SIZE, MAX_BULK_ORDERS, ORDER_EXPORT_FIELDS,
+                 bulk_change_orders, iter_orders, json_stream_response, wants_stream, export_response,
+                 generate_order_number)
+
+orders_bp = Blueprint('orders', __name__)
+
+@orders_bp.route('/orders')
+@login_required
+def orders():
+    try:
+        orders, next_cursor = paginate_orders(current_user.id, request.args)
+    except ValueError as e:
+        flash(str(e), 'error')
+        orders, next_cursor = paginate_orders(current_user.id, MultiDict())
+    
+    return render_template('orders.html', 
+                         orders=orders, 
+                         next_cursor=next_cursor,
+                         start_date=request.args.get('start_date', ''),
+                         end_date=request.args.get('end_date', ''))
+
+@orders_bp.route('/add_order', methods=['GET', 'POST'])
+@login_required
+def add_order():
+    if request.method == 'POST':
+        lines, errors = parse_order_lines(request.form.getlist('product_id[]'),
+                                          request.form.getlist('quantity[]'))
+        if not lines and not errors:
+            errors.append('Add at least one item to the order.')
+
+        if not errors:
+            try:
+                # Create order
+                order = Order(
+                    order_number=generate_order_number(),
+                    customer_name=request.form.get('customer_name'),
+                    customer_email=request.form.get('customer_email'),
+                    customer_phone=request.form.get('customer_phone'),
+                    notes=request.form.get('notes'),
+                    user_id=current_user.id
+                )
+                
+                db.session.add(order)
+                db.session.flush()  # Get order ID without committing
+                
+                # Reserve stock for every line; any shortfall rejects the order
+                reserved, errors = reserve_stock(current_user.id, lines)
+                if not errors:
+                    total_amount = 0
+                    for product, quantity in reserved:
+                        db.session.add(OrderItem(
+                            order_id=order.id,
+                            product_id=product.id,
+                            quantity=quantity,
+                            unit_price=product.price
+                        ))
+                        total_amount += quantity * product.price
+                    
+                    order.total_amount = total_amount
+                    allocate_stock(current_user.id, order, reserved)
+                    log_changes(current_user.id, 'order', 'insert', order_images(current_user.id, [order.id]))
+                    log_movements(current_user.id, [
+                        stock_movement('sale', product.id, product.category, -quantity, product.price, order.id)
+                        for product, quantity in reserved
+                    ])
+                    bump_data_version(current_user.id)
+                    db.session.commit()
+                    
+                    flash('Order created successfully!', 'success')
+                    return redirect(url_for('orders.orders'))
+
+                db.session.rollback()
+            except Exception as e:
+                db.session.rollback()
+                flash('An error occurred while creating the order.', 'error')
+
+        for error in errors:
+            flash(error, 'error')
+    
+    # Products are looked up as they are typed, see api_product_typeahead
+    return render_template('add_order.html')
+
+@orders_bp.route('/edit_order/<int:order_id>', methods=['GET', 'POST'])
+@login_required
+def edit_order(order_id):
+    order = Order.query.filter_by(id=order_id, user_id=current_user.id).first_or_404()
+    
+    if request.method == 'POST':
+        status = request.form.get('status') or order.status
+        if status not in order.next_statuses():
+            flash(f'A {order.status} order cannot be marked {status}.', 'error')
+            return render_template('edit_order.html', order=order)
+        try:
+            before = order_images(current_user.id, [order.id])[order.id]
+            # Update order details
+            order.customer_name = request.form.get('customer_name')
+            order.customer_email = request.form.get('customer_email')
+            order.customer_phone = request.form.get('customer_phone')
+            order.notes = request.form.get('notes')
+            order.updated_at = datetime.utcnow()
+            
+            # Only a change of status has side effects, e.g. cancelling restocks
+            if status != order.status:
+                if not transition_orders(current_user.id, [order.id], status):
+                    db.session.rollback()
+                    flash('The order was changed by someone else; please try again.', 'error')
+                    return redirect(url_for('orders.edit_order', order_id=order_id))
+                set_committed_value(order, 'status', status)
+            # transition_orders() logged the status change
+            after = order_images(current_user.id, [order.id])
+            edited = {key: value for key, value in changed_fields(before, after[order.id]).items() if key != 'status'}
+            if edited:
+                log_changes(current_user.id, 'order', 'update', after, {order.id: edited})
+            
+            bump_data_version(current_user.id)
+            db.session.commit()
+            flash('Order updated successfully!', 'success')
+            return redirect(url_for('orders.orders'))
+            
+        except Exception as e:
+            db.session.rollback()
+            flash('An error occurred while updating the order.', 'error')
+    
+    return render_template('edit_order.html', order=order)
+
+@orders_bp.route('/delete_order/<int:order_id>', methods=['POST'])
+@login_required
+def delete_order(order_id):
+    Order.query.filter_by(id=order_id, user_id=current_user.id).first_or_404()
+    
+    try:
+        bump_data_version(current_user.id)
+        delete_orders(current_user.id, [order_id])
+        db.session.commit()
+        flash('Order deleted successfully!', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash('An error occurred while deleting the order.', 'error')
+    
+    return redirect(url_for('orders.orders'))
+
+@orders_bp.route('/api/orders')
+@login_required
+def api_orders():
+    try:
+        if wants_stream(request.args):
+            # Stream every order in the date range instead of a single page
+            query = order_listing_query(current_user.id, request.args)
+            rows = (order.to_dict() for order in query.yield_per(EXPORT_BATCH_SIZE))
+            return json_stream_response({'next_cursor': None}, 'orders', rows)
+        orders, next_cursor = paginate_orders(current_user.id, request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({
+        'orders': [order.to_dict() for order in orders],
+        'next_cursor': next_cursor
+    })
+
+@orders_bp.route('/api/orders/bulk', methods=['POST'])
+@login_required
+def api_bulk_orders():
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or payload.get('action') not in ('cancel', 'delete'):
+        return jsonify({'error': 'Body must be a JSON object with an action of cancel or delete'}), 400
+    order_ids = payload.get('order_ids')
+    if not isinstance(order_ids, list) or not all(isinstance(order_id, int) for order_id in order_ids):
+        return jsonify({'error': 'order_ids must be a list of order ids'}), 400
+    if len(order_ids) > MAX_BULK_ORDERS:
+        return jsonify({'error': f'At most {MAX_BULK_ORDERS} orders per request'}), 400
+    return jsonify(bulk_change_orders(current_user.id, payload['action'], order_ids))
+
+@orders_bp.route('/api/orders/export')
+@login_required
+def api_export_orders():
+    fmt = request.args.get('format', 'csv')
+    return export_response(iter_orders(current_user.id), ORDER_EXPORT_FIELDS, fmt, 'orders')
@@ -0,0 +1,276 @@
+"""Product pages and the product API: listing, search, editing, imports and stock adjustments"""
+import csv
+import hashlib
+from datetime import datetime
+from flask import Blueprint, Response, current_app, render_template, request, jsonify, redirect, url_for, flash
+from flask_login import login_required, current_user
+import catalogue
+from models import db, Product, Order, ProductForecast, LocationStock
+from app import (LOW_STOCK_THRESHOLD, stock_snapshot, record_stock_change, bump_data_version, get_data_version,
+                 get_inventory_summary, get_category_summaries, search_products, product_listing_query,
+                 paginate_products, sync_location_stock, stock_movement, log_movements, changed_fields, log_changes,
+                 reorder_alerts, EXPORT_BATCH_SIZE, MAX_STOCK_ADJUSTMENTS, PRODUCT_EXPORT_FIELDS, read_import_rows,
+                 import_products, adjust_stock, iter_products, json_stream_response, wants_stream, export_response,
+                 import_format, response_cache, cached_json, refresh_catalogue)
+
+products_bp = Blueprint('products', __name__)
+
+@products_bp.route('/dashboard')
+@login_required
+def dashboard():
+    try:
+        key = f'dashboard:{current_user.id}:{get_data_version(current_user.id)}'
+        context = response_cache.get_or_set(key, lambda: dashboard_context(current_user.id))
+        return render_template('dashboard.html', **context)
+    except Exception as e:
+        current_app.logger.exception("Error in dashboard route: %s", e)
+        flash('Error loading dashboard', 'error')
+        return render_template('dashboard.html', 
+                             total_products=0, 
+                             low_stock=0,
+                             out_of_stock=0,
+                             total_orders=0,
+                             recent_products=[],
+                             low_stock_products=[])
+
+def dashboard_context(user_id):
+    """Query the dashboard numbers and product lists as cacheable plain data"""
+    # Stock counts come from the materialized summary
+    summary = get_inventory_summary(user_id)
+    
+    # Order statistics
+    total_orders = Order.query.filter_by(user_id=user_id).count()
+    
+    # Get recent products
+    recent_products = Product.query.filter_by(user_id=user_id).order_by(Product.created_at.desc()).limit(5).all()
+    
+    # Low stock alerts follow the forecast reorder points once they have
+    # been computed, and the fixed threshold until then
+    if db.session.query(ProductForecast.query.filter_by(user_id=user_id).exists()).scalar():
+        low_stock_products = reorder_alerts(user_id, 6)
+    else:
+        low_stock_products = [product.to_dict() for product in Product.query.filter(
+            Product.user_id == user_id, 
+            Product.quantity < LOW_STOCK_THRESHOLD,
+            Product.quantity > 0
+        ).order_by(Product.quantity.asc()).limit(6).all()]
+    
+    return {
+        'total_products': summary.product_count,
+        'low_stock': summary.low_stock_count,
+        'out_of_stock': summary.out_of_stock_count,
+        'total_orders': total_orders,
+        'recent_products': [product.to_dict() for product in recent_products],
+        'low_stock_products': low_stock_products
+    }
+
+@products_bp.route('/add_product', methods=['GET', 'POST'])
+@login_required
+def add_product():
+    if request.method == 'POST':
+        try:
+            name = request.form.get('name')
+            category = request.form.get('category')
+            quantity = int(request.form.get('quantity'))
+            price = float(request.form.get('price'))
+            supplier = request.form.get('supplier')
+            description = request.form.get('description')
+            
+            product = Product(
+                name=name,
+                category=category,
+                quantity=quantity,
+                price=price,
+                supplier=supplier,
+                description=description,
+                user_id=current_user.id
+            )
+            
+            db.session.add(product)
+            db.session.flush()
+            sync_location_stock(current_user.id, [product.id])
+            record_stock_change(current_user.id, None, stock_snapshot(product))
+            log_movements(current_user.id, [stock_movement('adjustment', product.id, category, quantity)])
+            log_changes(current_user.id, 'product', 'insert', {product.id: product.to_dict()})
+            bump_data_version(current_user.id)
+            db.session.commit()
+            
+            flash('Product added successfully!', 'success')
+            return redirect(url_for('products.inventory'))
+        except ValueError:
+            flash('Please enter valid numeric values for quantity and price.', 'error')
+        except Exception as e:
+            flash('An error occurred while adding the product.', 'error')
+    
+    return render_template('add_product.html')
+
+@products_bp.route('/inventory')
+@login_required
+def inventory():
+    # Rows are fetched page by page from /api/products; the page itself only
+    # needs the filter options and the headline count
+    summary = get_inventory_summary(current_user.id)
+    categories = sorted(category for category in get_category_summaries(current_user.id) if category)
+    
+    return render_template('inventory.html', total_products=summary.product_count, categories=categories)
+
+@products_bp.route('/api/products')
+@login_required
+def api_products():
+    try:
+        if wants_stream(request.args):
+            # Stream every matching product instead of a single page
+            query, _, _ = product_listing_query(current_user.id, request.args)
+            rows = (product.to_dict() for product, _ in query.yield_per(EXPORT_BATCH_SIZE))
+            return json_stream_response({'next_cursor': None}, 'products', rows)
+        products, next_cursor = paginate_products(current_user.id, request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({
+        'products': [product.to_dict() for product in products],
+        'next_cursor': next_cursor
+    })
+
+@products_bp.route('/api/products/search')
+@login_required
+@cached_json
+def api_search_products():
+    try:
+        products, next_cursor = search_products(current_user.id, request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({
+        'products': [product.to_dict() for product in products],
+        'next_cursor': next_cursor
+    })
+
+@products_bp.route('/api/products/import', methods=['POST'])
+@login_required
+def api_import_products():
+    upload = request.files.get('file')
+    fmt = import_format(upload)
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({'error': 'Format must be csv or ndjson'}), 400
+
+    stream = upload.stream if upload else request.stream
+    upsert = request.args.get('mode') == 'upsert'
+    try:
+        report = import_products(current_user.id, read_import_rows(stream, fmt), upsert=upsert)
+    except UnicodeDecodeError:
+        db.session.rollback()
+        return jsonify({'error': 'File must be UTF-8 encoded'}), 400
+    except csv.Error as e:
+        db.session.rollback()
+        return jsonify({'error': f'Malformed CSV: {e}'}), 400
+    return jsonify(report)
+
+@products_bp.route('/api/products/adjust-stock', methods=['POST'])
+@login_required
+def api_adjust_stock():
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or not isinstance(payload.get('adjustments'), list):
+        return jsonify({'error': 'Body must be a JSON object with an adjustments list'}), 400
+    adjustments = payload['adjustments']
+    if len(adjustments) > MAX_STOCK_ADJUSTMENTS:
+        return jsonify({'error': f'At most {MAX_STOCK_ADJUSTMENTS} adjustments per request'}), 400
+    return jsonify(adjust_stock(current_user.id, adjustments, atomic=bool(payload.get('atomic'))))
+
+@products_bp.route('/api/products/export')
+@login_required
+def api_export_products():
+    fmt = request.args.get('format', 'csv')
+    return export_response(iter_products(current_user.id), PRODUCT_EXPORT_FIELDS, fmt, 'products')
+
+@products_bp.route('/edit_product/<int:product_id>', methods=['GET', 'POST'])
+@login_required
+def edit_product(product_id):
+    product = Product.query.filter_by(id=product_id, user_id=current_user.id).first_or_404()
+    
+    if request.method == 'POST':
+        try:
+            before = stock_snapshot(product)
+            image = product.to_dict()
+            product.name = request.form.get('name')
+            product.category = request.form.get('category')
+            product.quantity = int(request.form.get('quantity'))
+            product.price = float(request.form.get('price'))
+            product.supplier = request.form.get('supplier')
+            product.description = request.form.get('description')
+            product.updated_at = datetime.utcnow()
+            sync_location_stock(current_user.id, [product.id])
+            record_stock_change(current_user.id, before, stock_snapshot(product))
+            log_movements(current_user.id, [stock_movement('adjustment', product.id, product.category,
+                                                           product.quantity - before[1])])
+            log_changes(current_user.id, 'product', 'update', {product.id: product.to_dict()},
+                        {product.id: changed_fields(image, product.to_dict())})
+            bump_data_version(current_user.id)
+            
+            db.session.commit()
+            flash('Product updated successfully!', 'success')
+            return redirect(url_for('products.inventory'))
+        except ValueError:
+            flash('Please enter valid numeric values for quantity and price.', 'error')
+        except Exception as e:
+            flash('An error occurred while updating the product.', 'error')
+    
+    return render_template('edit_product.html', product=product)
+
+@products_bp.route('/delete_product/<int:product_id>', methods=['POST'])
+@login_required
+def delete_product(product_id):
+    product = Product.query.filter_by(id=product_id, user_id=current_user.id).first_or_404()
+    
+    try:
+        record_stock_change(current_user.id, stock_snapshot(product), None)
+        log_movements(current_user.id, [stock_movement('adjustment', product.id, product.category,
+                                                       -product.quantity)])
+        log_changes(current_user.id, 'product', 'delete', {product.id: None}, {product.id: product.to_dict()})
+        bump_data_version(current_user.id)
+        LocationStock.query.filter_by(product_id=product.id).delete()
+        db.session.delete(product)
+        db.session.commit()
+        flash('Product deleted successfully!', 'success')
+    except Exception as e:
+        flash('An error occurred while deleting the product.', 'error')
+    
+    return redirect(url_for('products.inventory'))
+
+TYPEAHEAD_LIMIT = 10
+MAX_TYPEAHEAD_LIMIT = 50
+
+@products_bp.route('/api/products/available')
+@login_required
+def api_available_products():
+    """Every in-stock product, pre-encoded from the catalogue snapshot.
+
+    The body is sent gzip or brotli compressed when the client accepts
+    it, and revalidates against the user's data version like cached_json.
+    """
+    version = get_data_version(current_user.id)
+    encoding = catalogue.accepted_encoding(request.accept_encodings)
+    etag = hashlib.sha1(f'{request.endpoint}:{current_user.id}:{version}:{encoding}'.encode()).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        snapshot = current_app.extensions['catalogue'].snapshot(current_user.id)
+        with snapshot.lock:
+            refresh_catalogue(current_user.id, snapshot)
+            body = snapshot.payload(encoding)
+        response = Response(body, mimetype='application/json')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.add('Accept-Encoding')
+    return response
+
+@products_bp.route('/api/products/typeahead')
+@login_required
+def api_product_typeahead():
+    """In-stock products whose name has a word starting with each word of q"""
+    limit = min(max(request.args.get('limit', TYPEAHEAD_LIMIT, type=int), 1), MAX_TYPEAHEAD_LIMIT)
+    snapshot = current_app.extensions['catalogue'].snapshot(current_user.id)
+    with snapshot.lock:
+        refresh_catalogue(current_user.id, snapshot)
+        products = snapshot.typeahead(request.args.get('q', ''), limit)
+    return jsonify({'products': products})
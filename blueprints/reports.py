@@ -0,0 +1,72 @@
+"""The inventory report page, its API and exports"""
+import json
+from flask import Blueprint, current_app, render_template, request, jsonify, url_for, send_from_directory
+from flask_login import login_required, current_user
+from models import Product, Job
+from app import (get_data_version, get_inventory_summary, get_category_summaries, EXPORT_BATCH_SIZE,
+                 json_stream_response, wants_stream, report_totals, response_cache, job_queue, cached_json,
+                 cached_report_export, job_accepted)
+
+reports_bp = Blueprint('reports', __name__)
+
+@reports_bp.route('/report')
+@login_required
+def report():
+    # Only the summaries; the detail table pages through /api/products
+    summary = get_inventory_summary(current_user.id)
+    categories = get_category_summaries(current_user.id)
+    
+    return render_template('report.html', 
+                         total_products=summary.product_count,
+                         total_quantity=summary.total_quantity, 
+                         total_value=summary.total_value,
+                         categories=categories)
+
+@reports_bp.route('/api/report')
+@login_required
+@cached_json
+def api_report():
+    report_data = report_totals(current_user.id)
+
+    if wants_stream(request.args):
+        products = Product.query.filter_by(user_id=current_user.id).order_by(Product.id)
+        rows = (product.to_dict() for product in products.yield_per(EXPORT_BATCH_SIZE))
+        return json_stream_response(report_data, 'products', rows)
+
+    products = Product.query.filter_by(user_id=current_user.id).order_by(Product.id).all()
+    report_data['products'] = [product.to_dict() for product in products]
+    
+    return jsonify(report_data)
+
+@reports_bp.route('/api/cache/stats')
+@login_required
+def api_cache_stats():
+    return jsonify(response_cache.stats())
+
+@reports_bp.route('/api/report/export', methods=['GET', 'POST'])
+@login_required
+def api_report_export():
+    """Download a CSV, XLSX or PDF report, or start building it.
+
+    A file already built for the user's current data version is sent at
+    once by GET; POST returns its download URL instead. Otherwise both
+    queue a report_export job, reusing one already queued for the same
+    format and version, and return 202 pointing at it.
+    """
+    import reports
+    fmt = request.args.get('format', 'csv')
+    if fmt not in reports.FORMATS:
+        return jsonify({'error': 'Format must be csv, xlsx or pdf'}), 400
+
+    name = cached_report_export(current_user.id, fmt)
+    if name and request.method == 'GET':
+        return send_from_directory(current_app.config['JOB_FILES_DIR'], name, mimetype=reports.FORMATS[fmt],
+                                   as_attachment=True, download_name=f'inventory_report.{fmt}')
+    if name:
+        return jsonify({'status': 'ready', 'url': url_for('reports.api_report_export', format=fmt)})
+
+    params = {'format': fmt, 'version': get_data_version(current_user.id)}
+    job = (Job.query.filter(Job.user_id == current_user.id, Job.kind == 'report_export',
+                            Job.params == json.dumps(params), Job.status.in_(('queued', 'running')))
+           .order_by(Job.id.desc()).first())
+    return job_accepted(job or job_queue.enqueue('report_export', current_user.id, params))
@@ -0,0 +1,250 @@
+"""Response and query caches for hot read endpoints.
+
+Entries are never invalidated in place. Callers put the user's data version
+in the key, so a product or order change makes every older entry
+unreachable and it simply ages out.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class BaseCache:
+    """Common counters and the read-through helper shared by all backends"""
+
+    def __init__(self):
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def get(self, key, default=None):
+        raise NotImplementedError
+
+    def set(self, key, value):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def get_or_set(self, key, factory):
+        """Return the cached value for key, computing and storing it on a miss"""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = factory()
+            self.set(key, value)
+        return value
+
+    def stats(self):
+        return {
+            'backend': type(self).__name__,
+            'entries': len(self),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations
+        }
+
+
+class NullCache(BaseCache):
+    """Cache that stores nothing; every lookup is a miss"""
+
+    def get(self, key, default=None):
+        self._count('misses')
+        return default
+
+    def set(self, key, value):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+    def __len__(self):
+        return 0
+
+
+class LRUCache(BaseCache):
+    """Thread-safe in-process LRU cache with a per-entry time to live"""
+
+    def __init__(self, max_entries=1024, ttl=300):
+        super().__init__()
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                entry = None
+                self._count('expirations')
+            if entry is None:
+                self._count('misses')
+                return default
+            self._entries.move_to_end(key)
+        self._count('hits')
+        return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            evicted = 0
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+        if evicted:
+            self._count('evictions', evicted)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCache(BaseCache):
+    """Cache in a local SQLite file, shared by every worker on the host.
+
+    Values are pickled. Reads never write, so eviction drops the oldest
+    stored entries (FIFO) rather than the least recently read ones.
+    """
+
+    # Size is checked every this many writes rather than on each one
+    EVICTION_INTERVAL = 100
+
+    def __init__(self, path, max_entries=10000, ttl=300):
+        super().__init__()
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = threading.local()
+        self._writes = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS cache ('
+                         'key TEXT PRIMARY KEY, value BLOB NOT NULL, '
+                         'expires_at REAL NOT NULL, stored_at REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_cache_stored_at ON cache (stored_at)')
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key, default=None):
+        row = self._connection().execute(
+            'SELECT value, expires_at FROM cache WHERE key = ?', (key,)).fetchone()
+        if row is not None and row[1] < time.time():
+            with self._connection() as conn:
+                conn.execute('DELETE FROM cache WHERE key = ?', (key,))
+            row = None
+            self._count('expirations')
+        if row is None:
+            self._count('misses')
+            return default
+        self._count('hits')
+        return pickle.loads(row[0])
+
+    def set(self, key, value):
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute('INSERT OR REPLACE INTO cache (key, value, expires_at, stored_at) VALUES (?, ?, ?, ?)',
+                         (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), now + self.ttl, now))
+        self._writes += 1
+        if self._writes % self.EVICTION_INTERVAL == 0:
+            self._evict(now)
+
+    def _evict(self, now):
+        with self._connection() as conn:
+            expired = conn.execute('DELETE FROM cache WHERE expires_at < ?', (now,)).rowcount
+            overflow = len(self) - self.max_entries
+            evicted = 0
+            if overflow > 0:
+                evicted = conn.execute('DELETE FROM cache WHERE key IN '
+                                       '(SELECT key FROM cache ORDER BY stored_at LIMIT ?)',
+                                       (overflow,)).rowcount
+        self._count('expirations', expired)
+        self._count('evictions', evicted)
+
+    def delete(self, key):
+        with self._connection() as conn:
+            conn.execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def clear(self):
+        with self._connection() as conn:
+            conn.execute('DELETE FROM cache')
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+
+
+def create_cache(backend='memory', max_entries=1024, ttl=300, path=None):
+    """Build the cache backend named in the app config"""
+    if backend == 'memory':
+        return LRUCache(max_entries=max_entries, ttl=ttl)
+    if backend == 'sqlite':
+        if not path:
+            raise ValueError('The sqlite cache backend needs a CACHE_PATH')
+        return SQLiteCache(path, max_entries=max_entries, ttl=ttl)
+    if backend == 'none':
+        return NullCache()
+    raise ValueError(f'Unknown cache backend: {backend}')
+
+
+class AppCache:
+    """Module-level handle on the cache backend configured by a Flask app.
+
+    Code can import the handle before any app exists; init_app builds the
+    backend from CACHE_BACKEND, CACHE_MAX_ENTRIES, CACHE_TTL and CACHE_PATH
+    and every call is passed through to it.
+    """
+
+    def __init__(self):
+        self.backend = None
+
+    def init_app(self, app):
+        self.backend = create_cache(app.config['CACHE_BACKEND'],
+                                    max_entries=app.config['CACHE_MAX_ENTRIES'],
+                                    ttl=app.config['CACHE_TTL'],
+                                    path=app.config['CACHE_PATH'])
+        app.extensions['response_cache'] = self.backend
+
+    def __getattr__(self, name):
+        if self.backend is None:
+            raise RuntimeError('The cache is used before init_app')
+        return getattr(self.backend, name)
+
+    def __len__(self):
+        return len(self.backend)
@@ -0,0 +1,312 @@
+"""In-memory catalogue snapshots for the order form.
+
+A CatalogueSnapshot is one user's products in columns: arrays of ids,
+quantities, prices and category numbers, interned name strings and a
+table of distinct categories. The snapshot is a read model and the
+caller keeps it current. After a full load(), upsert() patches the
+products that changed and remove() drops deleted ones, and only those
+rows are touched.
+
+Two things are served from it:
+
+- typeahead(), a prefix search over the words of product names. It uses
+  a sorted word index that is patched when a name changes.
+- payload(), the in-stock products as a JSON array, ready to send as is
+  or gzip-compressed. Rows are grouped in blocks of BLOCK_ROWS. Each
+  block keeps its JSON text and its own deflate stream, flushed to a
+  byte boundary, so the gzip body is just the cached blocks joined with
+  a header and a CRC. A change only re-encodes and recompresses the
+  blocks holding the changed rows. Brotli is used when the brotli
+  package is installed and the client accepts it. It compresses the
+  whole body once per change.
+"""
+import json
+import re
+import struct
+import sys
+import threading
+import unicodedata
+import zlib
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:  # optional; gzip is always available
+    brotli = None
+
+BLOCK_ROWS = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+_WORD = re.compile(r'\w+')
+_GZIP_HEADER = b'\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff'  # deflate, no name, no mtime, unknown OS
+
+
+def _deflate(data, final=False):
+    """A raw deflate stream for data that can be joined with other pieces.
+
+    A full flush ends the piece on a byte boundary with no references to
+    earlier data, so pieces compressed separately decode as one stream.
+    """
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if final else zlib.Z_FULL_FLUSH)
+
+
+_OPEN, _COMMA, _CLOSE = _deflate(b'['), _deflate(b','), _deflate(b']', final=True)
+
+
+def fold(text):
+    """Lower-case text and strip accents, so "Café" matches "cafe" """
+    if text.isascii():
+        return text.lower()
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+
+
+def name_words(name):
+    """The distinct folded words of a product name"""
+    return set(_WORD.findall(fold(name or '')))
+
+
+def accepted_encoding(accept_encodings):
+    """The best payload encoding a client accepts: br, gzip or None"""
+    if brotli is not None and 'br' in accept_encodings:
+        return 'br'
+    if 'gzip' in accept_encodings:
+        return 'gzip'
+    return None
+
+
+class CatalogueSnapshot:
+    """One user's products in columns, with a name index and encoded payloads"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None  # data version the snapshot reflects
+        self.watermark = None  # newest updated_at applied
+        self.loaded_at = None  # when the last full load ran
+        self.clear()
+
+    def clear(self):
+        self.ids = array('q')  # 0 marks a deleted row, free for reuse
+        self.quantities = array('q')
+        self.prices = array('d')
+        self.categories = array('l')  # index into category_names
+        self.names = []
+        self.category_names = []
+        self._category_index = {}
+        self.rows = {}  # product id -> row
+        self._free = []
+        self._tokens = []  # sorted name words, one entry per (word, row)
+        self._token_rows = array('l')
+        self._blocks = []  # (json, deflated) per block, None when stale
+        self._encoded = {}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _category(self, category):
+        index = self._category_index.get(category)
+        if index is None:
+            index = self._category_index[category] = len(self.category_names)
+            self.category_names.append(category)
+        return index
+
+    def _stale(self, row):
+        block = row // BLOCK_ROWS
+        while len(self._blocks) <= block:
+            self._blocks.append(None)
+        self._blocks[block] = None
+        self._encoded.clear()
+
+    def load(self, products):
+        """Replace the contents with (id, name, category, quantity, price) rows"""
+        self.clear()
+        pairs = []
+        for product_id, name, category, quantity, price in products:
+            row = len(self.ids)
+            self.ids.append(product_id)
+            self.quantities.append(quantity)
+            self.prices.append(price)
+            self.categories.append(self._category(category))
+            self.names.append(sys.intern(name))
+            self.rows[product_id] = row
+            pairs.extend((word, row) for word in name_words(name))
+        pairs.sort()
+        self._tokens = [sys.intern(word) for word, _ in pairs]
+        self._token_rows = array('l', (row for _, row in pairs))
+        self._blocks = [None] * (len(self.ids) // BLOCK_ROWS + 1)
+
+    def upsert(self, product_id, name, category, quantity, price):
+        """Add a product or update its row in place; unchanged rows stay encoded"""
+        row = self.rows.get(product_id)
+        if row is not None and (self.names[row] == name and self.quantities[row] == quantity
+                                and self.prices[row] == price
+                                and self.category_names[self.categories[row]] == category):
+            return
+        if row is None:
+            if self._free:
+                row = self._free.pop()
+                self.ids[row] = product_id
+            else:
+                row = len(self.ids)
+                self.ids.append(product_id)
+                self.quantities.append(0)
+                self.prices.append(0.0)
+                self.categories.append(0)
+                self.names.append('')
+            self.rows[product_id] = row
+        if self.names[row] != name:
+            self._unindex(row)
+            self.names[row] = sys.intern(name)
+            self._index(row)
+        self.quantities[row] = quantity
+        self.prices[row] = price
+        self.categories[row] = self._category(category)
+        self._stale(row)
+
+    def remove(self, product_id):
+        """Drop a deleted product; its row is reused by the next insert"""
+        row = self.rows.pop(product_id, None)
+        if row is None:
+            return
+        self._unindex(row)
+        self.ids[row] = 0
+        self.quantities[row] = 0
+        self.names[row] = ''
+        self._free.append(row)
+        self._stale(row)
+
+    def _index(self, row):
+        for word in name_words(self.names[row]):
+            i = bisect_left(self._tokens, word)
+            self._tokens.insert(i, sys.intern(word))
+            self._token_rows.insert(i, row)
+
+    def _unindex(self, row):
+        for word in name_words(self.names[row]):
+            i = bisect_left(self._tokens, word)
+            while self._token_rows[i] != row:
+                i += 1
+            del self._tokens[i]
+            del self._token_rows[i]
+
+    def product(self, row):
+        return {
+            'id': self.ids[row],
+            'name': self.names[row],
+            'category': self.category_names[self.categories[row]],
+            'quantity': self.quantities[row],
+            'price': self.prices[row]
+        }
+
+    def typeahead(self, query, limit=10):
+        """In-stock products with a name word starting with each query word.
+
+        The scan walks the word index from the narrowest query word, so
+        products whose word is closest to the typed prefix come first, and
+        it stops once limit products are found.
+        """
+        words = _WORD.findall(fold(query))
+        if not words:
+            return []
+        ranges = []
+        for word in words:
+            successor = word[:-1] + chr(ord(word[-1]) + 1)
+            ranges.append((bisect_left(self._tokens, successor) - bisect_left(self._tokens, word), word))
+        driver = min(ranges)[1]
+        others = [word for word in words if word != driver]
+        start = bisect_left(self._tokens, driver)
+        seen = set()
+        found = []
+        for i in range(start, len(self._tokens)):
+            if not self._tokens[i].startswith(driver):
+                break
+            row = self._token_rows[i]
+            if row in seen or self.quantities[row] <= 0:
+                continue
+            seen.add(row)
+            if others:
+                row_words = name_words(self.names[row])
+                if not all(any(token.startswith(word) for token in row_words) for word in others):
+                    continue
+            found.append(self.product(row))
+            if len(found) == limit:
+                break
+        return found
+
+    def _block(self, block):
+        cached = self._blocks[block]
+        if cached is None:
+            category_json = [json.dumps(category) for category in self.category_names]
+            rows = range(block * BLOCK_ROWS, min((block + 1) * BLOCK_ROWS, len(self.ids)))
+            text = ','.join(
+                f'{{"category":{category_json[self.categories[row]]},"id":{self.ids[row]},'
+                f'"name":{json.dumps(self.names[row])},"price":{self.prices[row]!r},'
+                f'"quantity":{self.quantities[row]}}}'
+                for row in rows if self.ids[row] and self.quantities[row] > 0
+            ).encode()
+            cached = self._blocks[block] = (text, _deflate(text) if text else b'')
+        return cached
+
+    def payload(self, encoding=None):
+        """The in-stock products as a JSON array: plain, or 'gzip' or 'br' encoded.
+
+        Same fields as the rows of /api/products/available, keys sorted.
+        """
+        if encoding is None:
+            texts = [text for text, _ in map(self._block, range(len(self._blocks))) if text]
+            return b'[' + b','.join(texts) + b']'
+        if encoding not in self._encoded:
+            if encoding == 'br':
+                self._encoded[encoding] = brotli.compress(self.payload(), quality=BROTLI_QUALITY)
+            else:
+                self._encoded[encoding] = self._gzip()
+        return self._encoded[encoding]
+
+    def _gzip(self):
+        pieces = [_GZIP_HEADER, _OPEN]
+        crc = zlib.crc32(b'[')
+        size = 1
+        for block in range(len(self._blocks)):
+            text, deflated = self._block(block)
+            if not text:
+                continue
+            if size > 1:
+                pieces.append(_COMMA)
+                crc = zlib.crc32(b',', crc)
+                size += 1
+            pieces.append(deflated)
+            crc = zlib.crc32(text, crc)
+            size += len(text)
+        pieces.append(_CLOSE)
+        crc = zlib.crc32(b']', crc)
+        pieces.append(struct.pack('<II', crc, (size + 1) & 0xffffffff))
+        return b''.join(pieces)
+
+
+class CatalogueStore:
+    """This process's snapshots, for the most recently used max_users users"""
+
+    def __init__(self, max_users=64):
+        self.max_users = max_users
+        self._snapshots = OrderedDict()
+        self._lock = threading.Lock()
+
+    def snapshot(self, user_id):
+        """The user's snapshot, empty until the caller loads it; lock it while in use"""
+        with self._lock:
+            snapshot = self._snapshots.get(user_id)
+            if snapshot is None:
+                snapshot = self._snapshots[user_id] = CatalogueSnapshot()
+                while len(self._snapshots) > self.max_users:
+                    self._snapshots.popitem(last=False)
+            else:
+                self._snapshots.move_to_end(user_id)
+            return snapshot
+
+    def clear(self):
+        with self._lock:
+            self._snapshots.clear()
@@ -0,0 +1,52 @@
+"""Waking change feed readers, and the server-sent event wire format.
+
+The change log is the change_log table. app.log_changes() appends to it
+in the transaction that makes the change, and /api/changes serves a
+user's entries after a sequence number. A reader that is up to date waits
+for the next commit instead of re-querying in a loop: when a session
+commits changes, ChangeNotifier wakes the readers in this process that
+are waiting on those users. Readers also re-query every poll interval,
+which picks up commits made by other processes.
+"""
+import json
+import threading
+
+
+class ChangeNotifier:
+    """Per-user commit counters that waiting feed readers block on"""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._commits = {}  # user id -> commits with changes seen by this process
+
+    def position(self, user_id):
+        """A token to pass to wait(); take it before reading the log"""
+        with self._condition:
+            return self._commits.get(user_id, 0)
+
+    def notify(self, user_ids):
+        with self._condition:
+            for user_id in user_ids:
+                self._commits[user_id] = self._commits.get(user_id, 0) + 1
+            self._condition.notify_all()
+
+    def wait(self, user_id, position, timeout):
+        """Block until the user commits a change after position, or timeout; True if they did"""
+        with self._condition:
+            return self._condition.wait_for(lambda: self._commits.get(user_id, 0) != position, timeout)
+
+
+def sse_event(data, event=None, event_id=None):
+    """One server-sent event; data is sent as JSON"""
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    if event is not None:
+        lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data, separators=(",", ":"))}')
+    return '\n'.join(lines) + '\n\n'
+
+
+def sse_comment(text=''):
+    """A comment line, ignored by EventSource; keeps idle connections open through proxies"""
+    return f': {text}\n\n'
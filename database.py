@@ -0,0 +1,126 @@
+"""Database engine configuration.
+
+Everything is driven by environment variables so the same code runs on a
+developer's SQLite file and on PostgreSQL behind several workers:
+
+    DATABASE_URL              sqlite:///inventory.db (default) or postgresql://...
+    DB_POOL_SIZE              connections kept open per worker process
+    DB_MAX_OVERFLOW           extra connections allowed under burst load
+    DB_POOL_TIMEOUT           seconds to wait for a free connection
+    DB_POOL_RECYCLE           seconds before a connection is replaced
+    DB_POOL_PRE_PING          test connections before use (default on for PostgreSQL)
+    SQLITE_JOURNAL_MODE       WAL (default) lets readers run alongside a writer
+    SQLITE_BUSY_TIMEOUT_MS    how long a writer waits for the lock before failing
+    SQLITE_SYNCHRONOUS        NORMAL (default) is durable under WAL and much faster than FULL
+    SQLITE_CACHE_SIZE_KB      page cache per connection
+"""
+import os
+import weakref
+
+from sqlalchemy import event
+
+DEFAULT_DATABASE_URL = 'sqlite:///inventory.db'
+
+SQLITE_PRAGMA_DEFAULTS = {
+    'SQLITE_JOURNAL_MODE': 'WAL',
+    'SQLITE_BUSY_TIMEOUT_MS': '5000',
+    'SQLITE_SYNCHRONOUS': 'NORMAL',
+    'SQLITE_CACHE_SIZE_KB': '65536'
+}
+
+
+def _env_bool(env, name, default):
+    value = env.get(name)
+    if value is None:
+        return default
+    return value.lower() in ('1', 'true', 'yes', 'on')
+
+
+def database_url(env=os.environ):
+    """Return the configured database URL, normalizing legacy postgres:// URLs"""
+    url = env.get('DATABASE_URL', DEFAULT_DATABASE_URL)
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def engine_options(url, env=os.environ):
+    """Build SQLALCHEMY_ENGINE_OPTIONS for the given database URL"""
+    if url.startswith('sqlite'):
+        if url in ('sqlite://', 'sqlite:///:memory:'):
+            # In-memory databases get Flask-SQLAlchemy's single shared connection
+            return {}
+        busy_timeout_ms = int(env.get('SQLITE_BUSY_TIMEOUT_MS', SQLITE_PRAGMA_DEFAULTS['SQLITE_BUSY_TIMEOUT_MS']))
+        return {
+            'pool_size': int(env.get('DB_POOL_SIZE', 5)),
+            'max_overflow': int(env.get('DB_MAX_OVERFLOW', 10)),
+            'pool_timeout': int(env.get('DB_POOL_TIMEOUT', 30)),
+            'pool_pre_ping': _env_bool(env, 'DB_POOL_PRE_PING', False),
+            'connect_args': {'timeout': busy_timeout_ms / 1000, 'check_same_thread': False}
+        }
+    return {
+        'pool_size': int(env.get('DB_POOL_SIZE', 10)),
+        'max_overflow': int(env.get('DB_MAX_OVERFLOW', 20)),
+        'pool_timeout': int(env.get('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(env.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': _env_bool(env, 'DB_POOL_PRE_PING', True)
+    }
+
+
+def sqlite_pragmas(env=os.environ):
+    """Return the PRAGMA statements applied to every new SQLite connection"""
+    settings = {name: env.get(name, default) for name, default in SQLITE_PRAGMA_DEFAULTS.items()}
+    return [
+        f"PRAGMA journal_mode={settings['SQLITE_JOURNAL_MODE']}",
+        f"PRAGMA busy_timeout={int(settings['SQLITE_BUSY_TIMEOUT_MS'])}",
+        f"PRAGMA synchronous={settings['SQLITE_SYNCHRONOUS']}",
+        f"PRAGMA cache_size={-int(settings['SQLITE_CACHE_SIZE_KB'])}"
+    ]
+
+
+def analyze(connection, tables):
+    """Refresh the query planner's statistics for the given tables.
+
+    SQLite keeps none until ANALYZE runs, and without them it can prefer a
+    covering index over a far more selective one. analysis_limit samples
+    each index instead of reading it whole, so this stays cheap.
+    """
+    if connection.dialect.name == 'sqlite':
+        connection.exec_driver_sql('PRAGMA analysis_limit=1000')
+    for table in tables:
+        connection.exec_driver_sql(f'ANALYZE {table}')
+
+
+def configure(app, env=os.environ):
+    """Apply the database settings from the environment to a Flask app's config.
+
+    The pragmas are applied by install_sqlite_pragmas() once the app's
+    engine exists.
+    """
+    url = database_url(env)
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(url, env)
+    app.config['SQLITE_PRAGMAS'] = sqlite_pragmas(env)
+
+
+_pragma_engines = weakref.WeakSet()
+
+
+def install_sqlite_pragmas(engine, pragmas):
+    """Run pragmas on every new connection of one SQLite engine.
+
+    The listener is attached to that engine alone, so other engines in the
+    process keep their own settings. Installing twice on one engine does
+    nothing. Call it before the engine's first connection.
+    """
+    if engine.dialect.name != 'sqlite' or engine in _pragma_engines:
+        return
+    _pragma_engines.add(engine)
+    pragmas = list(pragmas)
+
+    @event.listens_for(engine, 'connect')
+    def apply_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
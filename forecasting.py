@@ -0,0 +1,55 @@
+"""Demand forecasting and reorder points.
+
+The caller aggregates each product's daily net demand over a window into
+a total and a sum of squares, with one grouped query for the whole
+catalogue. reorder_plan() then applies the formulas column by column
+across every SKU at once, with no per-product queries or objects:
+
+    demand rate       total / window
+    demand std dev    sqrt(squares / window - rate^2), empty days count as 0
+    safety stock      z(service level) * std * sqrt(lead time)
+    reorder point     rate * lead time + safety stock
+    order-up-to       rate * (lead time + review period) + safety stock
+    days of cover     quantity / rate
+
+A product at or below its reorder point should be reordered, and the
+suggested quantity tops it up to the order-up-to level.
+"""
+import math
+from statistics import NormalDist
+
+
+def service_factor(service_level):
+    """Safety factor z for the probability of not running out in a lead time"""
+    return NormalDist().inv_cdf(service_level)
+
+
+def reorder_plan(quantities, totals, squares, window_days, lead_time_days, review_days, service_level):
+    """Forecast every product from parallel columns of stock and demand.
+
+    quantities, totals and squares hold one entry per product: stock on
+    hand, net units sold over the window, and the sum of squared daily
+    net sales. Returns a dict of columns in the same order.
+    """
+    z = service_factor(service_level)
+    sqrt_lead_time = math.sqrt(lead_time_days)
+    cycle_days = lead_time_days + review_days
+
+    rates = [max(total, 0) / window_days for total in totals]
+    deviations = [math.sqrt(max(square / window_days - rate * rate, 0.0)) for square, rate in zip(squares, rates)]
+    safety = [z * deviation * sqrt_lead_time for deviation in deviations]
+    # Products with no net demand never need reordering
+    reorder_points = [math.ceil(rate * lead_time_days + stock) if rate > 0 else 0
+                      for rate, stock in zip(rates, safety)]
+    reorder_quantities = [
+        max(math.ceil(rate * cycle_days + stock - quantity), 0) if rate > 0 and quantity <= point else 0
+        for quantity, point, rate, stock in zip(quantities, reorder_points, rates, safety)
+    ]
+    days_of_cover = [quantity / rate if rate > 0 else None for quantity, rate in zip(quantities, rates)]
+    return {
+        'demand_rate': rates,
+        'demand_std': deviations,
+        'reorder_point': reorder_points,
+        'reorder_quantity': reorder_quantities,
+        'days_of_cover': days_of_cover
+    }
@@ -0,0 +1,215 @@
+"""Durable background jobs without an external broker.
+
+Jobs are rows in the application database. Worker threads claim the
+oldest runnable job with a guarded UPDATE and hold it under a lease
+that every progress report extends, so a job left behind by a crashed
+worker is picked up again once its lease expires (up to max_attempts
+times). Kinds registered with retry=False are failed instead, because
+running them again would repeat work they had already committed. A
+handler that raises fails its job for good, for the same reason. Workers run inside
+the web process (JOB_WORKERS) or in a separate `flask run-jobs`
+process; both share the same table. With user_scope set, each handler
+runs inside user_scope(job.user_id), e.g. to reach that user's shard.
+
+Handlers receive a JobContext. They should do their writes in batches
+that commit, and report progress between batches: progress is written
+on its own connection, which on SQLite would wait for any write
+transaction the handler still has open.
+"""
+import json
+import logging
+import threading
+import time
+import traceback
+from contextlib import nullcontext
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+
+logger = logging.getLogger('inventory.jobs')
+
+# The JobContext of the job running in this thread, if any
+current_job = ContextVar('current_job', default=None)
+
+class JobContext:
+    """What a job handler sees: its parameters and a progress reporter"""
+
+    # Progress is written at most this often, except for the final report
+    PROGRESS_INTERVAL = 0.5
+
+    def __init__(self, queue, job_id, user_id, params, kind=None):
+        self.queue = queue
+        self.job_id = job_id
+        self.kind = kind
+        self.user_id = user_id
+        self.params = params
+        self._last_progress = 0.0
+
+    def progress(self, done, total=None, message=None, force=False):
+        """Record progress and extend the lease on the job"""
+        now = time.monotonic()
+        if not force and now - self._last_progress < self.PROGRESS_INTERVAL:
+            return
+        self._last_progress = now
+        values = {'progress_done': done, 'lease_until': self.queue.lease_deadline()}
+        if total is not None:
+            values['progress_total'] = total
+        if message is not None:
+            values['message'] = message[:200]
+        self.queue.update_job(self.job_id, values)
+
+
+class JobQueue:
+    """Enqueue jobs and run them on a pool of worker threads"""
+
+    def __init__(self, db, model, app=None, workers=2, lease=300, poll_interval=1.0, max_attempts=3):
+        self.app = None
+        self.db = db
+        self.model = model
+        self.workers = workers
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.handlers = {}
+        self.no_retry = set()  # kinds whose abandoned jobs fail rather than run again
+        self.user_scope = None  # callable(user_id) -> context manager around each handler
+        self._threads = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Run jobs in app, taking JOB_WORKERS and JOB_LEASE_SECONDS from its config"""
+        self.app = app
+        # Set again by the app if it needs one, so none is left from an earlier app
+        self.user_scope = None
+        self.workers = app.config.get('JOB_WORKERS', self.workers)
+        self.lease = app.config.get('JOB_LEASE_SECONDS', self.lease)
+        app.extensions['job_queue'] = self
+        if self.workers:
+            # Threads start with the first request, never for CLI commands
+            app.before_request(self.start)
+
+    def task(self, kind, retry=True):
+        """Register the decorated function as the handler for jobs of kind
+
+        Pass retry=False when running a job a second time would repeat
+        its committed work, e.g. insert the same rows again.
+        """
+        def decorator(handler):
+            self.handlers[kind] = handler
+            if retry:
+                self.no_retry.discard(kind)
+            else:
+                self.no_retry.add(kind)
+            return handler
+        return decorator
+
+    def lease_deadline(self):
+        return datetime.utcnow() + timedelta(seconds=self.lease)
+
+    def enqueue(self, kind, user_id, params=None):
+        """Store a new job and wake a worker; commits the current session"""
+        if kind not in self.handlers:
+            raise ValueError(f'Unknown job kind: {kind}')
+        job = self.model(kind=kind, user_id=user_id, params=json.dumps(params or {}), status='queued')
+        self.db.session.add(job)
+        self.db.session.commit()
+        self._wake.set()
+        return job
+
+    def update_job(self, job_id, values):
+        with self.db.engine.begin() as connection:
+            connection.execute(self.db.update(self.model).where(self.model.id == job_id).values(**values))
+
+    def claim(self):
+        """Take the oldest runnable job, or return None if there is none"""
+        model = self.model
+        now = datetime.utcnow()
+        no_retry = sorted(self.no_retry)
+        abandoned = self.db.and_(model.status == 'running', model.lease_until < now)
+        retryable = self.db.and_(model.attempts < self.max_attempts, model.kind.not_in(no_retry))
+        runnable = self.db.or_(model.status == 'queued', self.db.and_(abandoned, retryable))
+        candidate = (self.db.select(model.id).where(runnable)
+                     .order_by(model.id).limit(1).scalar_subquery())
+        # The WHERE re-checks runnable, so two workers can never claim one job
+        stmt = (self.db.update(model)
+                .where(model.id == candidate, runnable)
+                .values(status='running', lease_until=self.lease_deadline(), attempts=model.attempts + 1,
+                        started_at=self.db.func.coalesce(model.started_at, now))
+                .returning(model.id, model.kind, model.user_id, model.params, model.attempts))
+        with self.db.engine.begin() as connection:
+            connection.execute(self.db.update(model)
+                               .where(abandoned, model.attempts >= self.max_attempts)
+                               .values(status='failed', error='Worker stopped responding', finished_at=now))
+            connection.execute(self.db.update(model)
+                               .where(abandoned, model.kind.in_(no_retry))
+                               .values(status='failed', finished_at=now,
+                                       error='Worker stopped responding; the job may be partly done '
+                                             'and is not safe to run again'))
+            return connection.execute(stmt).first()
+
+    def run_one(self):
+        """Claim and run a single job; returns False when the queue is empty"""
+        with self.app.app_context():
+            job = self.claim()
+            if job is None:
+                return False
+            context = JobContext(self, job.id, job.user_id, json.loads(job.params or '{}'), job.kind)
+            token = current_job.set(context)
+            try:
+                with self.user_scope(job.user_id) if self.user_scope else nullcontext():
+                    result = self.handlers[job.kind](context)
+            except Exception as e:
+                # Handlers may have committed part of their work, so a
+                # failure is final; only abandoned jobs are retried
+                self.db.session.rollback()
+                logger.exception('Job %s (%s) failed', job.id, job.kind)
+                self.update_job(job.id, {
+                    'status': 'failed',
+                    'error': ''.join(traceback.format_exception_only(type(e), e)).strip()[:1000],
+                    'finished_at': datetime.utcnow()
+                })
+            else:
+                self.update_job(job.id, {
+                    'status': 'completed',
+                    'result': json.dumps(result),
+                    'error': None,
+                    'finished_at': datetime.utcnow()
+                })
+            finally:
+                current_job.reset(token)
+                self.db.session.remove()
+        return True
+
+    def _work(self):
+        while not self._stopping.is_set():
+            try:
+                ran = self.run_one()
+            except Exception:
+                logger.exception('Job worker error')
+                ran = False
+            if not ran:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def start(self, workers=None):
+        """Start the worker threads once; safe to call on every request"""
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers if workers is None else workers):
+                thread = threading.Thread(target=self._work, name=f'job-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        self._stopping.clear()
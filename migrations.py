@@ -0,0 +1,193 @@
+"""Versioned schema migrations.
+
+Each migration is an ordered (revision, description, upgrade) entry whose
+upgrade function receives a connection and the application's metadata.
+Applied revisions are recorded in the schema_migrations table, so
+`flask init-db` only runs the ones a database has not seen yet.
+
+Migrations create tables and indexes with IF NOT EXISTS, which keeps them
+safe on databases that were built by db.create_all() before this table
+existed. To change the schema, declare the model or index in models.py and
+append a migration that creates it; never edit an applied migration.
+"""
+from datetime import datetime
+
+from sqlalchemy import text
+from sqlalchemy.schema import CreateIndex
+
+MIGRATIONS_TABLE = 'schema_migrations'
+
+
+def _create_tables(connection, metadata, names):
+    metadata.create_all(connection, tables=[metadata.tables[name] for name in names])
+
+
+def _create_indexes(connection, metadata, names):
+    indexes = {index.name: index for table in metadata.sorted_tables for index in table.indexes}
+    for name in names:
+        connection.execute(CreateIndex(indexes[name], if_not_exists=True))
+
+
+def initial_tables(connection, metadata):
+    _create_tables(connection, metadata, ['user', 'product', 'order', 'order_item'])
+
+
+def summary_tables(connection, metadata):
+    _create_tables(connection, metadata, ['inventory_summary', 'category_summary', 'data_version'])
+
+
+def listing_indexes(connection, metadata):
+    _create_indexes(connection, metadata, [
+        'ix_product_user_name', 'ix_product_user_category', 'ix_product_user_quantity',
+        'ix_product_user_price', 'ix_product_user_value', 'ix_product_user_supplier',
+        'ix_order_user_created'
+    ])
+
+
+def hot_query_indexes(connection, metadata):
+    _create_indexes(connection, metadata, [
+        'ix_product_user_created', 'ix_order_item_order', 'ix_order_item_product'
+    ])
+
+
+def widen_password_hash(connection, metadata):
+    # scrypt hashes are longer than 128 characters; SQLite does not enforce
+    # VARCHAR lengths, so only other databases need the column altered
+    if connection.dialect.name != 'sqlite':
+        connection.execute(text('ALTER TABLE "user" ALTER COLUMN password_hash TYPE VARCHAR(256)'))
+
+
+def job_queue(connection, metadata):
+    _create_tables(connection, metadata, ['job'])
+    _create_indexes(connection, metadata, ['ix_job_status', 'ix_job_user_created', 'ix_product_user_id'])
+
+
+def stock_ledger(connection, metadata):
+    _create_tables(connection, metadata, ['stock_movement', 'product_stats', 'category_stats',
+                                          'analytics_watermark'])
+    _create_indexes(connection, metadata, ['ix_stock_movement_user', 'ix_stock_movement_order',
+                                           'ix_product_stats_user_period'])
+
+
+def product_forecasts(connection, metadata):
+    _create_tables(connection, metadata, ['product_forecast'])
+    _create_indexes(connection, metadata, ['ix_product_forecast_user_reorder'])
+
+
+# External-content FTS5 index over product text, kept in step with the
+# product table by triggers so every write path (ORM, bulk import, raw SQL)
+# updates it. The owner column indexes a "u<user_id>" token so a search
+# only walks the matches in one user's catalogue; it is read through the
+# product_search_source view. Stock-only updates do not touch the index.
+PRODUCT_SEARCH_DDL = [
+    """CREATE VIEW IF NOT EXISTS product_search_source AS
+        SELECT id, name, description, supplier, 'u' || user_id AS owner FROM product""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS product_search USING fts5(
+        name, description, supplier, owner,
+        content='product_search_source', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3')""",
+    """CREATE TRIGGER IF NOT EXISTS product_search_insert AFTER INSERT ON product BEGIN
+        INSERT INTO product_search(rowid, name, description, supplier, owner)
+        VALUES (new.id, new.name, new.description, new.supplier, 'u' || new.user_id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS product_search_delete AFTER DELETE ON product BEGIN
+        INSERT INTO product_search(product_search, rowid, name, description, supplier, owner)
+        VALUES ('delete', old.id, old.name, old.description, old.supplier, 'u' || old.user_id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS product_search_update
+        AFTER UPDATE OF name, description, supplier, user_id ON product BEGIN
+        INSERT INTO product_search(product_search, rowid, name, description, supplier, owner)
+        VALUES ('delete', old.id, old.name, old.description, old.supplier, 'u' || old.user_id);
+        INSERT INTO product_search(rowid, name, description, supplier, owner)
+        VALUES (new.id, new.name, new.description, new.supplier, 'u' || new.user_id);
+    END""",
+]
+
+
+def product_search_index(connection, metadata):
+    # FTS5 is SQLite only; other databases keep the LIKE search
+    if connection.dialect.name != 'sqlite':
+        return
+    for statement in PRODUCT_SEARCH_DDL:
+        connection.execute(text(statement))
+    connection.execute(text("INSERT INTO product_search(product_search) VALUES ('rebuild')"))
+
+
+def stock_locations(connection, metadata):
+    _create_tables(connection, metadata, ['warehouse', 'stock_location', 'location_stock', 'stock_allocation'])
+    _create_indexes(connection, metadata, ['ix_stock_location_user', 'ix_location_stock_product',
+                                           'ix_location_stock_warehouse', 'ix_stock_allocation_order'])
+    # Every user with products gets a default warehouse and location holding
+    # all of their existing stock
+    now = {'now': datetime.utcnow()}
+    connection.execute(text(
+        "INSERT INTO warehouse (user_id, code, name, priority, created_at) "
+        "SELECT DISTINCT user_id, 'MAIN', 'Main warehouse', 0, :now FROM product "
+        "WHERE user_id NOT IN (SELECT user_id FROM warehouse)"), now)
+    connection.execute(text(
+        "INSERT INTO stock_location (user_id, warehouse_id, code, pick_sequence, is_default, created_at) "
+        "SELECT user_id, id, 'DEFAULT', 0, :true, :now FROM warehouse WHERE code = 'MAIN' "
+        "AND user_id NOT IN (SELECT user_id FROM stock_location)"), dict(now, true=True))
+    connection.execute(text(
+        "INSERT INTO location_stock (location_id, warehouse_id, product_id, quantity, updated_at) "
+        "SELECT l.id, l.warehouse_id, p.id, p.quantity, :now FROM product p "
+        "JOIN stock_location l ON l.user_id = p.user_id AND l.is_default = :true "
+        "WHERE p.quantity > 0 AND p.id NOT IN (SELECT product_id FROM location_stock)"), dict(now, true=True))
+
+
+def catalogue_refresh_index(connection, metadata):
+    _create_indexes(connection, metadata, ['ix_product_user_updated'])
+
+
+def change_log(connection, metadata):
+    _create_tables(connection, metadata, ['change_log', 'change_compaction'])
+    _create_indexes(connection, metadata, ['ix_change_log_user', 'ix_change_log_user_entity'])
+
+
+MIGRATIONS = [
+    ('0001', 'User, product and order tables', initial_tables),
+    ('0002', 'Materialized inventory summaries and data versions', summary_tables),
+    ('0003', 'Keyset pagination indexes for product and order listings', listing_indexes),
+    ('0004', 'Indexes for dashboard and order item lookups', hot_query_indexes),
+    ('0005', 'Room for longer password hashes', widen_password_hash),
+    ('0006', 'Background job queue', job_queue),
+    ('0007', 'Stock movement ledger and analytics roll-ups', stock_ledger),
+    ('0008', 'Demand forecasts and reorder points', product_forecasts),
+    ('0009', 'Full-text product search index', product_search_index),
+    ('0010', 'Warehouses, stock locations and per-location stock', stock_locations),
+    ('0011', 'Product index for incremental catalogue refresh', catalogue_refresh_index),
+    ('0012', 'Change log for auditing and the change feed', change_log),
+]
+
+
+def applied_revisions(connection):
+    """Return the set of revisions already applied to the database"""
+    connection.execute(text(f'CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} ('
+                            'revision VARCHAR(32) PRIMARY KEY, '
+                            'description VARCHAR(200) NOT NULL, '
+                            'applied_at TIMESTAMP NOT NULL)'))
+    return {row[0] for row in connection.execute(text(f'SELECT revision FROM {MIGRATIONS_TABLE}'))}
+
+
+def pending_migrations(connection):
+    applied = applied_revisions(connection)
+    return [migration for migration in MIGRATIONS if migration[0] not in applied]
+
+
+def upgrade(engine, metadata):
+    """Apply every pending migration, each in its own transaction.
+
+    Returns the (revision, description) pairs that were applied.
+    """
+    applied = []
+    with engine.begin() as connection:
+        pending = pending_migrations(connection)
+    for revision, description, migrate in pending:
+        with engine.begin() as connection:
+            migrate(connection, metadata)
+            connection.execute(
+                text(f'INSERT INTO {MIGRATIONS_TABLE} (revision, description, applied_at) '
+                     'VALUES (:revision, :description, :applied_at)'),
+                {'revision': revision, 'description': description, 'applied_at': datetime.utcnow()})
+        applied.append((revision, description))
+    return applied
@@ -1,17 +1,34 @@
-from flask_sqlalchemy import SQLAlchemy
+"""Database models and indexes, in the app's single SQLAlchemy registry.
+
+Every table and index lives here. migrations.py creates them on existing
+databases; declare a model or index here first, then append the
+migration that creates it.
+"""
+import json
+from datetime import datetime
+from functools import lru_cache
+
+from flask import current_app
 from flask_login import UserMixin
+from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
-import random
-import string
 
-db = SQLAlchemy()
+from sharding import TenantSession
+
+db = SQLAlchemy(session_options={'class_': TenantSession})
+
+@lru_cache(maxsize=None)
+def hash_method_prefix(method):
+    """Return the method string werkzeug stores in hashes made with method"""
+    # Short names like 'pbkdf2' are expanded to their full parameters
+    return generate_password_hash('', method).split('$', 1)[0]
 
+# User model
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(128))
+    password_hash = db.Column(db.String(256))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
@@ -19,11 +36,19 @@ class User(UserMixin, db.Model):
     orders = db.relationship('Order', backref='user', lazy=True)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = generate_password_hash(password, current_app.config['PASSWORD_HASH_METHOD'])
 
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
 
+    def password_needs_rehash(self):
+        """Whether the stored hash was made with a different method or cost"""
+        return self.password_hash.split('$', 1)[0] != hash_method_prefix(current_app.config['PASSWORD_HASH_METHOD'])
+
+    def __repr__(self):
+        return f'<User {self.username}>'
+
+# Product model
 class Product(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -45,18 +70,51 @@ class Product(db.Model):
             'price': self.price,
             'supplier': self.supplier,
             'description': self.description,
-            'created_at': self.created_at.isoformat(),
-            'updated_at': self.updated_at.isoformat()
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
+# Sort keys for the paginated product listing. Each one is backed by a
+# composite (user_id, key, id) index so keyset pages stay index range scans.
+PRODUCT_SORT_KEYS = {
+    'name': db.func.lower(Product.name),
+    'category': db.func.lower(db.func.coalesce(Product.category, '')),
+    'quantity': Product.quantity,
+    'price': Product.price,
+    'value': Product.quantity * Product.price,
+    'supplier': db.func.lower(db.func.coalesce(Product.supplier, ''))
+}
+
+for _sort_name, _sort_key in PRODUCT_SORT_KEYS.items():
+    db.Index(f'ix_product_user_{_sort_name}', Product.user_id, _sort_key, Product.id)
+
+# Dashboard "recently added" list
+db.Index('ix_product_user_created', Product.user_id, Product.created_at, Product.id)
+
+# Exports and reports walk a user's products in id order
+db.Index('ix_product_user_id', Product.user_id, Product.id)
+
+# Catalogue snapshots re-read the products changed since their last refresh
+db.Index('ix_product_user_updated', Product.user_id, Product.updated_at)
+
+# Status changes an order may make. Stock is taken when the order is
+# placed and goes back only on the move to cancelled, so the side effects
+# belong to transitions, not to the status an order is saved with
+ORDER_TRANSITIONS = {
+    'pending': ('completed', 'cancelled'),
+    'completed': (),
+    'cancelled': (),
+}
+
+# Order model
 class Order(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     order_number = db.Column(db.String(20), unique=True, nullable=False)
     customer_name = db.Column(db.String(100), nullable=False)
     customer_email = db.Column(db.String(120))
     customer_phone = db.Column(db.String(20))
-    status = db.Column(db.String(20), default='pending')  # pending, completed, cancelled
     total_amount = db.Column(db.Float, default=0.0)
+    status = db.Column(db.String(20), default='pending')  # pending, completed, cancelled
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -65,6 +123,10 @@ class Order(db.Model):
     # Relationship
     items = db.relationship('OrderItem', backref='order', lazy=True, cascade='all, delete-orphan')
 
+    def next_statuses(self):
+        """The statuses this order can be saved with, its current one first"""
+        return (self.status,) + ORDER_TRANSITIONS.get(self.status, ())
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -72,14 +134,18 @@ class Order(db.Model):
             'customer_name': self.customer_name,
             'customer_email': self.customer_email,
             'customer_phone': self.customer_phone,
-            'status': self.status,
             'total_amount': self.total_amount,
+            'status': self.status,
             'notes': self.notes,
-            'created_at': self.created_at.isoformat(),
-            'updated_at': self.updated_at.isoformat(),
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
             'items': [item.to_dict() for item in self.items]
         }
 
+# Order listings page newest-first within a user
+db.Index('ix_order_user_created', Order.user_id, Order.created_at, Order.id)
+
+# OrderItem model
 class OrderItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
@@ -94,11 +160,301 @@ class OrderItem(db.Model):
         return {
             'id': self.id,
             'product_id': self.product_id,
-            'product_name': self.product.name,
+            'product_name': self.product.name if self.product else 'Unknown',
             'quantity': self.quantity,
             'unit_price': self.unit_price,
             'total_price': self.quantity * self.unit_price
         }
 
-def generate_order_number():
-    return 'ORD-' + ''.join(random.choices(string.digits, k=8))
\ No newline at end of file
+# Order items are loaded by order and looked up by product
+db.Index('ix_order_item_order', OrderItem.order_id)
+db.Index('ix_order_item_product', OrderItem.product_id)
+
+# Materialized per-user inventory totals, kept in step with product changes
+class InventorySummary(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    product_count = db.Column(db.Integer, nullable=False, default=0)
+    total_quantity = db.Column(db.Integer, nullable=False, default=0)
+    total_value = db.Column(db.Float, nullable=False, default=0.0)
+    low_stock_count = db.Column(db.Integer, nullable=False, default=0)
+    out_of_stock_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def to_dict(self):
+        return {
+            'total_products': self.product_count,
+            'total_quantity': self.total_quantity,
+            'total_value': round(self.total_value, 2),
+            'low_stock': self.low_stock_count,
+            'out_of_stock': self.out_of_stock_count
+        }
+
+# Materialized per-category breakdown for each user
+class CategorySummary(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    category = db.Column(db.String(50))
+    product_count = db.Column(db.Integer, nullable=False, default=0)
+    total_quantity = db.Column(db.Integer, nullable=False, default=0)
+    total_value = db.Column(db.Float, nullable=False, default=0.0)
+    low_stock_count = db.Column(db.Integer, nullable=False, default=0)
+    out_of_stock_count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (db.UniqueConstraint('user_id', 'category'),)
+
+    def to_dict(self):
+        return {
+            'count': self.product_count,
+            'quantity': self.total_quantity,
+            'value': round(self.total_value, 2)
+        }
+
+# Per-user counter bumped by every product or order change; read caches
+# include it in their keys so a change makes older entries unreachable
+class DataVersion(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+# Background job queued by a request and run by a jobs.JobQueue worker
+class Job(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    kind = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, completed, failed
+    params = db.Column(db.Text)
+    result = db.Column(db.Text)
+    error = db.Column(db.Text)
+    message = db.Column(db.String(200))
+    progress_done = db.Column(db.Integer, nullable=False, default=0)
+    progress_total = db.Column(db.Integer)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    lease_until = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'progress': {'done': self.progress_done, 'total': self.progress_total},
+            'message': self.message,
+            'result': json.loads(self.result) if self.result else None,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+# Workers claim the oldest runnable job; users list their own newest first
+db.Index('ix_job_status', Job.status, Job.id)
+db.Index('ix_job_user_created', Job.user_id, Job.created_at, Job.id)
+
+# Append-only ledger of stock changes: sales, returns and manual adjustments
+class StockMovement(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    # Plain columns rather than foreign keys: history outlives deleted rows
+    product_id = db.Column(db.Integer, nullable=False)
+    order_id = db.Column(db.Integer)
+    category = db.Column(db.String(50))
+    kind = db.Column(db.String(20), nullable=False)  # sale, return, adjustment
+    quantity_change = db.Column(db.Integer, nullable=False)
+    unit_price = db.Column(db.Float)
+    day = db.Column(db.Date, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+# Roll-ups read a user's movements past the watermark; the backfill
+# looks movements up by order
+db.Index('ix_stock_movement_user', StockMovement.user_id, StockMovement.id)
+db.Index('ix_stock_movement_order', StockMovement.order_id)
+
+STATS_FIELDS = ('units_sold', 'units_returned', 'revenue', 'stock_in', 'stock_out', 'net_change')
+
+class StatsColumns:
+    """Counters shared by the per-product and per-category roll-ups"""
+    id = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.String(4), nullable=False)  # day or week
+    period_start = db.Column(db.Date, nullable=False)
+    units_sold = db.Column(db.Integer, nullable=False, default=0)
+    units_returned = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+    stock_in = db.Column(db.Integer, nullable=False, default=0)
+    stock_out = db.Column(db.Integer, nullable=False, default=0)
+    net_change = db.Column(db.Integer, nullable=False, default=0)
+
+# Daily and weekly movement totals per product, rolled up from the ledger
+class ProductStats(StatsColumns, db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    product_id = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (db.UniqueConstraint('user_id', 'product_id', 'period', 'period_start'),)
+
+# Date-range scans across all of a user's products; it carries every
+# counter so ranking a year of products never visits the table
+db.Index('ix_product_stats_user_period', ProductStats.user_id, ProductStats.period, ProductStats.period_start,
+         ProductStats.product_id, *(getattr(ProductStats, field) for field in STATS_FIELDS))
+
+# Daily and weekly movement totals per category
+class CategoryStats(StatsColumns, db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    category = db.Column(db.String(50))
+
+    __table_args__ = (db.UniqueConstraint('user_id', 'period', 'period_start', 'category'),)
+
+# Id of the last ledger row folded into each user's roll-ups
+class AnalyticsWatermark(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    last_movement_id = db.Column(db.Integer, nullable=False, default=0)
+
+# Demand forecast and reorder point per product, from compute_forecasts()
+class ProductForecast(db.Model):
+    product_id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    demand_rate = db.Column(db.Float, nullable=False, default=0.0)  # units per day
+    demand_std = db.Column(db.Float, nullable=False, default=0.0)
+    reorder_point = db.Column(db.Integer, nullable=False, default=0)
+    reorder_quantity = db.Column(db.Integer, nullable=False, default=0)
+    days_of_cover = db.Column(db.Float)  # at computation time; None without demand
+    computed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'product_id': self.product_id,
+            'demand_rate': round(self.demand_rate, 3),
+            'demand_std': round(self.demand_std, 3),
+            'reorder_point': self.reorder_point,
+            'reorder_quantity': self.reorder_quantity,
+            'days_of_cover': round(self.days_of_cover, 1) if self.days_of_cover is not None else None,
+            'computed_at': self.computed_at.isoformat()
+        }
+
+# Reorder alerts only look at products that have a reorder point
+db.Index('ix_product_forecast_user_reorder', ProductForecast.user_id, ProductForecast.reorder_point)
+
+# Site holding stock; lower priority warehouses are picked from first
+class Warehouse(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    code = db.Column(db.String(20), nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+    priority = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.UniqueConstraint('user_id', 'code'),)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'code': self.code,
+            'name': self.name,
+            'priority': self.priority,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+# Bin or shelf within a warehouse. Each user has one default location that
+# takes stock added without naming a location
+class StockLocation(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    warehouse_id = db.Column(db.Integer, db.ForeignKey('warehouse.id'), nullable=False)
+    code = db.Column(db.String(30), nullable=False)
+    pick_sequence = db.Column(db.Integer, nullable=False, default=0)
+    is_default = db.Column(db.Boolean, nullable=False, default=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    warehouse = db.relationship('Warehouse', backref='locations')
+
+    __table_args__ = (db.UniqueConstraint('warehouse_id', 'code'),)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'warehouse_id': self.warehouse_id,
+            'code': self.code,
+            'pick_sequence': self.pick_sequence,
+            'is_default': self.is_default
+        }
+
+# A user's locations by warehouse, and the default location lookup
+db.Index('ix_stock_location_user', StockLocation.user_id, StockLocation.is_default)
+
+# Quantity of one product in one location. Product.quantity is kept equal to
+# the sum over locations, so totals never have to be aggregated from here
+class LocationStock(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    location_id = db.Column(db.Integer, db.ForeignKey('stock_location.id'), nullable=False)
+    warehouse_id = db.Column(db.Integer, db.ForeignKey('warehouse.id'), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Also the index for paging through a location's contents
+    __table_args__ = (db.UniqueConstraint('location_id', 'product_id'),)
+
+# Where one product is stocked, and per-warehouse availability by product;
+# both carry the quantity so the lookups never visit the table
+db.Index('ix_location_stock_product', LocationStock.product_id, LocationStock.location_id, LocationStock.quantity)
+db.Index('ix_location_stock_warehouse', LocationStock.warehouse_id, LocationStock.product_id, LocationStock.quantity)
+
+# Stock an order took from each location, so cancelling it puts the
+# stock back where it came from
+class StockAllocation(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
+    product_id = db.Column(db.Integer, nullable=False)
+    location_id = db.Column(db.Integer, nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+
+db.Index('ix_stock_allocation_order', StockAllocation.order_id)
+
+# Append-only log of product and order changes, written in the same
+# transaction as the change. The id is the feed's sequence number;
+# AUTOINCREMENT keeps SQLite from reusing the ids of compacted rows.
+class ChangeLog(db.Model):
+    __table_args__ = {'sqlite_autoincrement': True}
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    entity = db.Column(db.String(20), nullable=False)  # product or order
+    entity_id = db.Column(db.Integer, nullable=False)
+    action = db.Column(db.String(10), nullable=False)  # insert, update or delete
+    data = db.Column(db.Text)  # JSON of the row after the change, as the API shows it; None for deletes
+    previous = db.Column(db.Text)  # JSON of the old values of the fields that changed
+    actor_id = db.Column(db.Integer)  # user who made the change, None for CLI commands
+    origin = db.Column(db.String(80))  # endpoint, cli:<command> or job:<kind>
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'seq': self.id,
+            'entity': self.entity,
+            'id': self.entity_id,
+            'action': self.action,
+            'data': json.loads(self.data) if self.data else None,
+            'previous': json.loads(self.previous) if self.previous else None,
+            'actor_id': self.actor_id,
+            'origin': self.origin,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+# The feed reads a user's changes in sequence order; the audit history of
+# one row and compaction look changes up by row
+db.Index('ix_change_log_user', ChangeLog.user_id, ChangeLog.id)
+db.Index('ix_change_log_user_entity', ChangeLog.user_id, ChangeLog.entity, ChangeLog.entity_id, ChangeLog.id)
+
+# Highest sequence number whose delete entries compaction has dropped;
+# readers resuming from before it have to reload
+class ChangeCompaction(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    purged_through = db.Column(db.Integer, nullable=False, default=0)
+    compacted_at = db.Column(db.DateTime)
+
+# Scratch table holding one adjust_stock() batch; it is created and dropped
+# inside the batch's transaction and is not part of the schema
+STOCK_ADJUSTMENT = db.Table(
+    'stock_adjustment', db.MetaData(),
+    db.Column('product_id', db.Integer, primary_key=True),
+    db.Column('delta', db.Integer),
+    db.Column('quantity', db.Integer),
+    prefixes=['TEMPORARY']
+)
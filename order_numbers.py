@@ -0,0 +1,133 @@
+"""Sortable, collision-free order numbers.
+
+An order number is ORD- followed by a 64-bit Snowflake-style id written
+as 13 characters of Crockford base32:
+
+    41 bits  milliseconds since EPOCH (good until 2093)
+    10 bits  node: 4 bits of host id, 6 bits of process slot
+    12 bits  sequence within the millisecond
+
+Every process owns a node, so two processes can never produce the same
+id, and within a process the sequence makes ids strictly increasing. No
+database round trip is needed. The ids are fixed width and lead with the
+timestamp, so they sort by creation time as strings, and new orders are
+appended at the right-hand edge of the unique index rather than landing
+on random pages of it.
+
+The host id is configured (ORDER_HOST_ID) and must differ between hosts
+sharing a database. Each process claims the first free slot on its host
+by taking an exclusive lock on a file in the lock directory; the OS
+drops the lock when the process exits, and a forked child claims a slot
+of its own. More than 4096 ids in one millisecond borrow the next
+millisecond rather than wait, and a clock that steps back keeps counting
+from the last id issued.
+"""
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+PREFIX = 'ORD-'
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'  # Crockford base32, in ASCII order
+WIDTH = 13
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+EPOCH_MS = int(EPOCH.timestamp() * 1000)
+
+HOST_BITS = 4
+SLOT_BITS = 6
+SEQUENCE_BITS = 12
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+MAX_HOST_ID = (1 << HOST_BITS) - 1
+SLOTS = 1 << SLOT_BITS
+
+
+def encode(value):
+    """Fixed-width base32 text for a non-negative id; sorts like the number"""
+    chars = []
+    for _ in range(WIDTH):
+        chars.append(ALPHABET[value & 31])
+        value >>= 5
+    return ''.join(reversed(chars))
+
+
+def decode(order_number):
+    """Split an order number into (created datetime, node, sequence)"""
+    value = 0
+    for char in order_number[len(PREFIX):].upper():
+        value = value * 32 + ALPHABET.index(char)
+    sequence = value & MAX_SEQUENCE
+    node = (value >> SEQUENCE_BITS) & ((1 << (HOST_BITS + SLOT_BITS)) - 1)
+    milliseconds = value >> (HOST_BITS + SLOT_BITS + SEQUENCE_BITS)
+    return datetime.fromtimestamp((EPOCH_MS + milliseconds) / 1000, timezone.utc), node, sequence
+
+
+class OrderNumberGenerator:
+    """Issue order numbers for this process; safe to share between threads"""
+
+    def __init__(self, lock_dir, host_id=0, clock=time.time):
+        if not 0 <= host_id <= MAX_HOST_ID:
+            raise ValueError(f'Host id must be between 0 and {MAX_HOST_ID}')
+        self.lock_dir = lock_dir
+        self.host_id = host_id
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._node = None
+        self._slot_file = None
+        self._last_ms = -1
+        self._sequence = 0
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._forget_node)
+
+    def _forget_node(self):
+        # The child shares the parent's lock, so it must claim its own slot
+        self._lock = threading.Lock()
+        self._node = None
+        self._slot_file = None
+        self._last_ms = -1
+        self._sequence = 0
+
+    def _claim_slot(self):
+        if fcntl is None:
+            return os.getpid() % SLOTS
+        os.makedirs(self.lock_dir, exist_ok=True)
+        for slot in range(SLOTS):
+            f = open(os.path.join(self.lock_dir, f'host-{self.host_id}-slot-{slot}.lock'), 'a')
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                f.close()
+                continue
+            self._slot_file = f  # held open for the life of the process
+            return slot
+        raise RuntimeError(f'All {SLOTS} order number slots on host {self.host_id} are taken')
+
+    @property
+    def node(self):
+        with self._lock:
+            if self._node is None:
+                self._node = (self.host_id << SLOT_BITS) | self._claim_slot()
+            return self._node
+
+    def next_id(self):
+        """The next id as an integer, greater than every id issued before"""
+        node = self.node
+        now = int(self.clock() * 1000) - EPOCH_MS
+        with self._lock:
+            if now > self._last_ms:
+                self._last_ms = now
+                self._sequence = 0
+            else:
+                self._sequence += 1
+                if self._sequence > MAX_SEQUENCE:
+                    self._last_ms += 1
+                    self._sequence = 0
+            return ((self._last_ms << (HOST_BITS + SLOT_BITS + SEQUENCE_BITS))
+                    | (node << SEQUENCE_BITS) | self._sequence)
+
+    def __call__(self):
+        return PREFIX + encode(self.next_id())
@@ -0,0 +1,329 @@
+"""Opt-in per-request profiling and Prometheus metrics.
+
+When enabled, every request records its wall time, the number of SQL
+statements and the time spent in them, template render time and JSON
+serialization time. The numbers are written as one structured log line
+per request and aggregated into Prometheus metrics served at /metrics.
+
+A statement shape that repeats more than PROFILING_N_PLUS_ONE_THRESHOLD
+times in one request is reported as a likely N+1 query. If
+PROFILING_PROFILE_DIR is set, requests are sampled with a stack sampler
+and the samples of requests slower than PROFILING_SLOW_MS are written
+there in collapsed-stack format (flamegraph.pl, speedscope).
+
+Metrics are kept per process, so scrape each worker separately. /metrics
+is only served when PROFILING_METRICS_TOKEN is set, and then only to
+requests carrying that token as a bearer token.
+"""
+import hmac
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from flask import Response, abort, before_render_template, has_request_context, request, template_rendered
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import event
+
+logger = logging.getLogger('inventory.profiling')
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_WHITESPACE = re.compile(r'\s+')
+_IN_LIST = re.compile(r'IN \((?:\?, )*\?\)|IN \(__\[POSTCOMPILE_\w+\]\)')
+
+
+def statement_shape(statement):
+    """Normalize a statement so repeats with different IN-list sizes match"""
+    return _IN_LIST.sub('IN (...)', _WHITESPACE.sub(' ', statement).strip())
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsRegistry:
+    """Thread-safe counters and histograms rendered in Prometheus text format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help = {}
+        self._counters = defaultdict(float)
+        self._histograms = {}
+
+    def describe(self, name, kind, help_text):
+        self._help[name] = (kind, help_text)
+
+    def inc(self, name, labels, amount=1):
+        with self._lock:
+            self._counters[(name, labels)] += amount
+
+    def observe(self, name, labels, value, buckets=DURATION_BUCKETS):
+        with self._lock:
+            histogram = self._histograms.get((name, labels))
+            if histogram is None:
+                histogram = self._histograms[(name, labels)] = {'buckets': buckets, 'counts': [0] * len(buckets),
+                                                                'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram['counts'][i] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    @staticmethod
+    def _labels(labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+    def render(self):
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items())
+        described = set()
+
+        def header(name):
+            if name not in described and name in self._help:
+                kind, help_text = self._help[name]
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                described.add(name)
+
+        for (name, labels), value in counters:
+            header(name)
+            lines.append(f'{name}{self._labels(labels)} {value:g}')
+        for (name, labels), histogram in histograms:
+            header(name)
+            for bound, count in zip(histogram['buckets'], histogram['counts']):
+                lines.append(f'{name}_bucket{self._labels(labels, [("le", f"{bound:g}")])} {count}')
+            lines.append(f'{name}_bucket{self._labels(labels, [("le", "+Inf")])} {histogram["count"]}')
+            lines.append(f'{name}_sum{self._labels(labels)} {histogram["sum"]:g}')
+            lines.append(f'{name}_count{self._labels(labels)} {histogram["count"]}')
+        return '\n'.join(lines) + '\n'
+
+
+class StackSampler:
+    """Background thread that samples the stacks of registered threads"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._thread = None
+
+    def start(self, thread_id):
+        with self._lock:
+            self._samples[thread_id] = Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+                self._thread.start()
+
+    def stop(self, thread_id):
+        with self._lock:
+            return self._samples.pop(thread_id, Counter())
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, samples in self._samples.items():
+                    frame = frames.get(thread_id)
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                        frame = frame.f_back
+                    if stack:
+                        samples[';'.join(reversed(stack))] += 1
+
+
+class RequestProfile:
+    """Timings collected for the request being served"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.template_started = None
+        self.json_time = 0.0
+        self.shapes = Counter()
+        self.thread_id = threading.get_ident()
+        self.finishing = False  # finish() is scheduled for when the response closes
+
+
+def _current_profile():
+    # Kept in the WSGI environ rather than g: streamed bodies run in a
+    # fresh app context but share the request
+    if has_request_context():
+        return request.environ.get('profiling.profile')
+    return None
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """JSON provider that adds serialization time to the request profile"""
+
+    def dumps(self, obj, **kwargs):
+        profile = _current_profile()
+        if profile is None:
+            return super().dumps(obj, **kwargs)
+        started = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            profile.json_time += time.perf_counter() - started
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._profiling_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_profiling_started', None)
+    profile = _current_profile()
+    if profile is not None and started is not None:
+        profile.sql_count += 1
+        profile.sql_time += time.perf_counter() - started
+        profile.shapes[statement_shape(statement)] += 1
+
+
+def _before_render(app, template, context, **extra):
+    profile = _current_profile()
+    if profile is not None:
+        profile.template_started = time.perf_counter()
+
+
+def _rendered(app, template, context, **extra):
+    profile = _current_profile()
+    if profile is not None and profile.template_started is not None:
+        profile.template_time += time.perf_counter() - profile.template_started
+        profile.template_started = None
+
+
+def instrument_engine(engine):
+    """Time the statements run on engine; instrumenting it again does nothing"""
+    if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def _describe(metrics):
+    metrics.describe('http_requests_total', 'counter', 'Requests served')
+    metrics.describe('http_request_duration_seconds', 'histogram', 'Request wall time')
+    metrics.describe('db_statements_total', 'counter', 'SQL statements executed')
+    metrics.describe('db_time_seconds_total', 'counter', 'Time spent executing SQL statements')
+    metrics.describe('template_render_seconds_total', 'counter', 'Time spent rendering templates')
+    metrics.describe('json_serialize_seconds_total', 'counter', 'Time spent serializing JSON')
+    metrics.describe('n_plus_one_total', 'counter', 'Requests that repeated one statement shape too often')
+    metrics.describe('slow_requests_total', 'counter', 'Requests slower than PROFILING_SLOW_MS')
+
+
+def init_app(app, engine):
+    """Install the profiling hooks and the /metrics endpoint on app, timing the statements run on engine.
+
+    Call instrument_engine() for any other engine the app uses.
+    """
+    threshold = app.config['PROFILING_N_PLUS_ONE_THRESHOLD']
+    slow_seconds = app.config['PROFILING_SLOW_MS'] / 1000
+    profile_dir = app.config['PROFILING_PROFILE_DIR']
+    sampler = StackSampler(app.config['PROFILING_SAMPLE_INTERVAL_MS'] / 1000) if profile_dir else None
+    metrics = MetricsRegistry()
+    _describe(metrics)
+    app.extensions['profiling'] = metrics
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+
+    app.json = TimedJSONProvider(app)
+    instrument_engine(engine)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_rendered, app)
+
+    def finish(profile, method, path, endpoint, status):
+        duration = time.perf_counter() - profile.started
+        repeated = {shape: count for shape, count in profile.shapes.items() if count > threshold}
+        labels = (('endpoint', endpoint),)
+        metrics.inc('http_requests_total', (('endpoint', endpoint), ('method', method), ('status', status)))
+        metrics.observe('http_request_duration_seconds', labels, duration)
+        metrics.inc('db_statements_total', labels, profile.sql_count)
+        metrics.inc('db_time_seconds_total', labels, profile.sql_time)
+        metrics.inc('template_render_seconds_total', labels, profile.template_time)
+        metrics.inc('json_serialize_seconds_total', labels, profile.json_time)
+        if repeated:
+            metrics.inc('n_plus_one_total', labels)
+        slow = duration >= slow_seconds
+        if slow:
+            metrics.inc('slow_requests_total', labels)
+
+        record = {
+            'method': method,
+            'path': path,
+            'endpoint': endpoint,
+            'status': status,
+            'duration_ms': round(duration * 1000, 2),
+            'sql_count': profile.sql_count,
+            'sql_ms': round(profile.sql_time * 1000, 2),
+            'template_ms': round(profile.template_time * 1000, 2),
+            'json_ms': round(profile.json_time * 1000, 2)
+        }
+        if repeated:
+            record['n_plus_one'] = [{'statement': shape, 'count': count} for shape, count in repeated.items()]
+        if sampler is not None:
+            samples = sampler.stop(profile.thread_id)
+            if slow and samples:
+                record['profile'] = _write_profile(profile_dir, endpoint, samples)
+        logger.log(logging.WARNING if slow or repeated else logging.INFO, json.dumps(record))
+
+    @app.before_request
+    def start_profile():
+        profile = request.environ['profiling.profile'] = RequestProfile()
+        if sampler is not None:
+            sampler.start(profile.thread_id)
+
+    @app.after_request
+    def finish_profile(response):
+        profile = _current_profile()
+        if profile is not None:
+            # Finish when the response is closed, so streamed bodies are included
+            args = (profile, request.method, request.path, request.endpoint or 'unmatched', str(response.status_code))
+            profile.finishing = True
+            response.call_on_close(lambda: finish(*args))
+        return response
+
+    @app.teardown_request
+    def abandon_profile(exc):
+        # after_request is skipped when a view's exception propagates, and
+        # the sampler would keep sampling this thread
+        profile = _current_profile()
+        if profile is not None and not profile.finishing:
+            profile.finishing = True
+            finish(profile, request.method, request.path, request.endpoint or 'unmatched', '500')
+
+    token = app.config.get('PROFILING_METRICS_TOKEN')
+    if token:
+        @app.route('/metrics')
+        def metrics_endpoint():
+            authorization = request.headers.get('Authorization', '')
+            if not hmac.compare_digest(authorization.encode(), f'Bearer {token}'.encode()):
+                abort(401)
+            return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+def _write_profile(directory, endpoint, samples):
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{datetime.utcnow():%Y%m%dT%H%M%S%f}-{endpoint}.folded')
+    with open(path, 'w') as f:
+        for stack, count in samples.most_common():
+            f.write(f'{stack} {count}\n')
+    return path
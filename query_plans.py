@@ -0,0 +1,54 @@
+"""EXPLAIN QUERY PLAN checks for the hot read paths.
+
+The statements checked are the ones the application really issues:
+they are captured while the hot pages are requested, then explained
+one by one. A plan step that scans a whole table, or a whole index
+without seeking into it, is reported as a full scan.
+"""
+import re
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+_SCAN = re.compile(r'^SCAN (\S+)')
+_ALIAS_SUFFIX = re.compile(r'_\d+$')
+
+
+@contextmanager
+def capture_selects(engine):
+    """Collect (statement, parameters) for every SELECT run on engine"""
+    captured = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and not executemany:
+            captured.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield captured
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def explain(connection, statement, parameters):
+    """Return the SQLite query plan details for a raw statement"""
+    cursor = connection.connection.cursor()
+    try:
+        rows = cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+    finally:
+        cursor.close()
+    return [row[3] for row in rows]
+
+
+def full_scans(plan, tables):
+    """Return the names of the tables in tables that a plan scans in full"""
+    scanned = []
+    for detail in plan:
+        match = _SCAN.match(detail)
+        if not match:
+            continue
+        # SQLAlchemy aliases tables as <name>_1, <name>_2, ...
+        name = _ALIAS_SUFFIX.sub('', match.group(1).strip('"'))
+        if name in tables:
+            scanned.append(name)
+    return scanned
@@ -0,0 +1,312 @@
+"""Inventory report exports in CSV, XLSX and PDF.
+
+Each writer takes the report summary and an iterator of product rows and
+writes the document to a binary file as the rows arrive, so memory stays
+flat however large the catalogue is. Rows are dicts with the REPORT_COLUMNS
+keys; the summary is the report_totals() dict.
+
+XLSX and PDF are written with the standard library alone. An XLSX file is
+a zip of SpreadsheetML parts, and the worksheet is streamed into the
+archive with inline strings, so no shared string table has to be held in
+memory. The PDF uses the built-in Helvetica fonts, one compressed content
+stream per page, and a cross-reference table built from the byte offsets
+recorded as each object is written.
+"""
+import csv
+import io
+import re
+import zipfile
+import zlib
+from datetime import datetime
+from xml.sax.saxutils import escape
+
+REPORT_COLUMNS = ['id', 'name', 'category', 'supplier', 'quantity', 'price', 'value', 'status']
+REPORT_HEADINGS = ['ID', 'Product', 'Category', 'Supplier', 'Quantity', 'Unit Price', 'Total Value', 'Stock Status']
+
+FORMATS = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'pdf': 'application/pdf',
+}
+
+TITLE = 'Inventory Report'
+
+
+def summary_lines(summary):
+    """(label, value) pairs for the totals and the per-category breakdown"""
+    lines = [
+        ('Total Products', summary['total_products']),
+        ('Total Quantity', summary['total_quantity']),
+        ('Total Value', f"${summary['total_value']:,.2f}"),
+    ]
+    for category, totals in sorted(summary['categories'].items(), key=lambda item: item[0] or ''):
+        lines.append((category or 'Uncategorized',
+                      f"{totals['count']} products, {totals['quantity']} units, ${totals['value']:,.2f}"))
+    return lines
+
+
+def write_csv(f, summary, rows):
+    text = io.TextIOWrapper(f, encoding='utf-8', newline='', write_through=True)
+    writer = csv.writer(text)
+    writer.writerow(REPORT_HEADINGS)
+    for row in rows:
+        writer.writerow([row[column] for column in REPORT_COLUMNS])
+    text.detach()
+
+
+# Characters XML 1.0 does not allow, which Excel refuses to open
+_XML_ILLEGAL = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/styles.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet2.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Summary" sheetId="1" r:id="rId1"/>'
+        '<sheet name="Products" sheetId="2" r:id="rId2"/></sheets>'
+        '</workbook>'),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        '<Relationship Id="rId2" Target="worksheets/sheet2.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        '<Relationship Id="rId3" Target="styles.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles"/>'
+        '</Relationships>'),
+    # Style 1 is bold for headings, style 2 a two-decimal money format
+    'xl/styles.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+        '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="1"><fill><patternFill patternType="none"/></fill></fills>'
+        '<borders count="1"><border/></borders>'
+        '<cellStyleXfs count="1"><xf/></cellStyleXfs>'
+        '<cellXfs count="3"><xf/><xf fontId="1" applyFont="1"/>'
+        '<xf numFmtId="4" applyNumberFormat="1"/></cellXfs>'
+        '</styleSheet>'),
+}
+
+SHEET_START = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+               '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">')
+PRODUCT_SHEET_COLUMNS = ('<cols><col min="2" max="2" width="40" customWidth="1"/>'
+                         '<col min="3" max="4" width="20" customWidth="1"/>'
+                         '<col min="5" max="8" width="14" customWidth="1"/></cols>')
+MONEY_COLUMNS = {'price', 'value'}
+
+
+def _xlsx_cell(value, style=0):
+    style_attr = f' s="{style}"' if style else ''
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f'<c{style_attr}><v>{value!r}</v></c>'
+    text = escape(_XML_ILLEGAL.sub('', '' if value is None else str(value)))
+    return f'<c t="inlineStr"{style_attr}><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_row(cells):
+    return '<row>' + ''.join(cells) + '</row>'
+
+
+def write_xlsx(f, summary, rows, batch_size=500):
+    with zipfile.ZipFile(f, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, content in XLSX_PARTS.items():
+            archive.writestr(name, content)
+
+        sheet = [SHEET_START, '<cols><col min="1" max="1" width="24" customWidth="1"/>'
+                              '<col min="2" max="2" width="48" customWidth="1"/></cols><sheetData>',
+                 _xlsx_row([_xlsx_cell(TITLE, 1)]),
+                 _xlsx_row([_xlsx_cell('Generated'), _xlsx_cell(datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC'))])]
+        sheet += [_xlsx_row([_xlsx_cell(label, 1), _xlsx_cell(value)]) for label, value in summary_lines(summary)]
+        sheet.append('</sheetData></worksheet>')
+        archive.writestr('xl/worksheets/sheet1.xml', ''.join(sheet))
+
+        # force_zip64 since the size of a streamed entry is not known up front
+        with archive.open('xl/worksheets/sheet2.xml', 'w', force_zip64=True) as part:
+            part.write((SHEET_START + PRODUCT_SHEET_COLUMNS + '<sheetData>').encode())
+            part.write(_xlsx_row([_xlsx_cell(heading, 1) for heading in REPORT_HEADINGS]).encode())
+            chunk = []
+            for row in rows:
+                chunk.append(_xlsx_row([_xlsx_cell(row[column], 2 if column in MONEY_COLUMNS else 0)
+                                        for column in REPORT_COLUMNS]))
+                if len(chunk) == batch_size:
+                    part.write(''.join(chunk).encode())
+                    chunk = []
+            part.write((''.join(chunk) + '</sheetData></worksheet>').encode())
+
+
+PAGE_WIDTH, PAGE_HEIGHT = 842, 595  # A4 landscape, in points
+MARGIN = 36
+FONT_SIZE = 8
+LINE_HEIGHT = 12
+# (heading, x offset, width in points, right aligned) for each report column
+PDF_COLUMNS = [
+    ('ID', 0, 40, True),
+    ('Product', 50, 200, False),
+    ('Category', 260, 100, False),
+    ('Supplier', 370, 120, False),
+    ('Quantity', 500, 50, True),
+    ('Unit Price', 560, 60, True),
+    ('Total Value', 630, 70, True),
+    ('Stock Status', 710, 60, False),
+]
+
+
+def _pdf_text(value, width=None):
+    """A PDF string literal, cut to roughly fit width points of Helvetica"""
+    text = '' if value is None else str(value)
+    if width is not None:
+        # Helvetica glyphs average a little over half the font size
+        limit = int(width / (FONT_SIZE * 0.55))
+        if len(text) > limit:
+            text = text[:max(limit - 1, 1)] + '…'
+    data = text.encode('cp1252', errors='replace')
+    return b'(' + data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)') + b')'
+
+
+def _pdf_show(x, y, text, font='F1', size=FONT_SIZE, right=False):
+    """Content stream operators drawing text at x, y (right edge if right)"""
+    if right:
+        # Digits and the symbols used in numbers are all 0.556 em wide
+        x -= len(text) * size * 0.556
+    return f'BT /{font} {size} Tf {x:.1f} {y:.1f} Td '.encode() + _pdf_text(text) + b' Tj ET\n'
+
+
+class _PdfWriter:
+    """Write numbered objects and remember their offsets for the xref table"""
+
+    def __init__(self, f):
+        self.f = f
+        self.position = 0
+        self.offsets = {}
+        self.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def write(self, data):
+        self.f.write(data)
+        self.position += len(data)
+
+    def object(self, number, body):
+        self.offsets[number] = self.position
+        self.write(f'{number} 0 obj\n'.encode() + body + b'\nendobj\n')
+
+    def stream(self, number, content):
+        data = zlib.compress(content)
+        self.object(number, f'<< /Length {len(data)} /Filter /FlateDecode >>\nstream\n'.encode()
+                    + data + b'\nendstream')
+
+    def finish(self, root):
+        count = max(self.offsets) + 1
+        xref = self.position
+        self.write(f'xref\n0 {count}\n0000000000 65535 f \n'.encode())
+        for number in range(1, count):
+            self.write(f'{self.offsets[number]:010d} 00000 n \n'.encode())
+        self.write(f'trailer\n<< /Size {count} /Root {root} 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode())
+
+
+def _pdf_table_header(y):
+    out = [f'0.93 g {MARGIN - 4} {y - 4} {PAGE_WIDTH - 2 * MARGIN + 8} {LINE_HEIGHT + 2} re f 0 g\n'.encode()]
+    for heading, x, width, right in PDF_COLUMNS:
+        out.append(_pdf_show(MARGIN + x + (width if right else 0), y, heading, font='F2', right=right))
+    return out
+
+
+def _pdf_cell(row, column):
+    value = row[column]
+    if column in MONEY_COLUMNS:
+        return f'${value:,.2f}'
+    return value
+
+
+def write_pdf(f, summary, rows):
+    pdf = _PdfWriter(f)
+    # Objects 1-4 are the catalog, page tree and fonts; pages follow in pairs
+    # of content stream and page, and the page tree is written last once the
+    # page count is known
+    pdf.object(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+    pdf.object(3, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>')
+    pdf.object(4, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>')
+    pages = []
+
+    def emit(content):
+        number = 5 + 2 * len(pages)
+        pdf.stream(number, b''.join(content))
+        pdf.object(number + 1, (f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] '
+                                f'/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> '
+                                f'/Contents {number} 0 R >>').encode())
+        pages.append(number + 1)
+
+    def footer(content):
+        content.append(_pdf_show(PAGE_WIDTH - MARGIN, MARGIN / 2, f'Page {len(pages) + 1}', right=True))
+
+    top = PAGE_HEIGHT - MARGIN
+    content = [_pdf_show(MARGIN, top - 16, TITLE, font='F2', size=18),
+               _pdf_show(MARGIN, top - 32, 'Generated ' + datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC'), size=9)]
+    y = top - 56
+    for label, value in summary_lines(summary):
+        if y < MARGIN + LINE_HEIGHT:
+            footer(content)
+            emit(content)
+            content, y = [], top - LINE_HEIGHT
+        content.append(_pdf_show(MARGIN, y, label, font='F2', size=9))
+        content.append(_pdf_show(MARGIN + 120, y, value, size=9))
+        y -= LINE_HEIGHT
+    if y < MARGIN + LINE_HEIGHT * 5:
+        footer(content)
+        emit(content)
+        content, y = [], top
+    y -= LINE_HEIGHT
+    content.append(_pdf_show(MARGIN, y, 'Product Details', font='F2', size=12))
+    y -= LINE_HEIGHT * 2
+    content += _pdf_table_header(y)
+    y -= LINE_HEIGHT + 2
+
+    for row in rows:
+        if y < MARGIN + LINE_HEIGHT:
+            footer(content)
+            emit(content)
+            y = top - LINE_HEIGHT
+            content = _pdf_table_header(y)
+            y -= LINE_HEIGHT + 2
+        for (heading, x, width, right), column in zip(PDF_COLUMNS, REPORT_COLUMNS):
+            value = _pdf_cell(row, column)
+            if right:
+                content.append(_pdf_show(MARGIN + x + width, y, str(value), right=True))
+            else:
+                content.append(f'BT /F1 {FONT_SIZE} Tf {MARGIN + x:.1f} {y:.1f} Td '.encode()
+                               + _pdf_text(value, width) + b' Tj ET\n')
+        y -= LINE_HEIGHT
+    footer(content)
+    emit(content)
+
+    kids = ' '.join(f'{number} 0 R' for number in pages)
+    pdf.object(2, f'<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>'.encode())
+    pdf.finish(root=1)
+
+
+WRITERS = {'csv': write_csv, 'xlsx': write_xlsx, 'pdf': write_pdf}
+
+
+def write_report(fmt, f, summary, rows):
+    """Write the report in fmt (csv, xlsx or pdf) to the binary file f"""
+    WRITERS[fmt](f, summary, rows)
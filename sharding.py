@@ -0,0 +1,242 @@
+"""Optional per-tenant storage: each user's rows in a database of their own.
+
+Every query in the app is scoped by user, and no row is shared between
+users, so with TENANT_SHARDING on each user's rows live in their own
+shard: a SQLite file per user, or a schema per user on PostgreSQL. A big
+tenant's bulk writes then only hold their own file's write lock, and
+writes for different tenants run in parallel.
+
+The shared database keeps the tables that are not per tenant: user,
+which logins read before any tenant is known, and job, which the workers
+poll across all users. TenantSession sends every other statement to the
+current tenant's shard. The current tenant is the one set with
+TenantShards.scope() (jobs and CLI commands), otherwise g.tenant_id,
+which the app sets to the logged-in user at the start of a request.
+Without a tenant, statements go to the shared database as usual.
+
+TenantShards opens one small engine per tenant on first use, bringing
+its schema up to date through the provision callback. It keeps at most
+max_engines of them and disposes of the least recently used one, and of
+any left idle for idle_seconds, so inactive tenants hold no connections
+or file handles.
+
+copy_tenant() moves one user's rows from the shared database into their
+shard, for migrating an existing installation.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import sqlalchemy as sa
+from flask import current_app, g, has_app_context
+from flask_sqlalchemy.session import Session
+
+# Tables kept in the shared database; everything else is per tenant
+SHARED_TABLES = frozenset({'user', 'job'})
+
+COPY_BATCH_SIZE = 5000
+
+_tenant = ContextVar('tenant', default=None)
+
+
+def current_tenant():
+    """The tenant whose shard the session uses, or None for the shared database"""
+    tenant_id = _tenant.get()
+    if tenant_id is None and has_app_context():
+        tenant_id = g.get('tenant_id')
+    return tenant_id
+
+
+def _is_shared(mapper):
+    if mapper is None:
+        return False
+    return sa.inspect(mapper).local_table.name in SHARED_TABLES
+
+
+class TenantSession(Session):
+    """A session that sends per-tenant tables to the current tenant's shard"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not _is_shared(mapper):
+            shards = current_app.extensions.get('tenant_shards')
+            if shards is not None:
+                tenant_id = current_tenant()
+                if tenant_id is not None:
+                    return shards.engine(tenant_id)
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class TenantShards:
+    """Engines for tenant shards, opened on demand and closed when idle"""
+
+    def __init__(self, url, engine_options=None, provision=None, session=None, max_engines=32,
+                 idle_seconds=300):
+        # url has a {tenant_id} placeholder for a database per tenant; a
+        # PostgreSQL url without one gets a tenant_<id> schema per tenant
+        self.url = url
+        self.engine_options = engine_options or {}
+        self.provision = provision
+        self.session = session
+        self.max_engines = max_engines
+        self.idle_seconds = idle_seconds
+        self.schema_per_tenant = '{tenant_id}' not in url
+        if self.schema_per_tenant and not url.startswith('postgresql'):
+            raise ValueError('TENANT_SHARD_URL needs a {tenant_id} placeholder unless it is PostgreSQL')
+        self._engines = OrderedDict()  # tenant id -> (engine, last used)
+        self._opening = {}  # tenant id -> lock held while its engine is provisioned
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.evicted = 0
+
+    def schema(self, tenant_id):
+        return f'tenant_{int(tenant_id)}'
+
+    def _create_engine(self, tenant_id):
+        if self.schema_per_tenant:
+            schema = self.schema(tenant_id)
+            engine = sa.create_engine(self.url, **dict(
+                self.engine_options, connect_args={'options': f'-csearch_path={schema}'}))
+            with engine.begin() as connection:
+                connection.exec_driver_sql(f'CREATE SCHEMA IF NOT EXISTS "{schema}"')
+            return engine
+        url = sa.engine.make_url(self.url.format(tenant_id=int(tenant_id)))
+        if url.get_backend_name() == 'sqlite' and url.database:
+            os.makedirs(os.path.dirname(os.path.abspath(url.database)), exist_ok=True)
+        return sa.create_engine(url, **self.engine_options)
+
+    def _lookup(self, tenant_id):
+        entry = self._engines.get(tenant_id)
+        if entry is None:
+            return None
+        self._engines[tenant_id] = (entry[0], time.monotonic())
+        self._engines.move_to_end(tenant_id)
+        return entry[0]
+
+    def engine(self, tenant_id):
+        """The tenant's engine, opening and provisioning it on first use"""
+        with self._lock:
+            engine = self._lookup(tenant_id)
+            if engine is not None:
+                self._evict(time.monotonic())
+                return engine
+            opening = self._opening.setdefault(tenant_id, threading.Lock())
+        # Provisioning can take a while; only requests for this tenant wait on it
+        with opening:
+            with self._lock:
+                engine = self._lookup(tenant_id)
+                if engine is not None:
+                    return engine
+            engine = self._create_engine(tenant_id)
+            if self.provision is not None:
+                self.provision(engine, tenant_id)
+            with self._lock:
+                self._engines[tenant_id] = (engine, time.monotonic())
+                self._opening.pop(tenant_id, None)
+                self.opened += 1
+                self._evict(time.monotonic())
+            return engine
+
+    def _evict(self, now):
+        while self._engines:
+            tenant_id, (engine, last_used) = next(iter(self._engines.items()))
+            if len(self._engines) <= self.max_engines and now - last_used < self.idle_seconds:
+                break
+            del self._engines[tenant_id]
+            # Connections still checked out finish their work and are then closed
+            engine.dispose()
+            self.evicted += 1
+
+    def evict_idle(self):
+        """Dispose of the engines idle for idle_seconds or more"""
+        with self._lock:
+            self._evict(time.monotonic())
+
+    def open_tenants(self):
+        with self._lock:
+            return list(self._engines)
+
+    def dispose(self):
+        with self._lock:
+            for engine, _ in self._engines.values():
+                engine.dispose()
+            self._engines.clear()
+
+    @contextmanager
+    def scope(self, tenant_id):
+        """Send the session to tenant_id's shard inside the block.
+
+        The session is closed on the way in and out, so objects loaded
+        from one tenant's shard are never mistaken for another's; commit
+        before entering or leaving.
+        """
+        if self.session is not None:
+            self.session.close()
+        token = _tenant.set(tenant_id)
+        try:
+            yield
+        finally:
+            if self.session is not None:
+                self.session.close()
+            _tenant.reset(token)
+
+
+def _tenant_filter(table, tenant_id):
+    """A WHERE clause selecting one tenant's rows of table, or None if it is not per tenant"""
+    if 'user_id' in table.c:
+        return table.c.user_id == tenant_id
+    for foreign_key in table.foreign_keys:
+        parent = foreign_key.column.table
+        if 'user_id' in parent.c:
+            owned = sa.select(foreign_key.column).where(parent.c.user_id == tenant_id)
+            return foreign_key.parent.in_(owned)
+    return None
+
+
+def copy_tenant(source, shard, metadata, tenant_id, replace=(), batch_size=COPY_BATCH_SIZE):
+    """Copy one tenant's rows from the shared database into their shard.
+
+    Tables are copied parents first with their ids unchanged, so links
+    and URLs keep working. The shard must be provisioned, with its copy of
+    the user row, and hold none of the tenant's rows yet, except in the
+    tables named in replace, whose rows are deleted first. Returns the
+    number of rows copied per table.
+    """
+    copied = {}
+    with source.connect() as reader, shard.begin() as writer:
+        for table in metadata.sorted_tables:
+            if table.name in SHARED_TABLES:
+                continue
+            condition = _tenant_filter(table, tenant_id)
+            if condition is None:
+                continue
+            if table.name in replace:
+                writer.execute(table.delete().where(condition))
+            rows = reader.execute(sa.select(table).where(condition).execution_options(yield_per=batch_size))
+            count = 0
+            for batch in rows.mappings().partitions():
+                writer.execute(table.insert(), [dict(row) for row in batch])
+                count += len(batch)
+            copied[table.name] = count
+        if writer.dialect.name == 'postgresql':
+            # Rows were inserted with their ids, so move each sequence past them
+            for table in metadata.sorted_tables:
+                if copied.get(table.name) and 'id' in table.c and table.c.id.autoincrement:
+                    writer.exec_driver_sql(
+                        f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+                        f"(SELECT MAX(id) FROM \"{table.name}\"))")
+    return copied
+
+
+def tenant_row_counts(engine, metadata, tenant_id):
+    """Rows per per-tenant table for one tenant, to compare a shard with its source"""
+    counts = {}
+    with engine.connect() as connection:
+        for table in metadata.sorted_tables:
+            condition = _tenant_filter(table, tenant_id)
+            if condition is not None and table.name not in SHARED_TABLES:
+                counts[table.name] = connection.execute(
+                    sa.select(sa.func.count()).select_from(table).where(condition)).scalar()
+    return counts
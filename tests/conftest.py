@@ -0,0 +1,77 @@
+"""Fixtures for the test suite: a migrated SQLite database per test and a logged-in client.
+
+Run from the repository root with `python -m pytest -q`.
+"""
+import os
+import sys
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PASSWORD = 'secret'
+# Cheap enough that creating users and logging in stays fast
+PASSWORD_HASH_METHOD = 'pbkdf2:sha256:1000'
+
+
+@pytest.fixture
+def inventory():
+    """The app module, with its models and helpers"""
+    import app
+    return app
+
+
+@pytest.fixture
+def app(inventory, tmp_path, monkeypatch):
+    """An app on a fresh, migrated SQLite database in a temporary directory"""
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'inventory.db'}")
+    monkeypatch.setenv('JOB_WORKERS', '0')
+    monkeypatch.setenv('JOB_FILES_DIR', str(tmp_path / 'jobs'))
+    monkeypatch.setenv('ORDER_NODE_DIR', str(tmp_path / 'order-nodes'))
+    monkeypatch.setenv('CACHE_BACKEND', 'memory')
+    monkeypatch.setenv('PASSWORD_HASH_METHOD', PASSWORD_HASH_METHOD)
+    flask_app = inventory.create_app({'TESTING': True})
+    with flask_app.app_context():
+        inventory.migrations.upgrade(inventory.db.engine, inventory.db.metadata)
+    yield flask_app
+    with flask_app.app_context():
+        inventory.db.session.remove()
+        inventory.db.engine.dispose()
+
+
+@pytest.fixture
+def user(inventory, app):
+    """The id of a user named tester with the password PASSWORD"""
+    with app.app_context():
+        user = inventory.User(username='tester', email='tester@example.com',
+                              password_hash=generate_password_hash(PASSWORD, PASSWORD_HASH_METHOD))
+        inventory.db.session.add(user)
+        inventory.db.session.commit()
+        return user.id
+
+
+@pytest.fixture
+def client(app, user):
+    """A test client logged in as tester"""
+    client = app.test_client()
+    response = client.post('/login', data={'username': 'tester', 'password': PASSWORD})
+    assert response.status_code == 302
+    return client
+
+
+def add_products(inventory, user_id, count, quantity=100, price=10.0, category='Tools'):
+    """Insert count products for a user in one statement; return their ids in order.
+
+    The user's summaries are rebuilt afterwards, as `flask init-db` would.
+    """
+    inventory.db.session.execute(inventory.db.insert(inventory.Product), [
+        {'name': f'Product {n}', 'category': category, 'quantity': quantity, 'price': price,
+         'supplier': 'Supplier', 'user_id': user_id}
+        for n in range(count)
+    ])
+    inventory.rebuild_summaries(user_id)
+    inventory.db.session.commit()
+    return [product_id for (product_id,) in inventory.db.session.query(inventory.Product.id)
+            .filter_by(user_id=user_id).order_by(inventory.Product.id)]
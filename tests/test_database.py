@@ -0,0 +1,58 @@
+import sqlalchemy as sa
+
+import database
+
+
+def pragma(engine, name):
+    with engine.connect() as connection:
+        return connection.exec_driver_sql(f'PRAGMA {name}').scalar()
+
+
+def test_pragmas_apply_to_the_apps_engine_only(inventory, app, tmp_path):
+    with app.app_context():
+        assert pragma(inventory.db.engine, 'journal_mode') == 'wal'
+        assert pragma(inventory.db.engine, 'synchronous') == 1  # NORMAL
+    other = sa.create_engine(f"sqlite:///{tmp_path / 'other.db'}")
+    assert pragma(other, 'journal_mode') == 'delete'
+    assert pragma(other, 'synchronous') == 2  # FULL, SQLite's default
+
+
+def test_each_app_keeps_its_own_pragmas(inventory, app, tmp_path, monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'second.db'}")
+    monkeypatch.setenv('SQLITE_BUSY_TIMEOUT_MS', '1234')
+    second = inventory.create_app({'TESTING': True})
+    with second.app_context():
+        assert pragma(inventory.db.engine, 'busy_timeout') == 1234
+        second_engine = inventory.db.engine
+    with app.app_context():
+        assert pragma(inventory.db.engine, 'busy_timeout') == 5000
+    second_engine.dispose()
+
+
+def test_engine_options_follow_a_database_url_passed_in_config(inventory, app):
+    # The environment points at a file database, whose pool options an
+    # in-memory database's single shared connection does not take
+    memory = inventory.create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite://'})
+    assert memory.config['SQLALCHEMY_ENGINE_OPTIONS'] == {}
+    with memory.app_context():
+        assert inventory.db.session.execute(sa.text('SELECT 1')).scalar() == 1
+        memory_engine = inventory.db.engine
+    memory_engine.dispose()
+    with app.app_context():
+        assert 'pool_size' in app.config['SQLALCHEMY_ENGINE_OPTIONS']
+
+def test_installing_twice_adds_one_listener(tmp_path):
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'once.db'}")
+    database.install_sqlite_pragmas(engine, ['PRAGMA cache_size=-1000'])
+    database.install_sqlite_pragmas(engine, ['PRAGMA cache_size=-2000'])
+    assert pragma(engine, 'cache_size') == -1000
+
+
+def test_tenant_shards_get_the_pragmas(inventory, app, user, tmp_path):
+    sharded = inventory.create_app({'TESTING': True, 'TENANT_SHARDING': True,
+                                    'TENANT_SHARD_URL': f"sqlite:///{tmp_path / 'shards' / 't{tenant_id}.db'}"})
+    with sharded.app_context():
+        shards = sharded.extensions['tenant_shards']
+        assert pragma(shards.engine(user), 'journal_mode') == 'wal'
+        shards.dispose()
+        inventory.db.engine.dispose()
@@ -0,0 +1,75 @@
+import io
+import json
+
+from conftest import add_products
+
+
+def import_file(client, content, filename, mode=None):
+    url = '/api/products/import' + (f'?mode={mode}' if mode else '')
+    response = client.post(url, data={'file': (io.BytesIO(content.encode()), filename)})
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return response.get_json()
+
+
+def product_names(inventory, app, user):
+    with app.app_context():
+        return sorted(name for (name,) in inventory.db.session.query(inventory.Product.name).filter_by(user_id=user))
+
+
+def test_non_finite_numbers_are_rejected_per_row(inventory, app, user, client):
+    report = import_file(client, 'name,quantity,price,category\n'
+                                 'Good,5,2.50,Tools\n'
+                                 'Bad,5,nan,Tools\n'
+                                 'Worse,5,inf,Tools\n'
+                                 'Infinite stock,inf,1.00,Tools\n'
+                                 'Also good,1,1.00,Tools\n', 'products.csv')
+    assert report['inserted'] == 2
+    assert [error['line'] for error in report['errors']] == [3, 4, 5]
+    assert product_names(inventory, app, user) == ['Also good', 'Good']
+    with app.app_context():
+        summary = inventory.db.session.get(inventory.InventorySummary, user)
+        assert summary.total_quantity == 6
+        assert summary.total_value == 13.5
+
+
+def test_ndjson_nan_and_infinity_are_rejected(inventory, app, user, client):
+    lines = [{'name': 'Good', 'quantity': 1, 'price': 1.0}, {'name': 'NaN', 'quantity': 1, 'price': float('nan')},
+             {'name': 'Infinity', 'quantity': float('inf'), 'price': 1.0}]
+    report = import_file(client, '\n'.join(json.dumps(line) for line in lines), 'products.ndjson')
+    assert report['inserted'] == 1
+    assert [error['line'] for error in report['errors']] == [2, 3]
+
+
+def test_fractional_quantities_are_rejected_per_row(inventory, app, user, client):
+    lines = [{'name': 'Whole', 'quantity': 3, 'price': 1.0}, {'name': 'Fraction', 'quantity': 3.7, 'price': 1.0},
+             {'name': 'Whole float', 'quantity': 4.0, 'price': 1.0}, {'name': 'Text', 'quantity': '2.5', 'price': 1.0}]
+    report = import_file(client, '\n'.join(json.dumps(line) for line in lines), 'products.ndjson')
+    assert report['inserted'] == 2
+    assert [(error['line'], error['error']) for error in report['errors']] == [
+        (2, 'quantity must be a whole number'), (4, 'quantity must be a whole number')]
+    with app.app_context():
+        assert inventory.db.session.get(inventory.InventorySummary, user).total_quantity == 7
+
+def test_rows_the_database_rejects_are_reported_and_the_rest_of_the_chunk_is_kept(inventory, app, user, client):
+    # Valid to the row checks, but too large for an SQLite integer
+    lines = [{'name': f'Row {n}', 'quantity': 10 ** 30 if n == 2 else n, 'price': 1.0} for n in range(5)]
+    report = import_file(client, '\n'.join(json.dumps(line) for line in lines), 'products.ndjson')
+    assert report['inserted'] == 4
+    assert report['error_count'] == 1
+    assert report['errors'][0]['line'] == 3
+    assert report['errors'][0]['error'].startswith('could not be saved')
+    assert product_names(inventory, app, user) == ['Row 0', 'Row 1', 'Row 3', 'Row 4']
+
+
+def test_missing_upsert_ids_are_reported_once_when_a_chunk_is_retried(inventory, app, user, client):
+    with app.app_context():
+        product_id, = add_products(inventory, user, 1)
+    report = import_file(client, 'id,name,quantity,price\n'
+                                 f'{product_id},Renamed,3,1.00\n'
+                                 '999999,Missing,3,1.00\n'
+                                 ',Huge,100000000000000000000000000000,1.00\n', 'products.csv', mode='upsert')
+    assert report['updated'] == 1
+    assert report['error_count'] == 2
+    assert [error['line'] for error in report['errors']] == [3, 4]
+    assert report['errors'][0]['error'] == 'Product #999999 was not found'
+    assert report['errors'][1]['error'].startswith('could not be saved')
@@ -0,0 +1,52 @@
+import io
+from datetime import datetime, timedelta
+
+
+def abandon(inventory, app, kind):
+    """Claim the queued job as a worker that then stops responding"""
+    with app.app_context():
+        job = inventory.job_queue.claim()
+        assert job.kind == kind
+        inventory.job_queue.update_job(job.id, {'lease_until': datetime.utcnow() - timedelta(seconds=1)})
+        return job.id
+
+
+def job_row(inventory, app, job_id):
+    with app.app_context():
+        return inventory.db.session.get(inventory.Job, job_id)
+
+
+def test_an_abandoned_import_fails_instead_of_running_again(inventory, app, user, client):
+    response = client.post('/api/jobs/import', data={'file': (io.BytesIO(b'name,quantity,price\nWidget,5,1.00\n'),
+                                                                'products.csv')})
+    assert response.status_code == 202
+    job_id = abandon(inventory, app, 'import_products')
+
+    assert inventory.job_queue.run_one() is False
+    job = job_row(inventory, app, job_id)
+    assert job.status == 'failed'
+    assert job.attempts == 1
+    assert 'not safe to run again' in job.error
+    with app.app_context():
+        assert inventory.Product.query.filter_by(user_id=user).count() == 0
+
+
+def test_an_abandoned_retryable_job_is_taken_over(inventory, app, user, client):
+    assert client.post('/api/jobs/forecast').status_code == 202
+    job_id = abandon(inventory, app, 'forecast')
+
+    assert inventory.job_queue.run_one() is True
+    job = job_row(inventory, app, job_id)
+    assert job.status == 'completed'
+    assert job.attempts == 2
+
+
+def test_a_later_app_does_not_inherit_the_shard_scope(inventory, app, tmp_path):
+    sharded = inventory.create_app({'TESTING': True, 'TENANT_SHARDING': True,
+                                    'TENANT_SHARD_URL': f"sqlite:///{tmp_path / 'shards' / 't{tenant_id}.db'}"})
+    assert inventory.job_queue.user_scope == sharded.extensions['tenant_shards'].scope
+    plain = inventory.create_app({'TESTING': True})
+    assert inventory.job_queue.user_scope is None
+    for built in (sharded, plain):
+        with built.app_context():
+            inventory.db.engine.dispose()
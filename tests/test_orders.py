@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import add_products
+
+
+@pytest.fixture
+def count_statements(inventory, app):
+    """A list that gets one entry per SQL statement run on the app's engine"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = inventory.db.engine
+    inventory.db.event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    yield statements
+    inventory.db.event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def place_orders(inventory, user_id, product_ids, orders, items, created_at):
+    for n in range(orders):
+        order = inventory.Order(order_number=f'TEST{created_at:%y%m%d}{n:06d}', customer_name=f'Customer {n}',
+                                user_id=user_id, created_at=created_at - timedelta(minutes=n))
+        inventory.db.session.add(order)
+        inventory.db.session.flush()
+        inventory.db.session.execute(inventory.db.insert(inventory.OrderItem), [
+            {'order_id': order.id, 'product_id': product_ids[(n + i) % len(product_ids)], 'quantity': 1 + i,
+             'unit_price': 10.0}
+            for i in range(items)
+        ])
+    inventory.db.session.commit()
+
+
+def statements_for(client, statements, url):
+    statements.clear()
+    response = client.get(url)
+    assert response.status_code == 200
+    return response.get_json(), len(statements)
+
+
+def test_order_listing_statements_do_not_grow_with_orders_or_items(inventory, app, user, client,
+                                                                  count_statements):
+    with app.app_context():
+        product_ids = add_products(inventory, user, 50)
+        place_orders(inventory, user, product_ids, orders=2, items=1, created_at=datetime(2024, 1, 10))
+    client.get('/api/orders')  # warm the user cache
+
+    small, small_count = statements_for(client, count_statements, '/api/orders?limit=200')
+    assert len(small['orders']) == 2
+
+    with app.app_context():
+        place_orders(inventory, user, product_ids, orders=198, items=5, created_at=datetime(2024, 2, 10))
+    large, large_count = statements_for(client, count_statements, '/api/orders?limit=200')
+    assert len(large['orders']) == 200
+    assert sum(len(order['items']) for order in large['orders']) == 2 + 198 * 5
+    assert all(item['product_name'].startswith('Product ') for order in large['orders'] for item in order['items'])
+    assert large_count == small_count
+    assert large_count <= 4
+
+
+def test_order_listing_filters_by_date_in_the_same_statements(inventory, app, user, client, count_statements):
+    with app.app_context():
+        product_ids = add_products(inventory, user, 10)
+        place_orders(inventory, user, product_ids, orders=30, items=3, created_at=datetime(2024, 1, 10))
+        place_orders(inventory, user, product_ids, orders=30, items=3, created_at=datetime(2024, 3, 10))
+    client.get('/api/orders')
+
+    january, count = statements_for(client, count_statements,
+                                    '/api/orders?start_date=2024-01-01&end_date=2024-01-31&limit=10')
+    assert len(january['orders']) == 10
+    assert all(order['created_at'].startswith('2024-01') for order in january['orders'])
+    assert january['next_cursor']
+    rest, next_count = statements_for(
+        client, count_statements,
+        f"/api/orders?start_date=2024-01-01&end_date=2024-01-31&limit=10&cursor={january['next_cursor']}")
+    assert {order['id'] for order in rest['orders']}.isdisjoint(order['id'] for order in january['orders'])
+    assert next_count == count
+
+
+def test_order_lines_with_a_quantity_below_one_are_reported(inventory):
+    lines, errors = inventory.parse_order_lines(['1', '2', '3', ''], ['2', '0', '-4', ''])
+
+    assert lines == {1: 2}
+    assert errors == ['Product #2: quantity must be positive (0 requested).',
+                      'Product #3: quantity must be positive (-4 requested).']
+
+
+def test_order_with_a_negative_quantity_is_rejected(inventory, app, user, client):
+    with app.app_context():
+        product_id, other_id = add_products(inventory, user, 2, quantity=10)
+
+    response = client.post('/add_order', data={'customer_name': 'Negative', 'product_id[]': [product_id, other_id],
+                                               'quantity[]': ['3', '-2']})
+
+    assert response.status_code == 200
+    assert b'quantity must be positive' in response.data
+    with app.app_context():
+        assert inventory.Order.query.count() == 0
+        assert inventory.db.session.get(inventory.Product, product_id).quantity == 10
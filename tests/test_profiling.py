@@ -0,0 +1,76 @@
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.engine import Engine
+
+import profiling
+
+
+@pytest.fixture
+def profiled(inventory, app, user, tmp_path):
+    """A second app on the same database with profiling, stack sampling and a metrics token"""
+    profiled = inventory.create_app({'TESTING': True, 'PROFILING_ENABLED': True,
+                                     'PROFILING_PROFILE_DIR': str(tmp_path / 'profiles'),
+                                     'PROFILING_METRICS_TOKEN': 'scrape-token'})
+
+    @profiled.route('/boom')
+    def boom():
+        inventory.db.session.execute(sa.text('SELECT 1'))
+        raise RuntimeError('boom')
+
+    yield profiled
+    with profiled.app_context():
+        inventory.db.engine.dispose()
+
+
+def get(client, url, **kwargs):
+    # Requests are recorded when their response is closed
+    response = client.get(url, **kwargs)
+    response.close()
+    return response
+
+
+def metric(app, line_start):
+    for line in app.extensions['profiling'].render().splitlines():
+        if line.startswith(line_start):
+            return float(line.rsplit(' ', 1)[1])
+    return None
+
+
+def test_metrics_are_off_without_a_token(app, client):
+    assert client.get('/metrics').status_code == 404
+
+
+def test_metrics_need_the_token(profiled):
+    client = profiled.test_client()
+    assert get(client, '/metrics').status_code == 401
+    assert get(client, '/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    response = get(client, '/metrics', headers={'Authorization': 'Bearer scrape-token'})
+    assert response.status_code == 200
+    assert b'http_requests_total' in response.data
+
+
+def test_a_view_that_raises_is_still_recorded(profiled):
+    client = profiled.test_client()
+    with pytest.raises(RuntimeError):
+        client.get('/boom')
+    assert metric(profiled, 'http_requests_total{endpoint="boom",method="GET",status="500"}') == 1
+    assert metric(profiled, 'db_statements_total{endpoint="boom"}') == 1
+
+
+def test_statements_are_counted_once_on_the_apps_own_engine(inventory, app, profiled, tmp_path):
+    # A second profiled app must not add listeners to the first one's engine
+    another = inventory.create_app({'TESTING': True, 'PROFILING_ENABLED': True})
+    client = profiled.test_client()
+    client.post('/login', data={'username': 'tester', 'password': 'secret'})
+    statements = []
+    with profiled.app_context():
+        engine = inventory.db.engine
+    sa.event.listen(engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    assert get(client, '/api/products').status_code == 200
+    assert metric(profiled, 'db_statements_total{endpoint="products.api_products"}') == len(statements)
+
+    assert not sa.event.contains(Engine, 'before_cursor_execute', profiling._before_cursor_execute)
+    other = sa.create_engine(f"sqlite:///{tmp_path / 'other.db'}")
+    assert not sa.event.contains(other, 'before_cursor_execute', profiling._before_cursor_execute)
+    with another.app_context():
+        inventory.db.engine.dispose()
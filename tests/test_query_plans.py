@@ -0,0 +1,50 @@
+"""The hot pages' queries must stay index searches; a full scan fails the suite."""
+import random
+
+from conftest import add_products
+
+CATEGORIES = ['Electronics', 'Office', 'Kitchen', 'Garden', 'Toys']
+
+
+def seed(inventory, app, user, client):
+    rng = random.Random(0)
+    with app.app_context():
+        other = inventory.User(username='other', email='other@example.com')
+        inventory.db.session.add(other)
+        inventory.db.session.commit()
+        for category in CATEGORIES:
+            add_products(inventory, other.id, 100, category=category)
+            add_products(inventory, user, 100, category=category)
+        inventory.db.session.execute(inventory.db.update(inventory.Product).where(
+            inventory.Product.id % 7 == 0).values(quantity=3))
+        inventory.db.session.commit()
+        product_ids = [product_id for (product_id,) in inventory.db.session.query(inventory.Product.id)
+                       .filter_by(user_id=user)]
+    runner = app.test_cli_runner()
+    assert runner.invoke(args=['sync-location-stock']).exception is None
+    for _ in range(20):
+        lines = rng.sample(product_ids, 3)
+        response = client.post('/add_order', data={'customer_name': 'Plan', 'product_id[]': lines,
+                                                   'quantity[]': ['1'] * len(lines)})
+        assert response.status_code == 302
+    # Rebuilds the summaries and refreshes the planner's statistics
+    result = runner.invoke(args=['init-db'])
+    assert result.exception is None, result.output
+
+
+def test_hot_pages_run_no_full_scans(inventory, app, user, client):
+    seed(inventory, app, user, client)
+    with app.app_context():
+        pages, plans = inventory.hot_page_query_plans(user)
+
+    assert len(pages) == len(inventory.HOT_PAGES)
+    assert len(plans) > len(pages)
+    scans = {' '.join(statement.split()): scanned for statement, _, scanned in plans if scanned}
+    assert scans == {}
+
+
+def test_check_query_plans_command(app, user, client, inventory):
+    seed(inventory, app, user, client)
+    result = app.test_cli_runner().invoke(args=['check-query-plans', '--user', 'tester'])
+    assert result.exit_code == 0, result.output
+    assert result.output.rstrip().endswith('0 with full scans')
@@ -0,0 +1,52 @@
+from datetime import datetime
+
+import pytest
+
+import blueprints.analytics
+
+
+@pytest.fixture
+def today(monkeypatch):
+    """Set the date the app takes as today: call it with a datetime"""
+    class Clock(datetime):
+        current = datetime.utcnow()
+
+        @classmethod
+        def utcnow(cls):
+            return cls.current
+
+    monkeypatch.setattr(blueprints.analytics, 'datetime', Clock)
+
+    def set_today(value):
+        Clock.current = value
+    return set_today
+
+
+@pytest.mark.parametrize('url', ['/api/analytics/series', '/api/analytics/categories', '/api/analytics/products'])
+def test_default_analytics_window_follows_the_date(client, today, url):
+    today(datetime(2024, 5, 1, 23, 59))
+    before = client.get(url)
+    assert before.status_code == 200
+    assert before.get_json()['end_date'] == '2024-05-01'
+    assert client.get(url, headers={'If-None-Match': before.headers['ETag']}).status_code == 304
+
+    today(datetime(2024, 5, 2, 0, 1))
+    after = client.get(url, headers={'If-None-Match': before.headers['ETag']})
+    assert after.status_code == 200
+    assert after.get_json()['end_date'] == '2024-05-02'
+    assert after.get_json()['start_date'] == '2024-04-03'
+    assert after.headers['ETag'] != before.headers['ETag']
+
+
+def test_explicit_window_is_cached_across_days(client, today):
+    url = '/api/analytics/series?start_date=2024-04-01&end_date=2024-04-30'
+    today(datetime(2024, 5, 1, 12, 0))
+    first = client.get(url)
+    today(datetime(2024, 5, 2, 12, 0))
+    assert client.get(url, headers={'If-None-Match': first.headers['ETag']}).status_code == 304
+
+
+def test_invalid_window_is_reported_not_cached(client):
+    response = client.get('/api/analytics/series?start_date=2024-05-02&end_date=2024-05-01')
+    assert response.status_code == 400
+    assert 'start_date' in response.get_json()['error']
@@ -0,0 +1,45 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from conftest import ROOT
+
+# Import, create_app() and the first request, in a fresh interpreter; see
+# benchmarks/startup.py for the breakdown up to the first dashboard
+STARTUP_BUDGET_MS = 1500
+LAZY_MODULES = ('forecasting', 'profiling', 'query_plans', 'reports')
+
+CHILD = '''
+import json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {root!r})
+import app
+imported = sorted(name for name in {lazy!r} + ('blueprints',) if name in sys.modules)
+flask_app = app.create_app()
+assert flask_app.test_client().get('/login').status_code == 200
+print(json.dumps({{'ms': (time.perf_counter() - started) * 1000, 'after_import': imported,
+                  'after_request': sorted(name for name in {lazy!r} if name in sys.modules)}}))
+'''
+
+
+def start(tmp_path):
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{tmp_path / 'startup.db'}", JOB_WORKERS='0',
+               ORDER_NODE_DIR=str(tmp_path / 'order-nodes'), JOB_FILES_DIR=str(tmp_path / 'jobs'))
+    env.pop('PROFILING_ENABLED', None)
+    output = subprocess.run([sys.executable, '-c', CHILD.format(root=ROOT, lazy=LAZY_MODULES)], env=env, check=True,
+                            capture_output=True, text=True, cwd=tmp_path).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def test_startup_stays_within_budget(tmp_path):
+    runs = [start(tmp_path) for _ in range(3)]
+    median = statistics.median(run['ms'] for run in runs)
+    assert median <= STARTUP_BUDGET_MS, f'start-up took {median:.0f} ms, over the {STARTUP_BUDGET_MS} ms budget'
+
+
+def test_import_builds_nothing_and_loads_no_heavy_modules(tmp_path):
+    run = start(tmp_path)
+    assert run['after_import'] == []
+    assert run['after_request'] == []
@@ -0,0 +1,61 @@
+from datetime import timedelta, timezone
+
+import pytest
+
+from conftest import add_products
+
+
+def adjust(client, *adjustments):
+    response = client.post('/api/products/adjust-stock', json={'adjustments': list(adjustments)})
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return response.get_json()['results']
+
+
+def product_updated_at(inventory, app, product_id):
+    with app.app_context():
+        return inventory.db.session.get(inventory.Product, product_id).updated_at
+
+
+@pytest.mark.parametrize('offset', [timedelta(0), timedelta(hours=2), timedelta(hours=-5)])
+def test_expected_updated_at_with_an_offset_is_compared_in_utc(inventory, app, user, client, offset):
+    with app.app_context():
+        [product_id] = add_products(inventory, user, 1)
+    stored = product_updated_at(inventory, app, product_id)
+    local = stored.replace(tzinfo=timezone.utc).astimezone(timezone(offset)).isoformat()
+    if not offset:
+        local = local.replace('+00:00', 'Z')
+
+    [result] = adjust(client, {'product_id': product_id, 'delta': -1, 'expected_updated_at': local})
+    assert result['status'] == 'applied', result
+
+    [result] = adjust(client, {'product_id': product_id, 'delta': -1, 'expected_updated_at': local})
+    assert result['status'] == 'conflict'
+
+
+def test_location_stock_follows_the_adjusted_totals(inventory, app, user, client):
+    with app.app_context():
+        product_ids = add_products(inventory, user, 30, quantity=20)
+        main = inventory.default_location(user)
+        spare = inventory.StockLocation(user_id=user, warehouse_id=main.warehouse_id, code='SPARE', pick_sequence=1)
+        inventory.db.session.add(spare)
+        inventory.db.session.flush()
+        for product_id in product_ids:
+            inventory.db.session.add_all([
+                inventory.LocationStock(location_id=main.id, warehouse_id=main.warehouse_id,
+                                        product_id=product_id, quantity=12),
+                inventory.LocationStock(location_id=spare.id, warehouse_id=spare.warehouse_id,
+                                        product_id=product_id, quantity=8)])
+        inventory.db.session.commit()
+        main_id, spare_id = main.id, spare.id
+
+    # Removing 15 empties the first location in pick order and takes 3 from the next
+    adjust(client, *[{'product_id': product_id, 'delta': -15} for product_id in product_ids[:10]],
+           *[{'product_id': product_id, 'quantity': 50} for product_id in product_ids[10:20]])
+    with app.app_context():
+        stock = {(row.product_id, row.location_id): row.quantity for row in inventory.LocationStock.query}
+    for product_id in product_ids[:10]:
+        assert (stock[product_id, main_id], stock[product_id, spare_id]) == (0, 5)
+    for product_id in product_ids[10:20]:
+        assert (stock[product_id, main_id], stock[product_id, spare_id]) == (42, 8)
+    for product_id in product_ids[20:]:
+        assert (stock[product_id, main_id], stock[product_id, spare_id]) == (12, 8)
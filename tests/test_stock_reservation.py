@@ -0,0 +1,100 @@
+"""Concurrency stress tests for stock reservation: many threads ordering the same SKUs."""
+import random
+import threading
+import time
+
+from sqlalchemy.exc import OperationalError
+
+from conftest import PASSWORD, add_products
+
+THREADS = 8
+ORDERS_PER_THREAD = 25
+STOCK = 100
+
+
+def run_threads(target, count):
+    threads = [threading.Thread(target=target, args=(n,)) for n in range(count)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started
+
+
+def quantities(inventory, product_ids):
+    return dict(inventory.db.session.query(inventory.Product.id, inventory.Product.quantity)
+                .filter(inventory.Product.id.in_(product_ids)))
+
+
+def test_concurrent_reservations_never_oversell(inventory, app, user):
+    with app.app_context():
+        product_ids = add_products(inventory, user, 3, quantity=STOCK)
+    taken = {product_id: 0 for product_id in product_ids}
+    outcomes = {'reserved': 0, 'rejected': 0, 'locked': 0}
+    lock = threading.Lock()
+
+    def reserve(n):
+        rng = random.Random(n)
+        for _ in range(ORDERS_PER_THREAD):
+            lines = {product_id: rng.randint(1, 5) for product_id in rng.sample(product_ids, 2)}
+            with app.app_context():
+                try:
+                    reserved, errors = inventory.reserve_stock(user, lines)
+                    if errors:
+                        inventory.db.session.rollback()
+                        outcome = 'rejected'
+                    else:
+                        reserved = [(product.id, quantity) for product, quantity in reserved]
+                        inventory.db.session.commit()
+                        outcome = 'reserved'
+                except OperationalError:
+                    # The write lock wait timed out; nothing was taken
+                    inventory.db.session.rollback()
+                    outcome = 'locked'
+            with lock:
+                outcomes[outcome] += 1
+                if outcome == 'reserved':
+                    for product_id, quantity in reserved:
+                        taken[product_id] += quantity
+
+    elapsed = run_threads(reserve, THREADS)
+    with app.app_context():
+        final = quantities(inventory, product_ids)
+        summary = inventory.db.session.get(inventory.InventorySummary, user)
+
+    attempts = THREADS * ORDERS_PER_THREAD
+    assert sum(outcomes.values()) == attempts
+    # Demand is about four times the stock, so some orders must be turned away
+    assert outcomes['reserved'] > 0 and outcomes['rejected'] > 0
+    assert min(final.values()) >= 0
+    assert all(final[product_id] == STOCK - taken[product_id] for product_id in product_ids)
+    assert summary.total_quantity == sum(final.values())
+    print(f'{attempts} reservations in {elapsed:.2f}s ({attempts / elapsed:.0f}/s): {outcomes}')
+
+
+def test_concurrent_orders_take_exactly_the_ordered_stock(inventory, app, user):
+    with app.app_context():
+        product_ids = add_products(inventory, user, 3, quantity=STOCK)
+    statuses = []
+
+    def place_orders(n):
+        rng = random.Random(n)
+        client = app.test_client()
+        client.post('/login', data={'username': 'tester', 'password': PASSWORD})
+        for _ in range(ORDERS_PER_THREAD // 5):
+            lines = rng.sample(product_ids, 2)
+            response = client.post('/add_order', data={'customer_name': 'Stress', 'product_id[]': lines,
+                                                       'quantity[]': [str(rng.randint(5, 15)) for _ in lines]})
+            statuses.append(response.status_code)
+
+    run_threads(place_orders, THREADS)
+    with app.app_context():
+        final = quantities(inventory, product_ids)
+        ordered = dict(inventory.db.session.query(inventory.OrderItem.product_id,
+                                                  inventory.db.func.sum(inventory.OrderItem.quantity))
+                       .group_by(inventory.OrderItem.product_id))
+
+    assert 302 in statuses
+    assert min(final.values()) >= 0
+    assert all(STOCK - final[product_id] == ordered.get(product_id, 0) for product_id in product_ids)
@@ -0,0 +1,38 @@
+import threading
+
+
+def load_in_other_request(inventory, app, user_id):
+    # A concurrent request has its own session, so it sees the committed row
+    loaded = {}
+
+    def run():
+        with app.app_context():
+            loaded['email'] = inventory.load_user(str(user_id)).email
+            inventory.db.session.remove()
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+    return loaded['email']
+
+
+def test_a_request_during_the_update_does_not_cache_the_old_row(inventory, app, user):
+    with app.app_context():
+        account = inventory.db.session.get(inventory.User, user)
+        old_email = account.email
+        account.email = 'new@example.com'
+        inventory.db.session.flush()
+        assert load_in_other_request(inventory, app, user) == old_email
+        inventory.db.session.commit()
+        assert inventory.response_cache.get(inventory._user_cache_key(user)) is None
+    assert load_in_other_request(inventory, app, user) == 'new@example.com'
+
+
+def test_a_rolled_back_update_keeps_the_cached_row(inventory, app, user):
+    cached = load_in_other_request(inventory, app, user)
+    with app.app_context():
+        account = inventory.db.session.get(inventory.User, user)
+        account.email = 'new@example.com'
+        inventory.db.session.flush()
+        inventory.db.session.rollback()
+        assert inventory.response_cache.get(inventory._user_cache_key(user))['email'] == cached